@@ -0,0 +1,269 @@
+"""
+Analyze a whole evidence archive from the command line.
+
+Walks directories (or reads manifest files listing one path per line),
+analyzes every WAV file on a process pool and appends one record per file
+to a JSONL or CSV output as soon as it finishes. Re-running with the same
+output resumes where an interrupted run stopped, and retries the files that
+failed; the last record of a path is the current one.
+
+Usage:
+    python analyze_batch.py EVIDENCE_DIR [...] --output results.jsonl
+    python analyze_batch.py --manifest files.txt --output results.csv --workers 8
+"""
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from app.cache import CHUNK_SIZE, json_default
+
+AUDIO_EXTENSIONS = ('.wav',)
+
+CSV_FIELDS = ['path', 'sha256', 'status', 'duration', 'sample_rate', 'forgery_detected',
+              'confidence', 'details', 'seconds', 'error']
+
+
+def find_audio_files(inputs, manifests=()):
+    """
+    Collect the files to analyze, in a stable order.
+
+    Args:
+        inputs: Files or directories; directories are walked recursively
+        manifests: Text files listing one path per line
+
+    Returns:
+        List of absolute paths, without duplicates
+    """
+    paths = []
+    for manifest in manifests:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(os.path.join(base, line))
+
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            paths.append(entry)
+
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+def truncate_partial_line(output_path):
+    """
+    Cut the incomplete last line an interrupted run left in an output file,
+    so appended records start on a line of their own.
+
+    Returns:
+        Number of bytes removed
+    """
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - CHUNK_SIZE)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end == size:
+            return 0
+        f.truncate(end)
+        return size - end
+
+
+def completed_paths(output_path):
+    """Paths whose last record in an existing output file is a finished analysis"""
+    if not os.path.exists(output_path):
+        return set()
+    status = {}
+    with open(output_path, newline='') as f:
+        if output_path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                status[row['path']] = row['status']
+        else:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    status[record['path']] = record['status']
+                except (ValueError, KeyError):
+                    continue
+    # Failed files are analyzed again
+    return {path for path, value in status.items() if value == 'done'}
+
+
+def _warm_worker():
+    """Import the analysis stack once per worker process, not once per file"""
+    import app.audio_analysis  # noqa: F401
+
+
+def _sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def analyze_one(path, multichannel=False, detectors=None):
+    """Analyze one file inside a worker process and return its record"""
+    from app.audio_analysis import analyze_audio_file
+
+    start = time.perf_counter()
+    record = {"path": path}
+    try:
+        record["sha256"] = _sha256(path)
+        # One thread per process; the pool already uses every core
+        result, _ = analyze_audio_file(path, include_plots=False, workers=1,
+                                       multichannel=multichannel, detectors=detectors)
+    except Exception as e:
+        result = {"error": f"Error analyzing audio file: {str(e)}"}
+
+    if "error" in result:
+        record.update(status="failed", error=result["error"])
+    else:
+        record.update(status="done", result=result)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+class RecordWriter:
+    """Append records to a JSONL or CSV file, flushing after each one"""
+
+    def __init__(self, output_path):
+        self.csv = output_path.endswith('.csv')
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.file = open(output_path, 'a', newline='')
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, record):
+        if self.csv:
+            result = record.get("result", {})
+            self.writer.writerow({
+                "path": record["path"],
+                "sha256": record.get("sha256"),
+                "status": record["status"],
+                "duration": result.get("duration"),
+                "sample_rate": result.get("sample_rate"),
+                "forgery_detected": result.get("forgery_detected"),
+                "confidence": result.get("confidence"),
+                "details": " | ".join(result.get("details", [])),
+                "seconds": round(record["seconds"], 3),
+                "error": record.get("error"),
+            })
+        else:
+            self.file.write(json.dumps(record, default=json_default) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_batch(paths, output_path, workers=None, multichannel=False, detectors=None,
+              progress_every=10):
+    """
+    Analyze `paths` on a process pool, writing each record as it completes.
+
+    At most a few files per worker are in flight at once, so huge archives
+    don't queue thousands of futures up front.
+
+    Returns:
+        Tuple of (files analyzed, files failed, elapsed seconds)
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = RecordWriter(output_path)
+    remaining = iter(paths)
+    analyzed = failed = 0
+    start = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker) as executor:
+            running = set()
+            while True:
+                while len(running) < 2 * workers:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    running.add(executor.submit(analyze_one, path, multichannel, detectors))
+                if not running:
+                    break
+
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    writer.write(record)
+                    analyzed += 1
+                    failed += record["status"] == "failed"
+                    if analyzed % progress_every == 0:
+                        elapsed = time.perf_counter() - start
+                        print(f"{analyzed}/{len(paths)} files, {analyzed / elapsed:.2f} files/s",
+                              file=sys.stderr)
+    finally:
+        writer.close()
+
+    return analyzed, failed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='*', help='WAV files or directories to analyze')
+    parser.add_argument('--manifest', action='append', default=[],
+                        help='Text file listing one path per line (may be repeated)')
+    parser.add_argument('--output', required=True,
+                        help='Results file; .csv for a summary table, anything else for JSONL')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of analysis processes (default: CPU count)')
+    parser.add_argument('--multichannel', action='store_true',
+                        help='Also check that the channels of multi-channel files agree')
+    parser.add_argument('--profile', default=None,
+                        help='Analysis profile, e.g. "fast" to run only the low-cost detectors')
+    parser.add_argument('--detectors', default=None,
+                        help='Comma-separated detectors to run (overrides --profile)')
+    args = parser.parse_args()
+
+    if not args.inputs and not args.manifest:
+        parser.error('no input files, directories or manifests given')
+
+    from app.detectors import request_selection
+    try:
+        detectors = request_selection({'profile': args.profile, 'detectors': args.detectors})
+    except ValueError as e:
+        parser.error(str(e))
+
+    paths = find_audio_files(args.inputs, args.manifest)
+    if truncate_partial_line(args.output):
+        print("Removed the incomplete last record of an interrupted run", file=sys.stderr)
+    done = completed_paths(args.output)
+    todo = [path for path in paths if path not in done]
+    if done:
+        print(f"Resuming: {len(paths) - len(todo)} of {len(paths)} files already analyzed, "
+              f"failed files are retried", file=sys.stderr)
+
+    analyzed, failed, elapsed = run_batch(todo, args.output, args.workers, args.multichannel,
+                                          detectors)
+    rate = analyzed / elapsed if elapsed else 0
+    print(f"Analyzed {analyzed} files ({failed} failed) in {elapsed:.1f}s, {rate:.2f} files/s",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
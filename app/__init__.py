@@ -4,10 +4,37 @@ from flask import Flask
 def create_app(test_config=None):
     # Create and configure the app
     app = Flask(__name__, instance_relative_config=True)
+    # Stream uploads straight into the upload folder
+    from .uploads import UploadRequest
+    app.request_class = UploadRequest
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
         UPLOAD_FOLDER=os.path.join(app.instance_path, 'uploads'),
-        MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16MB max upload
+        # 16MB max upload by default; raise it (together with ASYNC_ANALYSIS)
+        # for long recordings, which are analyzed in streaming mode
+        MAX_CONTENT_LENGTH=int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024,
+        # Total size of stored uploads; the oldest are deleted beyond it
+        UPLOAD_QUOTA_MB=int(os.environ.get('UPLOAD_QUOTA_MB', 4096)),
+        # Background analysis queue
+        ASYNC_ANALYSIS=os.environ.get('ASYNC_ANALYSIS', '0') == '1',
+        JOB_DATABASE=os.path.join(app.instance_path, 'jobs.sqlite'),
+        JOB_WORKERS=int(os.environ.get('JOB_WORKERS', 2)),
+        MAX_QUEUED_JOBS=int(os.environ.get('MAX_QUEUED_JOBS', 16)),
+        # Every completed analysis, for the history page and permalinks
+        HISTORY_DATABASE=os.path.join(app.instance_path, 'history.sqlite'),
+        # Content-addressed result cache
+        CACHE_FOLDER=os.path.join(app.instance_path, 'cache'),
+        CACHE_MAX_MB=int(os.environ.get('CACHE_MAX_MB', 512)),
+        # Lazily rendered plot images and tiles; the least recently viewed
+        # recordings' images are deleted beyond PLOT_MAX_MB
+        PLOT_FOLDER=os.path.join(app.instance_path, 'plots'),
+        PLOT_MAX_MB=int(os.environ.get('PLOT_MAX_MB', 2048)),
+        # Per-process metric values, summed on /metrics
+        METRICS_FOLDER=os.path.join(app.instance_path, 'metrics'),
+        # Grid frequency logs recordings are timestamped against (see
+        # import_enf_reference.py)
+        ENF_REFERENCE_FOLDER=os.environ.get('ENF_REFERENCE_DIR',
+                                            os.path.join(app.instance_path, 'enf_reference')),
     )
 
     if test_config is None:
@@ -21,11 +48,39 @@ def create_app(test_config=None):
     try:
         os.makedirs(app.instance_path, exist_ok=True)
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        os.makedirs(app.config['PLOT_FOLDER'], exist_ok=True)
     except OSError:
         pass
 
+    # Share metrics between the gunicorn workers and job processes
+    from . import metrics
+    metrics.configure(app.config['METRICS_FOLDER'])
+
+    # Reference logs for the ENF timestamping detector
+    from . import enf_reference
+    enf_reference.configure(app.config['ENF_REFERENCE_FOLDER'])
+
+    # Set up the analysis history, the result cache and the background
+    # analysis queue
+    from .cache import ResultCache
+    from .jobs import JobQueue
+    from .history import AnalysisHistory
+    app.extensions['history'] = AnalysisHistory(app.config['HISTORY_DATABASE'])
+    app.extensions['result_cache'] = ResultCache(
+        app.config['CACHE_FOLDER'],
+        max_bytes=app.config['CACHE_MAX_MB'] * 1024 * 1024,
+    )
+    app.extensions['job_queue'] = JobQueue(
+        app.config['JOB_DATABASE'],
+        max_workers=app.config['JOB_WORKERS'],
+        max_queued=app.config['MAX_QUEUED_JOBS'],
+        cache=app.extensions['result_cache'],
+        history=app.extensions['history'],
+    )
+
     # Register blueprints
-    from . import views
+    from . import views, api
     app.register_blueprint(views.bp)
+    app.register_blueprint(api.bp)
 
     return app
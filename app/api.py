@@ -0,0 +1,108 @@
+from flask import Blueprint, request, current_app, jsonify, url_for
+from werkzeug.utils import secure_filename
+from .cache import analyze_cached
+from .uploads import save_upload
+from .wavio import InvalidAudioError
+from .views import allowed_file, plot_urls
+from .detectors import request_selection
+from .history import request_page
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+RAW_CONTENT_TYPES = ('audio/', 'application/octet-stream')
+
+def _collect_uploads():
+    """
+    Save every uploaded file to the upload folder.
+
+    Accepts any number of multipart files (under any field name) or a
+    single WAV file sent as the raw request body, named by the `filename`
+    query parameter.
+
+    Returns:
+        List of (original filename, content digest, saved path, error),
+        where digest and path are None for rejected files
+    """
+    uploads = []
+
+    if request.files:
+        for key in request.files:
+            for file in request.files.getlist(key):
+                original_filename = secure_filename(file.filename or '')
+                if not allowed_file(original_filename):
+                    uploads.append((file.filename, None, None, 'File type not allowed. Please upload a WAV file.'))
+                    continue
+                try:
+                    digest, filepath = save_upload(file.stream)
+                except InvalidAudioError as e:
+                    uploads.append((original_filename, None, None, f'Invalid WAV file: {e}.'))
+                    continue
+                uploads.append((original_filename, digest, filepath, None))
+    elif request.mimetype.startswith(RAW_CONTENT_TYPES):
+        original_filename = secure_filename(request.args.get('filename', 'upload.wav'))
+        if not allowed_file(original_filename):
+            original_filename += '.wav'
+        try:
+            digest, filepath = save_upload(request.stream)
+        except InvalidAudioError as e:
+            # Rejected from the first bytes; the rest of the body is not read
+            uploads.append((original_filename, None, None, f'Invalid WAV file: {e}.'))
+        else:
+            uploads.append((original_filename, digest, filepath, None))
+
+    return uploads
+
+@bp.route('/analyze', methods=('POST',))
+def analyze():
+    try:
+        detectors = request_selection(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    uploads = _collect_uploads()
+    if not uploads:
+        return jsonify({"error": "No WAV file provided"}), 400
+
+    include_plots = request.args.get('plots') == '1'
+    cache = current_app.extensions['result_cache']
+
+    results = []
+    for filename, digest, filepath, error in uploads:
+        entry = {"filename": filename}
+        if error is None:
+            entry["sha256"] = digest
+            result, _ = analyze_cached(cache, filepath, digest, include_plots=False,
+                                       detectors=detectors)
+            error = result.get("error")
+            if error is None:
+                token = current_app.extensions['history'].record(digest, filename, result, detectors)
+                entry["permalink"] = url_for('views.history_entry', token=token, _external=True)
+                entry["result"] = result
+                if include_plots:
+                    # Rendered on first request for each image
+                    entry["plots"] = plot_urls(filepath, _external=True)
+        if error is not None:
+            entry["error"] = error
+        results.append(entry)
+
+    return jsonify({"results": results})
+
+@bp.route('/history')
+def history():
+    try:
+        page = request_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    page = current_app.extensions['history'].page(**page)
+    for analysis in page["analyses"]:
+        analysis["url"] = url_for('api.history_entry', token=analysis["token"], _external=True)
+    return jsonify(page)
+
+@bp.route('/history/<token>')
+def history_entry(token):
+    analysis = current_app.extensions['history'].get(token)
+    if analysis is None:
+        return jsonify({"error": "Analysis not found"}), 404
+    analysis["permalink"] = url_for('views.history_entry', token=token, _external=True)
+    return jsonify(analysis)
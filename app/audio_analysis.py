@@ -1,112 +1,279 @@
 import os
+import time
 import numpy as np
 import librosa
-import matplotlib.pyplot as plt
-from scipy import signal
-import io
 import base64
-import uuid
-from flask import current_app
+import json
+import hashlib
+from . import rendering
+from .pipeline import TaskGraph
+from .localization import spectral_cue, noise_level_cue, enf_cue, localize_splices, MIN_CUE_SAMPLES
+from .energy import multiscale_rms
+from .filters import highpass
+from .enf import extract_enf_trace, FINE_WINDOW_SECONDS, FINE_BAND
+from . import enf_reference
+from . import copy_move
+from .multirate import CASCADE_RATES, decimate
+from .wavio import load_audio
+from . import metrics
+from . import detectors as detector_registry
+from .features import FeatureStore, N_FFT, HOP_LENGTH, N_MFCC
 
-def analyze_audio_file(file_path):
+# Bump when the analysis changes in a way the parameters below don't capture
+ANALYZER_VERSION = 3
+
+# Analysis parameters
+HIGHPASS_CUTOFF = 5000  # Hz, lower edge of the background noise band
+HIGHPASS_ORDER = 5
+ENF_WINDOW_SECONDS = 2
+ENF_BAND = (45, 65)  # Hz, covers both 50 and 60 Hz grids
+NOISE_SEGMENT_SECONDS = 1
+# Finer noise level trace for localizing splices in recordings too short
+# for the NOISE_SEGMENT_SECONDS trace to have a baseline (see
+# localization.noise_level_cue)
+SHORT_NOISE_SEGMENT_SECONDS = 0.25
+CHANNEL_NOISE_TOLERANCE_DB = 6  # noise level mismatch between channels
+CHANNEL_ENF_TOLERANCE_HZ = 0.1  # ENF disagreement between channels
+CHANNEL_ENF_SALIENCE = 8  # peak/mean band magnitude of a clear hum
+
+# Run the narrow-band detectors on decimated copies of the signal (see
+# multirate.py); the background noise and the plots always use the native
+# rate. MULTIRATE_ANALYSIS=0 reproduces the former native-rate results.
+MULTIRATE_ANALYSIS = os.environ.get('MULTIRATE_ANALYSIS', '1') == '1'
+MFCC_SAMPLE_RATE = 16000  # Hz, spectral discontinuity analysis
+ENF_SAMPLE_RATE = 1000  # Hz, ENF analysis
+
+# Analyze every channel of multi-channel files (and check that they agree)
+# instead of only their mono downmix
+MULTICHANNEL_ANALYSIS = os.environ.get('MULTICHANNEL_ANALYSIS', '0') == '1'
+
+# Threads used to run the detectors and plot renders of one analysis
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Files larger than this are analyzed block by block (see streaming.py)
+STREAMING_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+def analyzer_fingerprint():
+    """Short hash of the analyzer version and parameters, used to key cached results"""
+    params = {
+        "version": ANALYZER_VERSION,
+        "highpass": [HIGHPASS_CUTOFF, HIGHPASS_ORDER],
+        "enf": [ENF_WINDOW_SECONDS, list(ENF_BAND)],
+        "noise_segment": NOISE_SEGMENT_SECONDS,
+        "multichannel": [MULTICHANNEL_ANALYSIS, CHANNEL_NOISE_TOLERANCE_DB,
+                         CHANNEL_ENF_TOLERANCE_HZ, CHANNEL_ENF_SALIENCE],
+        "stft": [N_FFT, HOP_LENGTH, N_MFCC],
+        "multirate": [MULTIRATE_ANALYSIS, MFCC_SAMPLE_RATE, ENF_SAMPLE_RATE, list(CASCADE_RATES)],
+        # Matches change whenever the reference logs do
+        "enf_reference": [FINE_WINDOW_SECONDS, FINE_BAND, enf_reference.MATCH_THRESHOLD,
+                          enf_reference.MATCH_MARGIN, enf_reference.SEGMENT_THRESHOLD,
+                          enf_reference.DATABASE.fingerprint()],
+        "copy_move": [copy_move.CONTEXT_FRAMES, copy_move.CONTEXT_STEP, copy_move.MIN_COEFFICIENT_STD,
+                      copy_move.HASH_TABLES, copy_move.HASH_BITS, copy_move.HASH_SEED,
+                      copy_move.MAX_BUCKET, copy_move.BLOCK_SECONDS, copy_move.MIN_VOTES_PER_SECOND,
+                      copy_move.MAX_CANDIDATES, copy_move.MIN_SEGMENT_SECONDS, copy_move.MATCH_RATIO,
+                      copy_move.BASELINE_SECONDS, copy_move.STEADY_DISTANCE,
+                      copy_move.MAX_GAP_SECONDS, copy_move.MAX_COPIES],
+        "detectors": sorted(detector_registry.DETECTORS),
+    }
+    encoded = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+def analyze_audio_file(file_path, include_plots=True, streaming=None, workers=None,
+                       multichannel=None, detectors=None):
     """
     Perform audio forgery detection on the provided WAV file
     using background noise analysis.
     
     Args:
         file_path: Path to the WAV file
+        include_plots: Render the plots; when False `plots` is empty and
+            only the verdict is computed
+        streaming: Read and analyze the file in blocks with bounded memory;
+            by default only files above STREAMING_THRESHOLD_BYTES are
+            streamed
+        workers: Number of threads running the analysis stages
+            (defaults to ANALYSIS_WORKERS)
+        multichannel: Also check that the channels of a multi-channel file
+            agree (defaults to MULTICHANNEL_ANALYSIS); the other detectors
+            always run on the mono downmix. Streaming analysis is mono only.
+        detectors: Analysis profile name or detector names to run
+            (defaults to detectors.DEFAULT_PROFILE); features that none of
+            them needs are not computed
         
     Returns:
         result: Dictionary containing analysis results
         plots: Dictionary containing base64-encoded plots
     """
+    if streaming is None:
+        try:
+            streaming = os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES
+        except OSError:
+            streaming = False
+    selected = detector_registry.select_detectors(detectors)
+    if streaming:
+        from .streaming import analyze_audio_stream
+        return analyze_audio_stream(file_path, include_plots=include_plots,
+                                    detectors=[detector.name for detector in selected])
+    
     # Load the audio file
+    load_start = time.perf_counter()
+    if multichannel is None:
+        multichannel = MULTICHANNEL_ANALYSIS
+    # Only decode the separate channels if a selected detector uses them
+    multichannel = multichannel and any("channels" in detector.requires for detector in selected)
     try:
-        y, sr = librosa.load(file_path, sr=None, mono=True)
+        # Decode every channel once and downmix here rather than decoding
+        # again for the channel checks
+        y, sr = load_audio(file_path, mono=not multichannel)
     except Exception as e:
-        return {"error": f"Error loading audio file: {str(e)}"}, {}
+        result = {"error": f"Error loading audio file: {str(e)}"}
+        metrics.record_analysis(result, 'in_memory')
+        return result, {}
+    channels = None
+    if y.ndim > 1:
+        channels, y = y, librosa.to_mono(y)
+    load_time = time.perf_counter() - load_start
     
     # Results dictionary
-    result = {
-        "duration": librosa.get_duration(y=y, sr=sr),
-        "sample_rate": sr,
-        "forgery_detected": False,
-        "confidence": 0,
-        "details": []
-    }
+    result = new_result(librosa.get_duration(y=y, sr=sr), sr)
     
-    # Generate plots dictionary
-    plots = {}
+    # Shared feature store so the STFT/MFCC are computed once per request
+    features = FeatureStore(y, sr)
     
-    # === Waveform and Spectrogram Analysis ===
-    plots["waveform"] = create_waveform_plot(y, sr)
-    plots["spectrogram"] = create_spectrogram_plot(y, sr)
+    # The detectors are independent once the audio is loaded, so they (and
+    # the plot renders) run concurrently as a task graph
+    graph = TaskGraph()
+    inputs = {"y": y, "features": features, "channels": channels}
+    selected = [detector for detector in selected
+                if all(name == "noise" or inputs[name] is not None for name in detector.requires)]
     
-    # === Background Noise Analysis ===
+    # === Background Noise ===
     # Extract background noise by applying high-pass filter
     # (most forgeries affect high frequency components)
-    noise = extract_background_noise(y, sr)
-    plots["noise_waveform"] = create_waveform_plot(noise, sr, title="Background Noise")
-    
-    # === ENF (Electrical Network Frequency) Analysis ===
-    # Look for inconsistencies in the 50/60 Hz power line hum
-    enf_result = detect_enf_inconsistencies(y, sr)
-    result["details"].append(enf_result["detail"])
-    if enf_result["suspicious"]:
-        result["forgery_detected"] = True
-        result["confidence"] = max(result["confidence"], enf_result["confidence"])
-    
-    # === Spectral Discontinuity Analysis ===
-    # Look for sudden changes in the spectrum that might indicate splicing
-    splice_result = detect_spectral_discontinuities(y, sr)
-    plots["discontinuity"] = splice_result["plot"]
-    result["details"].append(splice_result["detail"])
-    if splice_result["suspicious"]:
-        result["forgery_detected"] = True
-        result["confidence"] = max(result["confidence"], splice_result["confidence"])
+    if include_plots or any("noise" in detector.requires for detector in selected):
+        graph.add("noise", lambda: extract_background_noise(y, sr))
     
-    # === Noise Level Consistency Analysis ===
-    noise_result = analyze_noise_consistency(noise, sr)
-    plots["noise_consistency"] = noise_result["plot"]
-    result["details"].append(noise_result["detail"])
-    if noise_result["suspicious"]:
-        result["forgery_detected"] = True
-        result["confidence"] = max(result["confidence"], noise_result["confidence"])
+    # === Detectors ===
+    # Each receives the inputs it declares; the spectral features are
+    # computed lazily, so those no selected detector reads are skipped
+    for detector in selected:
+        graph.add(detector.name, _detector_task(detector, sr, include_plots, inputs),
+                  deps=("noise",) if "noise" in detector.requires else ())
+    
+    # === Splice Localization ===
+    # Fuse the detector traces to find where the recording was edited
+    cue_detectors = [detector for detector in selected if detector.cue is not None]
+    graph.add("localization", lambda **stages: localize_splices(
+        {name: cue for detector in cue_detectors
+         for name, cue in detector.cue(stages[detector.name]["trace"]).items()},
+        result["duration"]), deps=[detector.name for detector in cue_detectors])
+    
+    # === Waveform and Spectrogram Plots ===
+    if include_plots:
+        graph.add("waveform_plot", lambda: create_waveform_plot(y, sr))
+        graph.add("spectrogram_plot", lambda: create_spectrogram_plot(y, sr, features=features))
+        graph.add("noise_waveform_plot", lambda noise: create_waveform_plot(
+            noise, sr, title="Background Noise"), deps=("noise",))
+    
+    stages, timings = graph.run(max_workers=workers or ANALYSIS_WORKERS)
+    
+    for detector in selected:
+        add_detector_result(result, stages[detector.name], detector)
+    result["detectors"] = [detector.name for detector in selected]
+    result["splices"] = stages["localization"]
+    
+    plots = {}
+    if include_plots:
+        plots["waveform"] = stages["waveform_plot"]
+        plots["spectrogram"] = stages["spectrogram_plot"]
+        plots["noise_waveform"] = stages["noise_waveform_plot"]
+        for detector in selected:
+            if stages[detector.name].get("plot") is not None:
+                plots[detector.name] = stages[detector.name]["plot"]
+    
+    # Stage wall times; the shared spectral features are timed separately
+    # (their time is also part of the stages that first needed them)
+    result["timings"] = {"load": load_time, **timings, **features.timings}
     
     # Format the confidence as a percentage
     result["confidence"] = int(result["confidence"] * 100)
     
+    metrics.record_analysis(result, 'in_memory')
     return result, plots
 
+def new_result(duration, sr):
+    """Create an empty results dictionary for a recording"""
+    return {
+        "duration": duration,
+        "sample_rate": sr,
+        "forgery_detected": False,
+        "confidence": 0,
+        "details": [],
+        "scores": {}
+    }
+
+def add_detector_result(result, detector_result, detector=None):
+    """Merge one detector's verdict (and its `result_fields`) into the overall results dictionary"""
+    result["details"].append(detector_result["detail"])
+    if detector_result["suspicious"]:
+        result["forgery_detected"] = True
+        result["confidence"] = max(result["confidence"], detector_result["confidence"])
+    if detector is not None:
+        result["scores"][detector.name] = {
+            "suspicious": bool(detector_result["suspicious"]),
+            "confidence": float(detector_result["confidence"]),
+        }
+        for key, field in detector.result_fields.items():
+            result[key] = detector_result[field]
+
+def _detector_task(detector, sr, include_plot, inputs):
+    """Task graph callable running `detector`; `noise` arrives as a dependency"""
+    given = {name: inputs[name] for name in detector.requires if name in inputs}
+    return lambda **deps: detector.run(sr=sr, include_plot=include_plot, **given, **deps)
+
+def detector_features(features, rate):
+    """Feature store a narrow-band detector works on: the signal decimated to `rate` in multirate analysis"""
+    return features.at_rate(rate) if MULTIRATE_ANALYSIS else features
+
 def extract_background_noise(y, sr):
     """Extract background noise from audio signal using a high-pass filter"""
     # High-pass filter to isolate background noise (above 5000 Hz)
-    b, a = signal.butter(5, 5000/(sr/2), 'highpass')
-    noise = signal.filtfilt(b, a, y)
+    noise = highpass(y, sr, HIGHPASS_CUTOFF, HIGHPASS_ORDER)
     return noise
 
-def detect_enf_inconsistencies(y, sr):
+def detect_enf_inconsistencies(y, sr, features=None):
     """Detect inconsistencies in the Electrical Network Frequency (50/60 Hz)"""
+    if features is None:
+        features = FeatureStore(y, sr)
+    features = detector_features(features, ENF_SAMPLE_RATE)
+    
     # Extract ENF
-    window_size = int(sr * 2)  # 2-second windows
+    window_size = int(features.sr * ENF_WINDOW_SECONDS)  # 2-second windows
     hop_length = int(window_size / 2)
     
-    enf_values = []
+    # Track the 50/60 Hz power line component window by window
+    trace = features.enf_trace(window_size, hop_length, *ENF_BAND)
+    return enf_result(native_enf_scale(trace, sr, features.sr))
+
+def native_enf_scale(trace, sr, enf_sr):
+    """
+    Express the band magnitudes of an ENF trace computed at `enf_sr` on the
+    scale of the native rate `sr`.
+    
+    Band magnitudes grow with the number of samples per window, and the
+    scoring thresholds were set at the native rate.
+    """
+    if enf_sr == sr:
+        return trace
+    return dict(trace, power=np.asarray(trace["power"]) * (sr / enf_sr))
+
+def enf_result(trace):
+    """Score an ENF trace for inconsistencies"""
     suspicious = False
     confidence = 0
     
-    # For real ENF analysis, we'd use more sophisticated methods
-    # This is a simplified approach for demonstration
-    for i in range(0, len(y) - window_size, hop_length):
-        window = y[i:i+window_size]
-        spectrum = np.abs(np.fft.rfft(window))
-        freqs = np.fft.rfftfreq(window_size, 1/sr)
-        
-        # Look for energy around 50-60 Hz
-        mask = (freqs >= 45) & (freqs <= 65)
-        if any(mask):
-            enf_power = np.mean(spectrum[mask])
-            enf_values.append(enf_power)
+    enf_values = trace["power"][~np.isnan(trace["power"])]
     
     if len(enf_values) > 1:
         # Calculate variance in ENF power
@@ -120,130 +287,325 @@ def detect_enf_inconsistencies(y, sr):
     return {
         "suspicious": suspicious,
         "confidence": confidence,
-        "detail": f"ENF Analysis: {'Inconsistencies detected' if suspicious else 'No significant inconsistencies'} in power line frequency components."
+        "detail": f"ENF Analysis: {'Inconsistencies detected' if suspicious else 'No significant inconsistencies'} in power line frequency components.",
+        "trace": {key: values.tolist() for key, values in trace.items()}
+    }
+
+def match_enf_reference(y, sr, features=None):
+    """Timestamp the recording by matching its ENF against the reference logs"""
+    logs = enf_reference.DATABASE.logs()
+    if not logs:
+        return enf_reference_result({})
+    if features is None:
+        features = FeatureStore(y, sr)
+    features = detector_features(features, ENF_SAMPLE_RATE)
+    
+    # One trace per grid frequency the logs were recorded on
+    nominals = sorted({log.nominal for log in logs})
+    return enf_reference_result({nominal: features.fine_enf_trace(nominal) for nominal in nominals},
+                                logs)
+
+def enf_reference_result(traces, logs=None):
+    """
+    Score the match of fine ENF traces (see `enf.extract_fine_enf_trace`)
+    against the reference logs; jumps in the matched time are splices.
+    
+    The jumps are only located to within a few seconds, so they are
+    reported in the match rather than fused into the splice localization.
+    """
+    if not traces:
+        return {
+            "suspicious": False,
+            "confidence": 0,
+            "detail": "ENF Reference Matching: No reference logs available.",
+            "match": None,
+            "trace": {"times": [], "mismatch": []},
+        }
+    
+    match = enf_reference.match_trace(traces, logs)
+    discontinuities = match["discontinuities"]
+    suspicious = bool(discontinuities)
+    confidence = min(0.8, 0.4 + 0.2 * len(discontinuities)) if suspicious else 0
+    
+    if not any(len(trace["frequency"]) * enf_reference.REFERENCE_PERIOD
+               >= enf_reference.MATCH_MIN_SECONDS for trace in traces.values()):
+        detail = "Recording too short to match against the ENF reference logs."
+    elif not match["matched"]:
+        detail = "No match in the ENF reference logs."
+    else:
+        detail = (f"Recording matches reference '{match['reference']}' from {match['start']} "
+                  f"(correlation {match['correlation']:.2f})")
+        if suspicious:
+            jumps = ", ".join(f"{d['shift']:+d} s at {d['time']:.1f} s" for d in discontinuities)
+            detail += f"; the matched time jumps ({jumps})."
+        else:
+            detail += " without discontinuities."
+    
+    return {
+        "suspicious": suspicious,
+        "confidence": confidence,
+        "detail": f"ENF Reference Matching: {detail}",
+        "match": match,
+        "trace": match["trace"],
     }
 
-def detect_spectral_discontinuities(y, sr):
+def detect_spectral_discontinuities(y, sr, features=None, include_plot=True):
     """Detect abrupt spectral changes that might indicate splicing"""
+    if features is None:
+        features = FeatureStore(y, sr)
+    features = detector_features(features, MFCC_SAMPLE_RATE)
+    
     # Calculate MFCC (Mel-frequency cepstral coefficients)
-    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=512)
+    mfccs = features.mfcc
     
     # Calculate frame-to-frame differences
     mfcc_delta = np.diff(mfccs, axis=1)
     mfcc_delta_norm = np.linalg.norm(mfcc_delta, axis=0)
     
-    # Find potential splicing points (high delta)
-    threshold = np.mean(mfcc_delta_norm) + 2 * np.std(mfcc_delta_norm)
-    potential_splices = np.where(mfcc_delta_norm > threshold)[0]
+    return discontinuity_result(mfcc_delta_norm, features.sr, include_plot=include_plot,
+                                hop_length=features.hop_length)
+
+def discontinuity_result(mfcc_delta_norm, sr, include_plot=True, hop_length=HOP_LENGTH):
+    """Score the MFCC frame-to-frame change for splicing points"""
+    threshold, potential_splices = discontinuity_threshold(mfcc_delta_norm)
     
     suspicious = len(potential_splices) > 0
     confidence = min(0.8, len(potential_splices) / 10) if suspicious else 0
     
-    # Create plot
-    plt.figure(figsize=(10, 4))
-    plt.plot(mfcc_delta_norm)
-    plt.axhline(y=threshold, color='r', linestyle='--', label='Threshold')
-    for splice in potential_splices:
-        plt.axvline(x=splice, color='g', alpha=0.5)
-    plt.title('Spectral Discontinuity Analysis')
-    plt.xlabel('Frame')
-    plt.ylabel('MFCC Delta Norm')
-    plt.legend()
-    plt.tight_layout()
-    
-    # Convert plot to base64 string
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plot_data = base64.b64encode(buffer.read()).decode('utf-8')
-    plt.close()
+    plot_data = None
+    if include_plot:
+        plot_data = create_discontinuity_plot(mfcc_delta_norm, threshold, potential_splices)
     
     return {
         "suspicious": suspicious,
         "confidence": confidence,
         "detail": f"Spectral Discontinuity Analysis: {'Potential splicing points detected' if suspicious else 'No significant discontinuities found'}.",
-        "plot": plot_data
+        "plot": plot_data,
+        # Each delta lies between two frames centred hop_length apart
+        "trace": {"times": (np.arange(len(mfcc_delta_norm)) + 0.5) * hop_length / sr,
+                  "values": mfcc_delta_norm}
     }
 
-def analyze_noise_consistency(noise, sr):
+def discontinuity_threshold(mfcc_delta_norm):
+    """Splice threshold of an MFCC delta norm trace and the frames above it"""
+    # Find potential splicing points (high delta)
+    threshold = np.mean(mfcc_delta_norm) + 2 * np.std(mfcc_delta_norm)
+    return threshold, np.where(mfcc_delta_norm > threshold)[0]
+
+def detect_copy_move(y, sr, features=None):
+    """Detect stretches of the recording that were pasted elsewhere in it (copy-move forgery)"""
+    if features is None:
+        features = FeatureStore(y, sr)
+    features = detector_features(features, MFCC_SAMPLE_RATE)
+    
+    # Reuses the MFCCs of the spectral discontinuity analysis
+    return copy_move_result(features.mfcc, features.sr, hop_length=features.hop_length)
+
+def copy_move_result(mfccs, sr, hop_length=HOP_LENGTH):
+    """Score an MFCC matrix for repeated stretches (see `copy_move.find_copies`)"""
+    copies = copy_move.find_copies(mfccs, sr / hop_length)
+    
+    suspicious = len(copies) > 0
+    confidence = min(0.8, 0.5 + 0.1 * len(copies)) if suspicious else 0
+    
+    if suspicious:
+        pairs = ", ".join(f"{c['source'][0]:.1f}-{c['source'][1]:.1f} s at {c['destination'][0]:.1f} s"
+                          for c in copies[:3])
+        if len(copies) > 3:
+            pairs += f" and {len(copies) - 3} more"
+        detail = f"Repeated segments detected ({pairs})."
+    else:
+        detail = "No repeated segments found."
+    
+    return {
+        "suspicious": suspicious,
+        "confidence": confidence,
+        "detail": f"Copy-Move Analysis: {detail}",
+        "copies": copies,
+    }
+
+def analyze_noise_consistency(noise, sr, include_plot=True):
     """Analyze the consistency of background noise levels"""
-    # Split into segments
-    segment_length = int(sr * 1)  # 1 second segments
-    hop_length = int(segment_length / 2)  # 50% overlap
+    # RMS energy of 1 second segments with 50% overlap
+    timestamps, noise_levels = multiscale_rms(noise, sr, [NOISE_SEGMENT_SECONDS])[NOISE_SEGMENT_SECONDS]
     
-    noise_levels = []
-    timestamps = []
+    # Shorter segments only where the 1 second trace is too short to localize
+    # splices, and in a pass of their own: sharing the block sums with the
+    # 1 second scale would shrink the blocks to single samples
+    short_segments = None
+    if needs_short_noise_segments(len(noise_levels)):
+        short_segments = multiscale_rms(noise, sr, [SHORT_NOISE_SEGMENT_SECONDS])[SHORT_NOISE_SEGMENT_SECONDS]
     
-    for i in range(0, len(noise) - segment_length, hop_length):
-        segment = noise[i:i+segment_length]
-        # Calculate RMS energy
-        rms = np.sqrt(np.mean(segment**2))
-        noise_levels.append(rms)
-        timestamps.append(i / sr)
+    return noise_consistency_result(timestamps, noise_levels, include_plot=include_plot,
+                                    short_segments=short_segments)
+
+def needs_short_noise_segments(n_segments):
+    """Whether `n_segments` noise levels are too few for localization.noise_level_cue"""
+    return n_segments - 2 < MIN_CUE_SAMPLES
+
+def noise_consistency_result(timestamps, noise_levels, include_plot=True, short_segments=None):
+    """
+    Score a noise level trace for inconsistent segments.
+    
+    `short_segments` optionally gives the (timestamps, levels) of
+    SHORT_NOISE_SEGMENT_SECONDS segments, added to the trace for splice
+    localization.
+    """
+    threshold, outliers = noise_threshold(noise_levels)
+    suspicious = len(outliers) > 0
+    confidence = min(0.75, len(outliers) / 10) if suspicious else 0
+    
+    plot_data = None
+    if include_plot:
+        plot_data = create_noise_consistency_plot(timestamps, noise_levels, threshold, outliers)
     
+    trace = {"times": np.asarray(timestamps) + NOISE_SEGMENT_SECONDS / 2,
+             "values": np.asarray(noise_levels)}
+    if short_segments is not None:
+        trace["short"] = {"times": np.asarray(short_segments[0]) + SHORT_NOISE_SEGMENT_SECONDS / 2,
+                          "values": np.asarray(short_segments[1])}
+    
+    return {
+        "suspicious": suspicious,
+        "confidence": confidence,
+        "detail": f"Noise Consistency Analysis: {'Inconsistent noise levels detected' if suspicious else 'Background noise is consistent throughout the recording'}.",
+        "plot": plot_data,
+        "trace": trace
+    }
+
+def noise_threshold(noise_levels):
+    """Outlier threshold of a noise level trace and the segments above it"""
     # Check for significant variations in noise level
     noise_mean = np.mean(noise_levels)
     noise_std = np.std(noise_levels)
     threshold = noise_mean + 2 * noise_std
+    return threshold, np.where(noise_levels > threshold)[0]
+
+def analyze_channel_consistency(y, sr):
+    """
+    Check that the channels of a multi-channel recording agree.
     
-    outliers = np.where(noise_levels > threshold)[0]
-    suspicious = len(outliers) > 0
-    confidence = min(0.75, len(outliers) / 10) if suspicious else 0
+    The channels of a genuine recording share the same room noise and mains
+    hum, so each channel's background noise level should follow the others
+    (up to a constant gain) and its ENF should match theirs. All channels
+    are filtered, measured and tracked together in batched array operations.
+    
+    Args:
+        y: Audio of shape (channels, samples)
+        sr: Sample rate of `y`
+    """
+    noise = highpass(y, sr, HIGHPASS_CUTOFF, HIGHPASS_ORDER)
+    timestamps, noise_levels = multiscale_rms(noise, sr, [NOISE_SEGMENT_SECONDS])[NOISE_SEGMENT_SECONDS]
     
-    # Create plot
-    plt.figure(figsize=(10, 4))
-    plt.plot(timestamps, noise_levels)
-    plt.axhline(y=threshold, color='r', linestyle='--', label='Threshold')
-    for outlier in outliers:
-        plt.axvline(x=timestamps[outlier], color='g', alpha=0.5)
-    plt.title('Background Noise Consistency Analysis')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Noise Level (RMS)')
-    plt.legend()
-    plt.tight_layout()
-    
-    # Convert plot to base64 string
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plot_data = base64.b64encode(buffer.read()).decode('utf-8')
-    plt.close()
+    enf_y, enf_sr = decimate(y, sr, ENF_SAMPLE_RATE) if MULTIRATE_ANALYSIS else (y, sr)
+    window_size = int(enf_sr * ENF_WINDOW_SECONDS)
+    trace = extract_enf_trace(enf_y, enf_sr, window_size, int(window_size / 2), *ENF_BAND,
+                              with_salience=True)
+    
+    return channel_consistency_result(timestamps, noise_levels, trace)
+
+def channel_consistency_result(timestamps, noise_levels, enf_trace):
+    """Score per-channel noise level and ENF traces for disagreement"""
+    # Spread of the noise levels across channels, once each channel's
+    # constant gain offset is removed
+    levels_db = 20 * np.log10(np.maximum(noise_levels, 1e-12))
+    offsets = np.median(levels_db, axis=1) if levels_db.shape[1] else np.zeros(len(levels_db))
+    noise_mismatch = np.ptp(levels_db - offsets[:, None], axis=0) > CHANNEL_NOISE_TOLERANCE_DB
+    
+    # The ENF estimates must agree where every channel has a clear hum peak
+    # (elsewhere they are just noise), and a hum that is clear in one
+    # channel must not be missing from another
+    salience = enf_trace["salience"]
+    hum = np.all(salience >= CHANNEL_ENF_SALIENCE, axis=0)
+    missing_hum = np.any(salience >= CHANNEL_ENF_SALIENCE, axis=0) & \
+        np.any(salience < CHANNEL_ENF_SALIENCE / 2, axis=0)
+    enf_mismatch = missing_hum | (hum & (np.ptp(enf_trace["frequency"], axis=0) > CHANNEL_ENF_TOLERANCE_HZ))
+    
+    n_mismatches = np.count_nonzero(noise_mismatch) + np.count_nonzero(enf_mismatch)
+    suspicious = n_mismatches > 0
+    confidence = min(0.75, n_mismatches / 10) if suspicious else 0
     
     return {
         "suspicious": suspicious,
         "confidence": confidence,
-        "detail": f"Noise Consistency Analysis: {'Inconsistent noise levels detected' if suspicious else 'Background noise is consistent throughout the recording'}.",
-        "plot": plot_data
+        "detail": f"Channel Consistency Analysis: {'Channels disagree in background noise or power line frequency' if suspicious else 'All channels share consistent background noise and power line frequency'}.",
+        "channels": {
+            "count": len(levels_db),
+            "noise_offsets_db": np.round(offsets - np.median(offsets), 2).tolist(),
+            "noise_mismatch_times": np.asarray(timestamps)[noise_mismatch].tolist(),
+            "enf_present": bool(np.any(hum | missing_hum)),
+            "enf_mismatch_times": np.asarray(enf_trace["times"])[enf_mismatch].tolist(),
+        }
     }
 
+# === Detector registry ===
+# The built-in detectors, in the order their findings are reported
+
+@detector_registry.register('enf', requires=('y', 'features'), cost=detector_registry.COST_LOW,
+                            cue=enf_cue, result_fields={"enf_trace": "trace"})
+def _enf_detector(y, sr, features, include_plot):
+    return detect_enf_inconsistencies(y, sr, features=features)
+
+@detector_registry.register('enf_reference', requires=('y', 'features'),
+                            cost=detector_registry.COST_HIGH, result_fields={"enf_match": "match"})
+def _enf_reference_detector(y, sr, features, include_plot):
+    return match_enf_reference(y, sr, features=features)
+
+@detector_registry.register('discontinuity', requires=('y', 'features'),
+                            cost=detector_registry.COST_HIGH, cue=spectral_cue)
+def _discontinuity_detector(y, sr, features, include_plot):
+    return detect_spectral_discontinuities(y, sr, features=features, include_plot=include_plot)
+
+@detector_registry.register('copy_move', requires=('y', 'features'),
+                            cost=detector_registry.COST_HIGH, result_fields={"copy_move": "copies"})
+def _copy_move_detector(y, sr, features, include_plot):
+    return detect_copy_move(y, sr, features=features)
+
+@detector_registry.register('noise_consistency', requires=('noise',),
+                            cost=detector_registry.COST_LOW, cue=noise_level_cue)
+def _noise_consistency_detector(noise, sr, include_plot):
+    return analyze_noise_consistency(noise, sr, include_plot=include_plot)
+
+@detector_registry.register('channel_consistency', requires=('channels',),
+                            cost=detector_registry.COST_LOW, result_fields={"channels": "channels"})
+def _channel_consistency_detector(channels, sr, include_plot):
+    return analyze_channel_consistency(channels, sr)
+
+def _encode_png(png):
+    """Encode PNG bytes as a base64 string for embedding in HTML"""
+    return base64.b64encode(png).decode('utf-8')
+
 def create_waveform_plot(y, sr, title="Audio Waveform"):
     """Create a waveform plot and return as base64-encoded PNG"""
-    plt.figure(figsize=(10, 4))
-    librosa.display.waveshow(y, sr=sr)
-    plt.title(title)
-    plt.tight_layout()
-    
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plot_data = base64.b64encode(buffer.read()).decode('utf-8')
-    plt.close()
-    
-    return plot_data
+    return _encode_png(rendering.render_waveform(y, sr, title=title))
+
+def create_envelope_plot(times, lower, upper, title="Audio Waveform"):
+    """Plot a min/max waveform envelope and return as base64-encoded PNG"""
+    return _encode_png(rendering.render_envelope(times, lower, upper, title=title))
 
-def create_spectrogram_plot(y, sr):
+def create_spectrogram_plot(y, sr, features=None):
     """Create a spectrogram plot and return as base64-encoded PNG"""
-    plt.figure(figsize=(10, 4))
-    D = librosa.amplitude_to_db(np.abs(librosa.stft(y)), ref=np.max)
-    librosa.display.specshow(D, sr=sr, x_axis='time', y_axis='log')
-    plt.colorbar(format='%+2.0f dB')
-    plt.title('Spectrogram')
-    plt.tight_layout()
-    
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plot_data = base64.b64encode(buffer.read()).decode('utf-8')
-    plt.close()
-    
-    return plot_data
+    if features is None:
+        features = FeatureStore(y, sr)
+    
+    return _encode_png(rendering.render_spectrogram(features.spectrogram_db, sr, N_FFT, HOP_LENGTH))
+
+def render_discontinuity_plot(mfcc_delta_norm, threshold, potential_splices):
+    """Plot the MFCC delta norm with the splice threshold and return PNG bytes"""
+    return rendering.render_trace(
+        np.arange(len(mfcc_delta_norm)), mfcc_delta_norm, threshold, potential_splices,
+        title='Spectral Discontinuity Analysis', xlabel='Frame', ylabel='MFCC Delta Norm')
+
+def create_discontinuity_plot(mfcc_delta_norm, threshold, potential_splices):
+    """Plot the MFCC delta norm with the splice threshold and return as base64-encoded PNG"""
+    return _encode_png(render_discontinuity_plot(mfcc_delta_norm, threshold, potential_splices))
+
+def render_noise_consistency_plot(timestamps, noise_levels, threshold, outliers):
+    """Plot the noise level over time with the outlier threshold and return PNG bytes"""
+    return rendering.render_trace(
+        timestamps, noise_levels, threshold, np.asarray(timestamps)[outliers],
+        title='Background Noise Consistency Analysis', xlabel='Time (s)', ylabel='Noise Level (RMS)')
+
+def create_noise_consistency_plot(timestamps, noise_levels, threshold, outliers):
+    """Plot the noise level over time with the outlier threshold and return as base64-encoded PNG"""
+    return _encode_png(render_noise_consistency_plot(timestamps, noise_levels, threshold, outliers))
@@ -0,0 +1,160 @@
+import os
+import json
+import tempfile
+import threading
+
+import numpy as np
+
+from . import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+
+def json_default(obj):
+    """Serialize the NumPy values that can appear in analysis results"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ResultCache:
+    """
+    On-disk cache of analysis results keyed on audio content.
+
+    Entries are JSON files named after the SHA-256 of the audio and the
+    analyzer fingerprint, so a change to the analysis parameters makes old
+    entries unreachable; they are then evicted like any other stale entry.
+    Eviction is least-recently-used (by file mtime) once the cache grows
+    beyond `max_bytes`.
+
+    Args:
+        directory: Folder holding the cache entries
+        max_bytes: Total size the cache is trimmed to after each write
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # The lock cannot be pickled into pool processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(digest, detectors=None):
+        """Cache key for audio with the given SHA-256 digest, analyzed with `detectors`"""
+        from .audio_analysis import analyzer_fingerprint
+        from .detectors import selection_key
+        selection = selection_key(detectors)
+        return f"{digest}-{analyzer_fingerprint()}" + (f"-{selection}" if selection else '')
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key, require_plots=False):
+        """
+        Look up a cached analysis.
+
+        Returns:
+            (result, plots), or None on a miss. Entries stored without
+            plots count as a miss when `require_plots` is set.
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is None or (require_plots and not entry["plots"]):
+            with self._lock:
+                self.misses += 1
+            metrics.inc('audio_forensics_cache_lookups_total', result='miss')
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        metrics.inc('audio_forensics_cache_lookups_total', result='hit')
+        return entry["result"], entry["plots"]
+
+    def put(self, key, result, plots):
+        """Store an analysis and evict old entries if the cache is too large"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"result": result, "plots": plots}, f, default=json_default)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits `max_bytes`"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        """Hit/miss counters of this process"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+def analyze_cached(cache, file_path, digest, include_plots=True, detectors=None):
+    """
+    Return the cached analysis of a file, running and caching it on a miss.
+
+    Args:
+        detectors: Analysis profile or detector names, as for
+            `analyze_audio_file`; each selection is cached separately
+
+    Returns:
+        result, plots as returned by `analyze_audio_file`
+    """
+    from .audio_analysis import analyze_audio_file
+
+    key = cache.key(digest, detectors)
+    cached = cache.get(key, require_plots=include_plots)
+    if cached is not None:
+        return cached
+
+    result, plots = analyze_audio_file(file_path, include_plots=include_plots,
+                                       detectors=detectors)
+    if "error" not in result:
+        cache.put(key, result, plots)
+    return result, plots
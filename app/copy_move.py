@@ -0,0 +1,254 @@
+import numpy as np
+from scipy.ndimage import binary_closing
+
+# Each frame is described by CONTEXT_FRAMES MFCC frames CONTEXT_STEP apart,
+# so a descriptor covers a short sound rather than a single spectrum. The
+# first coefficient (the frame energy) is left out, so a copy pasted at a
+# different level still matches.
+CONTEXT_FRAMES = 3
+CONTEXT_STEP = 2
+
+# Coefficients are scaled by their spread over the recording, but never by
+# less than this (dB), so the slight ripple of a steady sound isn't
+# amplified into a pattern
+MIN_COEFFICIENT_STD = 3.0
+
+# Random hyperplane hashing: HASH_TABLES independent codes of HASH_BITS
+# bits per descriptor. Frames of a copy land in the same bucket in at
+# least one table even when the copy is offset by a fraction of a hop.
+HASH_TABLES = 8
+HASH_BITS = 20
+HASH_SEED = 0
+
+# Buckets with more frames than this hold common content (silence, steady
+# tones) whose matches say nothing about copying; they are skipped, which
+# also bounds the candidate pairs to MAX_BUCKET per frame and table
+MAX_BUCKET = 16
+
+# Candidate pairs vote for their (lag, source block) cell; cells with at
+# least MIN_VOTES_PER_SECOND votes per second of MIN_SEGMENT_SECONDS are
+# verified, at most MAX_CANDIDATES of them
+BLOCK_SECONDS = 5
+MIN_VOTES_PER_SECOND = 10
+MAX_CANDIDATES = 500
+
+# Shortest duplicated stretch reported
+MIN_SEGMENT_SECONDS = 1.0
+
+# Verification: a frame matches its counterpart at the candidate lag when
+# their distance is below MATCH_RATIO times the distance to the frames
+# BASELINE_SECONDS before and after the counterpart. A copy matches far
+# better than its neighbours; steady sound matches them all equally well.
+# Frames whose neighbours are closer than STEADY_DISTANCE (per descriptor
+# dimension, in normalized units) are steady sound and never match.
+MATCH_RATIO = 0.5
+BASELINE_SECONDS = 0.1
+STEADY_DISTANCE = 0.1
+
+# Gaps up to this long within a run of matching frames are bridged
+MAX_GAP_SECONDS = 0.1
+
+MAX_COPIES = 20
+
+
+def frame_descriptors(mfcc):
+    """
+    Per-frame descriptors of an MFCC matrix for copy-move search.
+
+    Each coefficient but the first is normalized to zero mean and unit
+    variance over the recording (see MIN_COEFFICIENT_STD), and
+    CONTEXT_FRAMES frames are stacked into each descriptor.
+
+    Args:
+        mfcc: MFCC matrix of shape (coefficients, frames)
+
+    Returns:
+        float32 array of shape (frames - context span, (coefficients - 1) * CONTEXT_FRAMES)
+    """
+    mfcc = np.asarray(mfcc, dtype=np.float32)[1:]
+    span = (CONTEXT_FRAMES - 1) * CONTEXT_STEP
+    n = mfcc.shape[1] - span
+    if n <= 0:
+        return np.zeros((0, mfcc.shape[0] * CONTEXT_FRAMES), dtype=np.float32)
+    std = mfcc.std(axis=1, keepdims=True)
+    normalized = (mfcc - mfcc.mean(axis=1, keepdims=True)) / np.maximum(std, MIN_COEFFICIENT_STD)
+    return np.ascontiguousarray(np.concatenate(
+        [normalized[:, k * CONTEXT_STEP:k * CONTEXT_STEP + n] for k in range(CONTEXT_FRAMES)]).T)
+
+
+def hash_codes(descriptors, tables=HASH_TABLES, bits=HASH_BITS, seed=HASH_SEED):
+    """Random hyperplane hash codes of the descriptors, shape (tables, frames)"""
+    rng = np.random.default_rng(seed)
+    weights = 1 << np.arange(bits, dtype=np.int64)
+    codes = np.empty((tables, len(descriptors)), dtype=np.int64)
+    for table in range(tables):
+        planes = rng.standard_normal((descriptors.shape[1], bits)).astype(np.float32)
+        codes[table] = (descriptors @ planes > 0) @ weights
+    return codes
+
+
+def candidate_pairs(codes, min_lag, max_bucket=MAX_BUCKET):
+    """
+    Pairs of frames that share a bucket in any hash table.
+
+    Each table is sorted by code once, so the frames of a bucket are
+    adjacent and pairing them costs O(frames * max_bucket).
+
+    Returns:
+        (earlier frames, lags) of the pairs at least `min_lag` frames apart
+    """
+    sources, lags = [], []
+    for code in codes:
+        order = np.argsort(code, kind='stable')
+        ordered = code[order]
+        _, inverse, counts = np.unique(ordered, return_inverse=True, return_counts=True)
+        small = counts[inverse] <= max_bucket
+        for offset in range(1, max_bucket):
+            same = (ordered[offset:] == ordered[:-offset]) & small[offset:]
+            if not same.any():
+                break
+            first, second = order[:-offset][same], order[offset:][same]
+            lag = np.abs(second - first)
+            keep = lag >= min_lag
+            sources.append(np.minimum(first, second)[keep])
+            lags.append(lag[keep])
+    if not sources:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(sources), np.concatenate(lags)
+
+
+def vote(sources, lags, block_frames, min_votes, max_candidates=MAX_CANDIDATES):
+    """
+    Candidate (lag, block) cells of the pairs.
+
+    A copy offset by a fraction of a hop splits its votes between two
+    adjacent lags, so each cell also counts the votes of its neighbouring
+    lags.
+
+    Returns:
+        List of (lag, block), most votes first
+    """
+    if not len(sources):
+        return []
+    blocks = sources // block_frames
+    n_blocks = int(blocks.max()) + 1
+    cells, counts = np.unique(lags * n_blocks + blocks, return_counts=True)
+
+    def votes_at(keys):
+        index = np.clip(np.searchsorted(cells, keys), 0, len(cells) - 1)
+        return np.where(cells[index] == keys, counts[index], 0)
+
+    total = counts + votes_at(cells - n_blocks) + votes_at(cells + n_blocks)
+    chosen = np.flatnonzero(total >= min_votes)
+    chosen = chosen[np.argsort(total[chosen], kind='stable')[::-1][:max_candidates]]
+    return [(int(cells[i] // n_blocks), int(cells[i] % n_blocks)) for i in chosen]
+
+
+def _distances(descriptors, start, stop, lag):
+    """Distance of frames start..stop to the frames `lag` later"""
+    return np.linalg.norm(descriptors[start:stop] - descriptors[start + lag:stop + lag], axis=1)
+
+
+def verify(descriptors, lag, start, stop, baseline, max_gap, min_frames):
+    """
+    Runs of frames in start..stop that match the frames `lag` later.
+
+    Returns:
+        List of (first frame, end frame, lag, distance ratio) runs, where
+        the ratio is the median distance to the copy relative to the
+        baseline distance (0 for an exact copy)
+    """
+    n = len(descriptors)
+    start = max(0, start)
+    stop = min(stop, n - lag - 1 - baseline)
+    if stop - start < min_frames or lag <= baseline:
+        return []
+
+    # The best of the two lags around a fractional offset
+    matched = np.minimum(_distances(descriptors, start, stop, lag),
+                         _distances(descriptors, start, stop, lag + 1))
+    reference = np.minimum(_distances(descriptors, start, stop, lag - baseline),
+                           _distances(descriptors, start, stop, lag + baseline))
+    ratio = matched / np.maximum(reference, 1e-6)
+    match = (ratio < MATCH_RATIO) & (reference > STEADY_DISTANCE * np.sqrt(descriptors.shape[1]))
+    if max_gap:
+        match = binary_closing(match, structure=np.ones(max_gap + 1, dtype=bool)) | match
+
+    edges = np.diff(np.concatenate([[0], match.astype(np.int8), [0]]))
+    runs = []
+    for first, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        # Source and destination can't overlap
+        end = min(end, first + lag)
+        if end - first >= min_frames:
+            runs.append((start + first, start + end, lag, float(np.median(ratio[first:end]))))
+    return runs
+
+
+def merge_runs(runs):
+    """
+    Join runs of the same copy found from neighbouring candidate cells,
+    which overlap at lags a frame or two apart; the joined run keeps the
+    lag of its best matching part.
+    """
+    merged = []
+    for first, end, lag, ratio in sorted(runs):
+        for i, (other_first, other_end, other_lag, other_ratio) in enumerate(merged):
+            if abs(lag - other_lag) <= 2 and first <= other_end and end >= other_first:
+                merged[i] = (min(first, other_first), max(end, other_end),
+                             lag if ratio < other_ratio else other_lag, min(ratio, other_ratio))
+                break
+        else:
+            merged.append((first, end, lag, ratio))
+    return merged
+
+
+def find_copies(mfcc, frame_rate):
+    """
+    Find stretches of a recording that reappear elsewhere in it.
+
+    Frame descriptors are hashed into an approximate nearest-neighbour
+    index, frames that share a bucket vote for how far apart they are, and
+    only the well supported (lag, position) candidates are verified frame
+    by frame, so the search is near-linear in the length of the recording
+    rather than quadratic.
+
+    Args:
+        mfcc: MFCC matrix of shape (coefficients, frames)
+        frame_rate: MFCC frames per second
+
+    Returns:
+        List of copies, longest first, each a dictionary with the `source`
+        and `destination` [start, end] times in seconds, the `lag` between
+        them and the `similarity` (1 for an exact copy)
+    """
+    min_frames = max(2, int(round(MIN_SEGMENT_SECONDS * frame_rate)))
+    descriptors = frame_descriptors(mfcc)
+    if len(descriptors) < 2 * min_frames:
+        return []
+
+    block_frames = max(min_frames, int(round(BLOCK_SECONDS * frame_rate)))
+    baseline = max(2, int(round(BASELINE_SECONDS * frame_rate)))
+    max_gap = int(round(MAX_GAP_SECONDS * frame_rate))
+
+    sources, lags = candidate_pairs(hash_codes(descriptors), min_frames)
+    # A copy straddling a block boundary has at least half its votes in one block
+    min_votes = MIN_VOTES_PER_SECOND * MIN_SEGMENT_SECONDS / 2
+    runs = []
+    for lag, block in vote(sources, lags, block_frames, min_votes):
+        runs += verify(descriptors, lag, block * block_frames - min_frames,
+                       (block + 1) * block_frames + min_frames, baseline, max_gap, min_frames)
+
+    def seconds(frame):
+        return round(float(frame / frame_rate), 2)
+
+    span = (CONTEXT_FRAMES - 1) * CONTEXT_STEP
+    copies = sorted(merge_runs(runs), key=lambda run: run[0] - run[1])[:MAX_COPIES]
+    return [
+        {
+            "source": [seconds(first), seconds(end + span)],
+            "destination": [seconds(first + lag), seconds(end + span + lag)],
+            "lag": seconds(lag),
+            "similarity": round(max(0.0, 1 - ratio), 2),
+        }
+        for first, end, lag, ratio in copies
+    ]
@@ -0,0 +1,148 @@
+import os
+
+# Relative cost of a detector, used to build the profiles
+COST_LOW = 'low'  # time-domain work or a narrow-band trace
+COST_HIGH = 'high'  # full spectral decomposition (STFT/MFCC) or a search of long references
+
+# Inputs the analysis can provide to detectors
+INPUTS = (
+    'y',  # mono audio
+    'features',  # shared FeatureStore (STFT, MFCC, ENF trace, ...)
+    'noise',  # high-pass filtered background noise
+    'channels',  # (channels, samples) audio, in multi-channel analysis only
+)
+
+
+class Detector:
+    """
+    A forgery detector that can be plugged into the analysis.
+
+    The analysis calls `run` with the sample rate (`sr`), whether a plot is
+    wanted (`include_plot`) and the inputs named in `requires`, as keyword
+    arguments. It returns a dictionary with at least `suspicious`,
+    `confidence` and `detail`, and optionally a `trace` and a `plot`.
+    Detectors that need an input the analysis doesn't have (e.g.
+    `channels` for mono analysis) are skipped.
+
+    Args:
+        name: Unique name, used to select the detector
+        run: Callable producing the detector's result
+        requires: Inputs (see INPUTS) the detector needs; inputs no
+            selected detector needs are never computed
+        cost: COST_LOW or COST_HIGH
+        cue: Optional callable turning the detector's `trace` into splice
+            localization cues ({cue name: (times, values)}, see
+            `localization.localize_splices`)
+        result_fields: Result keys to copy into the analysis result, as
+            {analysis result key: detector result key}
+    """
+
+    def __init__(self, name, run, requires=(), cost=COST_LOW, cue=None, result_fields=None):
+        unknown = set(requires) - set(INPUTS)
+        if unknown:
+            raise ValueError(f"Unknown inputs {sorted(unknown)} for detector '{name}'")
+        self.name = name
+        self.run = run
+        self.requires = tuple(requires)
+        self.cost = cost
+        self.cue = cue
+        self.result_fields = result_fields or {}
+
+    def __repr__(self):
+        return f"Detector({self.name!r}, requires={self.requires}, cost={self.cost!r})"
+
+
+# Registered detectors by name, in the order their findings are reported
+DETECTORS = {}
+
+# Named detector selections, by the cost of the detectors they run; None
+# selects every registered detector
+PROFILES = {
+    'full': None,
+    'fast': COST_LOW,
+}
+
+# Profile used when a request doesn't choose one
+DEFAULT_PROFILE = os.environ.get('ANALYSIS_PROFILE', 'full')
+
+
+def register(name, requires=(), cost=COST_LOW, cue=None, result_fields=None):
+    """
+    Decorator registering a function as a detector (see `Detector`).
+
+    Example:
+        @register('clipping', requires=('y',))
+        def detect_clipping(y, sr, include_plot):
+            ...
+    """
+    def decorator(run):
+        if name in DETECTORS:
+            raise ValueError(f"Detector '{name}' is already registered")
+        DETECTORS[name] = Detector(name, run, requires, cost, cue, result_fields)
+        return run
+    return decorator
+
+
+def select_detectors(selection=None):
+    """
+    Resolve a detector selection.
+
+    Args:
+        selection: Profile name, iterable of detector names, or None for
+            the default profile
+
+    Returns:
+        List of Detector objects, in registration order
+
+    Raises:
+        ValueError: For an unknown profile or detector name
+    """
+    # The built-in detectors register themselves on import
+    from . import audio_analysis  # noqa: F401
+
+    if selection is None:
+        selection = DEFAULT_PROFILE
+    if isinstance(selection, str):
+        if selection not in PROFILES:
+            raise ValueError(f"Unknown analysis profile '{selection}'")
+        cost = PROFILES[selection]
+        return [detector for detector in DETECTORS.values() if cost is None or detector.cost == cost]
+
+    names = set(selection)
+    unknown = names - set(DETECTORS)
+    if unknown:
+        raise ValueError(f"Unknown detectors: {', '.join(sorted(unknown))}")
+    return [detector for name, detector in DETECTORS.items() if name in names]
+
+
+def request_selection(args):
+    """
+    Detector selection of a web request, from its `detectors` (comma
+    separated names) or `profile` query parameter.
+
+    Returns:
+        A selection for `select_detectors`
+
+    Raises:
+        ValueError: For an unknown profile or detector name
+    """
+    if args.get('detectors'):
+        selection = [name.strip() for name in args['detectors'].split(',') if name.strip()]
+    else:
+        selection = args.get('profile') or None
+    select_detectors(selection)
+    return selection
+
+
+def selection_key(selection=None):
+    """
+    Canonical string for a detector selection, e.g. for cache keys.
+
+    Returns:
+        '' when every registered detector is selected, otherwise the
+        sorted detector names joined by '+'
+    """
+    detectors = select_detectors(selection)
+    if len(detectors) == len(DETECTORS):
+        return ''
+    return '+'.join(sorted(detector.name for detector in detectors))
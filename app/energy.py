@@ -0,0 +1,102 @@
+from functools import reduce
+from math import gcd
+
+import numpy as np
+
+
+def _frame_count(n_samples, window_length, hop_length):
+    """Number of windows, matching `range(0, n_samples - window_length, hop_length)`"""
+    return len(range(0, n_samples - window_length, hop_length))
+
+
+def _block_energy(y, block_length, n_samples):
+    """
+    Running sum of the energy of consecutive `block_length` blocks.
+
+    The squares are summed block by block in one pass over the signal
+    (accumulating in float64), and only the much shorter sequence of block
+    sums is cumulated, which keeps both the cost and the rounding error of
+    later differences small.
+
+    Returns:
+        Array of shape (..., n_blocks + 1) with a leading zero
+    """
+    y = np.asarray(y)
+    n_blocks = n_samples // block_length
+    blocks = y[..., :n_blocks * block_length].reshape(y.shape[:-1] + (n_blocks, block_length))
+    energy = np.zeros(y.shape[:-1] + (n_blocks + 1,))
+    np.cumsum(np.einsum('...ij,...ij->...i', blocks, blocks, dtype=np.float64),
+              axis=-1, out=energy[..., 1:])
+    return energy
+
+
+def _windowed_rms(energy, block_length, window_length, hop_length, n_frames):
+    starts = np.arange(n_frames) * (hop_length // block_length)
+    window_energy = energy[..., starts + window_length // block_length] - energy[..., starts]
+    # Differences of running sums can dip a hair below zero
+    return np.sqrt(np.maximum(window_energy, 0.0) / window_length)
+
+
+def rolling_rms(y, window_length, hop_length, n_frames=None):
+    """
+    RMS of every `window_length` window of `y`, `hop_length` samples apart.
+
+    Every sample is squared once however much the windows overlap: the
+    signal is summed in blocks of gcd(window_length, hop_length) samples
+    and each window's energy is a difference of running block sums.
+
+    Args:
+        y: Audio time series, or array of shape (channels, samples)
+        window_length: Window length in samples
+        hop_length: Distance between window starts in samples
+        n_frames: Number of windows (defaults to the windows starting
+            strictly before `len(y) - window_length`)
+
+    Returns:
+        Array of per-window RMS values, one row per channel for
+        multi-channel input
+    """
+    if n_frames is None:
+        n_frames = _frame_count(np.shape(y)[-1], window_length, hop_length)
+    block_length = gcd(window_length, hop_length)
+    n_samples = max(0, (n_frames - 1) * hop_length + window_length) if n_frames else 0
+    energy = _block_energy(y, block_length, n_samples)
+    return _windowed_rms(energy, block_length, window_length, hop_length, n_frames)
+
+
+def multiscale_rms(y, sr, window_seconds, overlap=0.5):
+    """
+    Rolling RMS traces at several window sizes from a single pass.
+
+    The block sums are shared between all scales, so adding a scale only
+    costs the (short) per-window differences. The blocks are the gcd of
+    every window and hop length, though: scales without a large common
+    divisor (such as 1 s and 0.25 s at 44.1 kHz) shrink them to single
+    samples and need a call each.
+
+    Args:
+        y: Audio time series, or array of shape (channels, samples)
+        sr: Sample rate of `y`
+        window_seconds: Window lengths in seconds
+        overlap: Fraction of each window shared with the next one
+
+    Returns:
+        Dictionary of window length (seconds) to a `(timestamps, rms)` pair,
+        with timestamps at the window starts
+    """
+    scales = {}
+    for seconds in window_seconds:
+        window_length = int(sr * seconds)
+        hop_length = max(1, int(window_length * (1 - overlap)))
+        scales[seconds] = (window_length, hop_length,
+                           _frame_count(np.shape(y)[-1], window_length, hop_length))
+
+    block_length = reduce(gcd, (length for w, h, _ in scales.values() for length in (w, h)))
+    n_samples = max([(n - 1) * h + w for w, h, n in scales.values() if n] or [0])
+    energy = _block_energy(y, block_length, n_samples)
+
+    return {
+        seconds: (np.arange(n_frames) * hop_length / sr,
+                  _windowed_rms(energy, block_length, window_length, hop_length, n_frames))
+        for seconds, (window_length, hop_length, n_frames) in scales.items()
+    }
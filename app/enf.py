@@ -0,0 +1,226 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import signal
+
+# Upper bound on the size of one batch of rFFT output, so memory stays
+# bounded (and cost linear) for hour-long recordings
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+
+# Fine ENF trace used to match recordings against grid frequency logs: the
+# band around the nominal frequency is shifted to 0 Hz and decimated to
+# BASEBAND_RATE, then tracked in long windows one second apart
+BASEBAND_RATE = 10  # Hz
+FINE_WINDOW_SECONDS = 8
+FINE_BAND = 1.0  # Hz either side of the nominal frequency
+FINE_FFT_SIZE = 1024  # zero-padded, ~0.01 Hz bins at BASEBAND_RATE
+
+
+def frame_signal(y, frame_length, hop_length, n_frames=None):
+    """
+    Split a signal into overlapping frames as a zero-copy strided view.
+
+    By default frames start at 0, hop_length, ... strictly before
+    len(y) - frame_length, matching the window positions the ENF analysis
+    has always used. Pass `n_frames` to take an exact number of frames
+    (which must fit in `y`) instead. Multi-channel signals of shape
+    (..., samples) are framed along the last axis.
+
+    Returns:
+        Read-only array view of shape (..., n_frames, frame_length)
+    """
+    y = np.ascontiguousarray(y)
+    if n_frames is None:
+        n_frames = len(range(0, y.shape[-1] - frame_length, hop_length))
+    return as_strided(
+        y,
+        shape=y.shape[:-1] + (n_frames, frame_length),
+        strides=y.strides[:-1] + (y.strides[-1] * hop_length, y.strides[-1]),
+        writeable=False,
+    )
+
+
+def extract_enf_trace(y, sr, window_length, hop_length, fmin=45, fmax=65, with_salience=False):
+    """
+    Track the Electrical Network Frequency over time.
+
+    All windows are taken from a strided view of `y` and transformed with
+    batched rFFTs; only the bins inside [fmin, fmax] are kept from each
+    batch. The per-window frequency estimate refines the peak bin with
+    parabolic interpolation on the log magnitude.
+
+    Args:
+        y: Audio time series, or array of shape (channels, samples) to
+            track every channel in the same batched transforms
+        sr: Sample rate of `y`
+        window_length: Window size in samples
+        hop_length: Hop between windows in samples
+        fmin, fmax: ENF search band in Hz
+        with_salience: Also return `salience`, the peak magnitude over the
+            mean band magnitude, which is high only where a hum is present
+
+    Returns:
+        Dictionary with per-window arrays `times` (window centres, seconds),
+        `frequency` (Hz) and `power` (mean band magnitude); for
+        multi-channel input `frequency` and `power` have one row per channel
+    """
+    frames = frame_signal(y, window_length, hop_length)
+    times = (np.arange(frames.shape[-2]) * hop_length + window_length / 2) / sr
+    trace = {"times": times}
+    if with_salience:
+        trace["frequency"], trace["power"], trace["salience"] = enf_from_frames(
+            frames, sr, fmin, fmax, with_salience=True)
+    else:
+        trace["frequency"], trace["power"] = enf_from_frames(frames, sr, fmin, fmax)
+    return trace
+
+
+def enf_from_frames(frames, sr, fmin=45, fmax=65, with_salience=False):
+    """
+    Estimate ENF frequency and band power for each frame.
+
+    Args:
+        frames: Array of shape (..., n_frames, window_length), e.g. one
+            set of frames per channel
+
+    Returns:
+        frequency: Interpolated peak frequency per frame (Hz)
+        power: Mean band magnitude per frame
+        salience: Peak over mean band magnitude per frame (only with
+            `with_salience`)
+    """
+    window_length = frames.shape[-1]
+    freqs = np.fft.rfftfreq(window_length, 1 / sr)
+    band = np.flatnonzero((freqs >= fmin) & (freqs <= fmax))
+
+    n_frames = frames.shape[-2]
+    if len(band) == 0 or frames.size == 0:
+        empty = np.full(frames.shape[:-1], np.nan)
+        return (empty, empty, empty) if with_salience else (empty, empty)
+
+    # Keep one neighbouring bin on each side of the band for interpolation
+    lo = max(band[0] - 1, 0)
+    hi = min(band[-1] + 2, len(freqs))
+    band_start = band[0] - lo
+    band_stop = band_start + len(band)
+
+    # Batches run along the frame axis, covering every channel at once
+    n_channels = int(np.prod(frames.shape[:-2]))
+    batch_size = max(1, MAX_BATCH_BYTES // (16 * len(freqs) * n_channels))
+    spectra = np.empty(frames.shape[:-1] + (hi - lo,))
+    for start in range(0, n_frames, batch_size):
+        batch = frames[..., start:start + batch_size, :]
+        spectra[..., start:start + batch.shape[-2], :] = np.abs(
+            np.fft.rfft(batch, axis=-1)[..., lo:hi])
+
+    power = np.mean(spectra[..., band_start:band_stop], axis=-1)
+
+    def magnitude(bins):
+        return np.take_along_axis(spectra, bins[..., None], axis=-1)[..., 0]
+
+    peak = band_start + np.argmax(spectra[..., band_start:band_stop], axis=-1)
+    left = np.log(magnitude(np.maximum(peak - 1, 0)) + 1e-12)
+    centre = np.log(magnitude(peak) + 1e-12)
+    right = np.log(magnitude(np.minimum(peak + 1, hi - lo - 1)) + 1e-12)
+    denominator = left - 2 * centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(denominator < 0, 0.5 * (left - right) / denominator, 0.0)
+    offset = np.clip(offset, -0.5, 0.5)
+
+    frequency = freqs[lo + peak] + offset * (freqs[1] - freqs[0])
+
+    if with_salience:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            salience = magnitude(peak) / power
+        return frequency, power, salience
+    return frequency, power
+
+
+def heterodyne(y, sr, nominal, offset=0):
+    """
+    Shift the band around `nominal` Hz down to 0 Hz.
+
+    Args:
+        y: Real signal
+        sr: Sample rate of `y`
+        nominal: Frequency moved to 0 Hz; a whole number of Hz
+        offset: Index of y[0] in the stream, so consecutive blocks of a
+            stream get a continuous phase
+
+    Returns:
+        Complex signal y * exp(-2j * pi * nominal * t), as float64
+    """
+    n = np.arange(offset, offset + y.shape[-1], dtype=np.int64)
+    # Phase in whole cycles, computed exactly for arbitrarily long streams
+    phase = (n * int(nominal)) % sr / sr
+    return y * np.exp(-2j * np.pi * phase)
+
+
+def fine_enf_from_frames(frames, rate, band=FINE_BAND, n_fft=FINE_FFT_SIZE):
+    """
+    Estimate the ENF offset from the nominal frequency in each frame of a
+    heterodyned (see `heterodyne`) and decimated signal.
+
+    Frames are Hann windowed and zero-padded to `n_fft`; the peak within
+    `band` Hz of 0 is refined with parabolic interpolation on the log
+    magnitude.
+
+    Returns:
+        offset: Peak frequency per frame relative to the nominal (Hz)
+        salience: Peak over mean magnitude within the band per frame
+    """
+    n_frames, window_length = frames.shape
+    freqs = np.fft.fftshift(np.fft.fftfreq(n_fft, 1 / rate))
+    band_bins = np.flatnonzero(np.abs(freqs) <= band)
+    if n_frames == 0 or len(band_bins) < 3:
+        return np.zeros(0), np.zeros(0)
+
+    window = signal.get_window('hann', window_length)
+    spectra = np.abs(np.fft.fftshift(np.fft.fft(frames * window, n_fft, axis=1),
+                                     axes=1)[:, band_bins])
+
+    rows = np.arange(n_frames)
+    # Peaks on the band edge are interpolated with the bins inside it
+    peak = np.clip(np.argmax(spectra, axis=1), 1, len(band_bins) - 2)
+    left, centre, right = (np.log(spectra[rows, peak + d] + 1e-12) for d in (-1, 0, 1))
+    denominator = left - 2 * centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(denominator < 0, 0.5 * (left - right) / denominator, 0.0)
+    offset = freqs[band_bins[peak]] + np.clip(shift, -0.5, 0.5) * rate / n_fft
+    with np.errstate(divide='ignore', invalid='ignore'):
+        salience = spectra[rows, peak] / np.mean(spectra, axis=1)
+    return offset, salience
+
+
+def fine_frame_count(n_samples, window_length, hop_length):
+    """Number of whole frames of the fine ENF trace in `n_samples` baseband samples"""
+    return 1 + (n_samples - window_length) // hop_length if n_samples >= window_length else 0
+
+
+def extract_fine_enf_trace(y, sr, nominal, window_seconds=FINE_WINDOW_SECONDS):
+    """
+    Track the ENF around `nominal` Hz with the precision needed to match it
+    against grid frequency logs.
+
+    The band around the nominal frequency is heterodyned to 0 Hz and
+    decimated to BASEBAND_RATE, then analyzed in long windows (a few
+    millihertz of precision) once per second, the rate grid logs are
+    recorded at.
+
+    Returns:
+        Dictionary with per-window arrays `times` (window centres, seconds),
+        `frequency` (Hz) and `salience` (peak over mean band magnitude)
+    """
+    from .multirate import resample
+
+    baseband = heterodyne(y, sr, nominal)
+    baseband = resample(baseband.real, sr, BASEBAND_RATE) \
+        + 1j * resample(baseband.imag, sr, BASEBAND_RATE)
+    window_length = int(window_seconds * BASEBAND_RATE)
+    n_frames = fine_frame_count(len(baseband), window_length, BASEBAND_RATE)
+    frames = frame_signal(baseband, window_length, BASEBAND_RATE, n_frames)
+    offset, salience = fine_enf_from_frames(frames, BASEBAND_RATE)
+    return {
+        "times": np.arange(len(offset)) + window_seconds / 2,
+        "frequency": nominal + offset,
+        "salience": salience,
+    }
@@ -0,0 +1,711 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Reference logs hold one grid frequency sample per second
+REFERENCE_PERIOD = 1  # seconds
+
+# Samples are stored as int16 deviations from the nominal frequency in
+# millihertz, 2 bytes per second (63 MB per year of log); MISSING marks
+# seconds the log doesn't cover
+SCALE_HZ = 0.001
+MISSING = np.iinfo(np.int16).min
+
+# Gaps in an imported log up to this long are linearly interpolated
+MAX_INTERPOLATED_GAP_SECONDS = 5
+
+# Grid frequencies a log can be recorded on
+NOMINAL_FREQUENCIES = (50, 60)
+
+# The search first correlates block means of COARSE_FACTOR seconds, which
+# follow the slow drift of the grid frequency, and refines the best
+# COARSE_CANDIDATES peaks at full resolution; queries shorter than
+# COARSE_MIN_SAMPLES blocks use smaller blocks
+COARSE_FACTOR = 10
+COARSE_MIN_SAMPLES = 30
+COARSE_CANDIDATES = 32
+
+# Candidates are scored on the traces less their DETREND_SECONDS moving
+# average: the short-term fluctuations identify a stretch of log, while
+# the slow drift is shared by many
+DETREND_SECONDS = 60
+
+# Fraction of a window the reference must cover for a match there
+MIN_COVERAGE = 0.9
+
+# A match needs MATCH_MIN_SECONDS of trace, a correlation of at least
+# MATCH_THRESHOLD, and MATCH_MARGIN more than the next best candidate
+MATCH_MIN_SECONDS = 120
+MATCH_THRESHOLD = 0.5
+MATCH_MARGIN = 0.15
+MATCH_CANDIDATES = 5
+
+# Recordings that don't match as a whole (e.g. spliced from different
+# times) are matched in pieces of up to MATCH_PIECE_SECONDS
+MATCH_PIECE_SECONDS = 300
+
+# Segments of the recording are aligned separately, each searched within
+# SEGMENT_SEARCH_SECONDS of a match; consecutive segments at least
+# SEGMENT_THRESHOLD correlated whose offsets differ by more than
+# SHIFT_TOLERANCE_SECONDS are a discontinuity
+SEGMENT_SECONDS = 120
+SEGMENT_HOP_SECONDS = 60
+SEGMENT_SEARCH_SECONDS = 600
+SEGMENT_THRESHOLD = 0.5
+SHIFT_TOLERANCE_SECONDS = 2
+
+
+def format_timestamp(timestamp):
+    """UTC ISO 8601 string of a Unix timestamp"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_timestamp(text):
+    """Unix timestamp from seconds or an ISO 8601 date and time (UTC unless it has an offset)"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(text.strip())
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+class ReferenceLog:
+    """
+    One imported grid frequency log.
+
+    Stored as `<name>.npy` (int16 millihertz deviations, see SCALE_HZ) and
+    `<name>.json` (name, nominal frequency and start time); the
+    samples are memory-mapped, so logs of any length open instantly and
+    are shared between processes through the page cache.
+    """
+
+    def __init__(self, folder, name):
+        with open(os.path.join(folder, name + '.json')) as f:
+            meta = json.load(f)
+        self.name = name
+        self.nominal = meta["nominal"]
+        self.start = meta["start"]
+        self.samples = np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+        self._coarse = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __repr__(self):
+        return (f"ReferenceLog({self.name!r}, nominal={self.nominal}, "
+                f"start={format_timestamp(self.start)}, seconds={len(self)})")
+
+    def deviations(self, start=0, stop=None):
+        """
+        Samples `start:stop` as deviations from the nominal frequency.
+
+        Returns:
+            values: Deviations in Hz, 0 where the log has no sample
+            mask: Where the log has a sample
+        """
+        samples = np.asarray(self.samples[start:stop])
+        mask = samples != MISSING
+        return np.where(mask, samples * SCALE_HZ, 0.0), mask
+
+    def coarse(self, factor):
+        """
+        Block means of `factor` samples, as `deviations`, for the coarse search.
+
+        Blocks count as covered if at least MIN_COVERAGE of their samples
+        are. Computed once per log and factor.
+        """
+        with self._lock:
+            if factor not in self._coarse:
+                n_blocks = len(self) // factor
+                values, mask = self.deviations(0, n_blocks * factor)
+                counts = mask.reshape(n_blocks, factor).sum(axis=1)
+                sums = values.reshape(n_blocks, factor).sum(axis=1)
+                covered = counts >= MIN_COVERAGE * factor
+                means = np.where(covered, sums / np.maximum(counts, 1), 0.0)
+                self._coarse[factor] = (means, covered)
+            return self._coarse[factor]
+
+
+class ReferenceDatabase:
+    """
+    The reference logs in one folder.
+
+    The folder is rescanned when its contents change, so logs imported
+    while the app runs are picked up without a restart.
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self._logs = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def configure(self, folder):
+        """Read reference logs from `folder`"""
+        with self._lock:
+            self.folder = folder
+            self._stamp = None
+
+    def logs(self):
+        """Reference logs, sorted by name"""
+        if self.folder is None or not os.path.isdir(self.folder):
+            return []
+        stamp = os.stat(self.folder).st_mtime_ns
+        with self._lock:
+            if stamp != self._stamp:
+                names = sorted(entry[:-len('.json')] for entry in os.listdir(self.folder)
+                               if entry.endswith('.json'))
+                # Re-imported logs replace their files, so every log is reopened
+                self._logs = {name: ReferenceLog(self.folder, name) for name in names
+                              if os.path.exists(os.path.join(self.folder, name + '.npy'))}
+                self._stamp = stamp
+            return list(self._logs.values())
+
+    def fingerprint(self):
+        """Short hash of the available logs, '' if there are none"""
+        logs = self.logs()
+        if not logs:
+            return ''
+        encoded = json.dumps([[log.name, log.nominal, log.start, len(log)] for log in logs])
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:12]
+
+
+DATABASE = ReferenceDatabase(os.environ.get('ENF_REFERENCE_DIR'))
+
+configure = DATABASE.configure
+
+
+# === Importing logs ===
+
+def read_log(path, start=None, period=REFERENCE_PERIOD, dtype='float32'):
+    """
+    Read a grid frequency log.
+
+    Text files (.csv, .txt, .tsv) have one sample per line: a timestamp
+    (Unix seconds or ISO 8601) and the frequency in Hz, separated by a
+    comma, semicolon or whitespace; lines whose last field isn't a number
+    (headers) are skipped. Text files with only a frequency per line, .npy
+    arrays and raw little-endian binary files of `dtype` need `start`.
+
+    Args:
+        path: Log file
+        start: Unix timestamp of the first sample, for logs without
+            timestamps
+        period: Seconds between samples, for logs without timestamps
+
+    Returns:
+        times: Unix timestamps of the samples
+        frequency: Grid frequency in Hz
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.csv', '.txt', '.tsv'):
+        times, frequency = [], []
+        with open(path) as f:
+            for line in f:
+                fields = line.replace(',', ' ').replace(';', ' ').split()
+                if not fields:
+                    continue
+                try:
+                    value = float(fields[-1])
+                except ValueError:
+                    continue
+                if len(fields) > 1:
+                    # ISO dates may be split from their time by a space
+                    times.append(parse_timestamp(' '.join(fields[:-1])))
+                frequency.append(value)
+        frequency = np.array(frequency)
+        if len(times) == len(frequency) and times:
+            return np.array(times), frequency
+    elif extension == '.npy':
+        frequency = np.load(path).astype(np.float64)
+    else:
+        frequency = np.fromfile(path, dtype=np.dtype(dtype).newbyteorder('<')).astype(np.float64)
+
+    if start is None:
+        raise ValueError(f"{path} has no timestamps; give the time of its first sample")
+    return start + np.arange(len(frequency)) * period, frequency
+
+
+def to_grid(times, frequency):
+    """
+    Put log samples on the one-second grid of a reference log.
+
+    Samples are averaged per second; gaps up to MAX_INTERPOLATED_GAP_SECONDS
+    are interpolated and longer ones left missing.
+
+    Returns:
+        start: Unix timestamp of the first grid sample
+        frequency: Grid frequency per second in Hz, NaN where missing
+    """
+    valid = np.isfinite(times) & np.isfinite(frequency)
+    times, frequency = times[valid], frequency[valid]
+    if len(times) == 0:
+        raise ValueError("The log has no samples")
+    start = int(np.floor(times.min()))
+    index = np.round((times - start) / REFERENCE_PERIOD).astype(np.int64)
+    n = int(index.max()) + 1
+    counts = np.bincount(index, minlength=n)
+    with np.errstate(invalid='ignore'):
+        grid = np.bincount(index, weights=frequency, minlength=n) / counts
+
+    # Interpolate across short gaps only
+    known = np.flatnonzero(counts)
+    gaps = np.diff(known) - 1
+    for left, length in zip(known[:-1][(gaps > 0) & (gaps <= MAX_INTERPOLATED_GAP_SECONDS)],
+                            gaps[(gaps > 0) & (gaps <= MAX_INTERPOLATED_GAP_SECONDS)]):
+        right = left + length + 1
+        grid[left + 1:right] = np.interp(np.arange(left + 1, right), [left, right],
+                                         [grid[left], grid[right]])
+    return start, grid
+
+
+def write_reference(folder, name, start, frequency, nominal=None):
+    """
+    Store a reference log in `folder`, replacing any log of the same name.
+
+    Args:
+        start: Unix timestamp of the first sample
+        frequency: Grid frequency per second in Hz, NaN where missing
+        nominal: Grid frequency (50 or 60 Hz); guessed from the samples if
+            not given
+
+    Returns:
+        The stored ReferenceLog
+    """
+    if nominal is None:
+        median = np.nanmedian(frequency)
+        nominal = min(NOMINAL_FREQUENCIES, key=lambda f: abs(f - median))
+    deviation = np.round((frequency - nominal) / SCALE_HZ)
+    missing = ~np.isfinite(deviation)
+    if np.any(np.abs(deviation[~missing]) > np.iinfo(np.int16).max):
+        raise ValueError(f"Frequencies more than 32 Hz from the nominal {nominal} Hz")
+    samples = np.where(missing, MISSING, np.nan_to_num(deviation)).astype(np.int16)
+
+    os.makedirs(folder, exist_ok=True)
+    # Write both files under temporary names and move them into place, the
+    # metadata last, so readers never see a partial log
+    for extension, write in (('.npy', lambda f: np.save(f, samples)),
+                             ('.json', lambda f: f.write(json.dumps(
+                                 {"name": name, "nominal": nominal, "start": int(start)}).encode()))):
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, os.path.join(folder, name + extension))
+    return ReferenceLog(folder, name)
+
+
+def import_logs(folder, name, paths, nominal=None, start=None, period=REFERENCE_PERIOD,
+                dtype='float32'):
+    """
+    Import grid frequency logs (e.g. one file per day) as one reference log.
+
+    Args:
+        folder: Reference log folder
+        name: Name of the reference log, e.g. the grid it was recorded on
+        paths: Log files (see `read_log`); files without timestamps follow
+            each other from `start`
+        nominal: Grid frequency, guessed if not given
+
+    Returns:
+        The stored ReferenceLog
+    """
+    all_times, all_frequency = [], []
+    for path in paths:
+        times, frequency = read_log(path, start=start, period=period, dtype=dtype)
+        all_times.append(times)
+        all_frequency.append(frequency)
+        if start is not None and len(times):
+            start = times[-1] + period
+    grid_start, grid = to_grid(np.concatenate(all_times), np.concatenate(all_frequency))
+    return write_reference(folder, name, grid_start, grid, nominal=nominal)
+
+
+# === Matching ===
+
+def _window_sums(values, mask, length):
+    """Sums of `mask`, `values` and `values`**2 over every window of `length` samples"""
+    sums = []
+    for x in (mask, values, values * values):
+        cumulative = np.zeros(len(x) + 1)
+        np.cumsum(x, out=cumulative[1:])
+        sums.append(cumulative[length:] - cumulative[:-length])
+    return sums
+
+
+def normalized_xcorr(query, values, mask):
+    """
+    Normalized cross-correlation of `query` with every window of a reference.
+
+    The correlations are computed with FFTs and the window statistics with
+    cumulative sums, so the cost is O(n log n) in the reference length.
+    Samples the reference doesn't cover (`mask` False) are left out of the
+    window statistics.
+
+    Args:
+        query: Query samples (NaN samples are ignored)
+        values: Reference samples, 0 where missing
+        mask: Where the reference has samples
+
+    Returns:
+        Correlation (-1 to 1) at every offset where the query fits inside
+        the reference, NaN where the reference covers less than
+        MIN_COVERAGE of the window
+    """
+    m = len(query)
+    if len(values) < m or m < 2:
+        return np.zeros(0)
+    query = np.where(np.isfinite(query), query, np.nanmean(query))
+    query = query - query.mean()
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return np.full(len(values) - m + 1, np.nan)
+    query = query / norm
+
+    # scipy is imported here, not at module level: the app imports this
+    # module for DATABASE, and pages that don't analyze must not load scipy
+    from scipy import signal
+
+    numerator = signal.correlate(values, query, mode='valid', method='fft')
+    count, total, squares = _window_sums(values, mask, m)
+    if mask.all():
+        # The query has zero mean and unit norm over every window
+        query_sum, query_squares = 0.0, 1.0
+    else:
+        weights = mask.astype(np.float64)
+        query_sum = signal.correlate(weights, query, mode='valid', method='fft')
+        query_squares = signal.correlate(weights, query * query, mode='valid', method='fft')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = numerator - query_sum * total / count
+        variance = (query_squares - query_sum ** 2 / count) * (squares - total ** 2 / count)
+        ncc = covariance / np.sqrt(variance)
+    ncc[(count < MIN_COVERAGE * m) | ~(variance > 1e-18)] = np.nan
+    return np.clip(ncc, -1, 1)
+
+
+def _block_means(query, factor):
+    n_blocks = len(query) // factor
+    return np.nanmean(query[:n_blocks * factor].reshape(n_blocks, factor), axis=1)
+
+
+def detrend(values, mask, window=DETREND_SECONDS):
+    """Remove the moving average of the covered samples; 0 where `mask` is False"""
+    from scipy.ndimage import uniform_filter1d
+
+    weights = mask.astype(np.float64)
+    total = uniform_filter1d(values * weights, window, mode='nearest')
+    count = uniform_filter1d(weights, window, mode='nearest')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        trend = np.nan_to_num(total / count)
+    return np.where(mask, values - trend, 0.0)
+
+
+def detrend_trace(query):
+    """`detrend` for an ENF trace, which is NaN where it has no estimate"""
+    mask = np.isfinite(query)
+    return np.where(mask, detrend(np.nan_to_num(query), mask), np.nan)
+
+
+def _refine(detrended, log, offset, radius):
+    """
+    Best offset of a detrended trace in `log` within `radius` of `offset`,
+    with its correlation against the detrended log.
+    """
+    lo = max(0, offset - radius)
+    hi = min(len(log), offset + radius + len(detrended))
+    values, mask = log.deviations(lo, hi)
+    ncc = normalized_xcorr(detrended, detrend(values, mask), mask)
+    if len(ncc) == 0 or np.all(np.isnan(ncc)):
+        return offset, np.nan
+    best = int(np.nanargmax(ncc))
+    return lo + best, float(ncc[best])
+
+
+def search_log(query, log):
+    """
+    Find where an ENF trace (one sample per second) best matches a log.
+
+    Correlates block means of the trace with the log's block means to
+    find candidate offsets, then refines and scores each candidate on the
+    detrended trace and log at full resolution.
+
+    Args:
+        query: ENF deviation from the log's nominal frequency per second
+        log: ReferenceLog
+
+    Returns:
+        List of (offset in samples, correlation), best first, at least
+        half a query length apart
+    """
+    from scipy.signal import find_peaks
+
+    m = len(query)
+    factor = max(1, min(COARSE_FACTOR, m // COARSE_MIN_SAMPLES))
+    means, covered = log.coarse(factor)
+    coarse = normalized_xcorr(_block_means(query, factor), means, covered)
+    if len(coarse) == 0:
+        return []
+
+    scores = np.nan_to_num(coarse, nan=-1.0)
+    peaks, _ = find_peaks(np.concatenate([[-1.0], scores, [-1.0]]),
+                          distance=max(1, m // factor // 2))
+    peaks = peaks[np.argsort(scores[peaks - 1])[::-1][:COARSE_CANDIDATES]] - 1
+
+    # A coarse peak is within a block of the true offset
+    detrended = detrend_trace(query)
+    matches = [_refine(detrended, log, int(peak) * factor, 2 * factor) for peak in peaks]
+    matches = sorted((match for match in matches if np.isfinite(match[1])),
+                     key=lambda match: -match[1])
+    distinct = []
+    for offset, ncc in matches:
+        if all(abs(offset - other) >= m // 2 for other, _ in distinct):
+            distinct.append((offset, ncc))
+    return distinct
+
+
+def is_match(candidates):
+    """Whether the best of `search_log`'s candidates is a match"""
+    if not candidates:
+        return False
+    runner_up = candidates[1][1] if len(candidates) > 1 else 0.0
+    return candidates[0][1] >= MATCH_THRESHOLD and candidates[0][1] - runner_up >= MATCH_MARGIN
+
+
+def find_anchors(query, log):
+    """
+    Offsets (of the trace start) where the trace, or pieces of it, match a log.
+
+    Returns:
+        candidates: `search_log` candidates of the whole trace
+        anchors: List of (offset, correlation) of the matches, best first
+    """
+    candidates = search_log(query, log)
+    if is_match(candidates):
+        return candidates, [candidates[0]]
+    anchors = []
+    piece = min(MATCH_PIECE_SECONDS // REFERENCE_PERIOD, len(query) // 2)
+    if piece >= MATCH_MIN_SECONDS // REFERENCE_PERIOD:
+        # Half-overlapping pieces, so that one lies on either side of a splice
+        for start in range(0, len(query) - piece + 1, piece // 2):
+            found = search_log(query[start:start + piece], log)
+            if is_match(found):
+                anchors.append((found[0][0] - start, found[0][1]))
+    return candidates, sorted(anchors, key=lambda anchor: -anchor[1])
+
+
+def track_segments(detrended, log, anchors):
+    """
+    Align consecutive segments of a detrended ENF trace separately.
+
+    Each segment of SEGMENT_SECONDS is searched within
+    SEGMENT_SEARCH_SECONDS of where each anchor puts it.
+
+    Args:
+        detrended: Detrended ENF trace (see `detrend_trace`)
+        anchors: Offsets of the trace start (see `find_anchors`)
+
+    Returns:
+        List of (first trace sample, offset of the trace start implied by
+        the segment, correlation) per segment
+    """
+    segment = SEGMENT_SECONDS // REFERENCE_PERIOD
+    hop = SEGMENT_HOP_SECONDS // REFERENCE_PERIOD
+    radius = SEGMENT_SEARCH_SECONDS // REFERENCE_PERIOD
+    starts = list(range(0, len(detrended) - segment + 1, hop))
+    if starts and starts[-1] + segment < len(detrended):
+        starts.append(len(detrended) - segment)
+
+    segments = []
+    for start in starts:
+        found = [_refine(detrended[start:start + segment], log, anchor + start, radius)
+                 for anchor in anchors]
+        offset, ncc = max(found, key=lambda match: np.nan_to_num(match[1], nan=-1.0))
+        segments.append((start, offset - start, ncc))
+    return segments
+
+
+def change_point(detrended, log, before, after, first, stop):
+    """
+    Sample of the trace between `first` and `stop` from which the offset
+    `after` fits it better than the offset `before`.
+
+    Compares the squared error of the detrended trace under both
+    alignments and picks the split minimizing the total.
+    """
+    errors = []
+    for offset in (before, after):
+        lo = offset + first
+        if lo < 0:
+            return None
+        values, mask = log.deviations(lo, lo + stop - first)
+        if len(values) < stop - first:
+            return None
+        residual = np.where(mask, detrended[first:stop] - detrend(values, mask), 0.0)
+        errors.append(np.nan_to_num(residual ** 2))
+    cost = np.concatenate([[0], np.cumsum(errors[0])]) + \
+        np.concatenate([np.cumsum(errors[1][::-1])[::-1], [0]])
+    return first + int(np.argmin(cost))
+
+
+def reliable_runs(segments):
+    """
+    Group reliably matched segments (see `track_segments`) by offset.
+
+    Consecutive segments correlated at least SEGMENT_THRESHOLD whose offsets
+    agree within SHIFT_TOLERANCE_SECONDS of the run's median form a run;
+    runs of a single segment are dropped (a lone segment can match a
+    nearby look-alike) unless the trace has no more than two segments.
+
+    Returns:
+        List of (first trace sample of the first segment, first trace
+        sample of the last segment, median offset) per run
+    """
+    runs = []
+    for start, offset, ncc in segments:
+        if not ncc >= SEGMENT_THRESHOLD:
+            continue
+        if runs and abs(offset - np.median([o for _, o in runs[-1]])) <= SHIFT_TOLERANCE_SECONDS:
+            runs[-1].append((start, offset))
+        else:
+            runs.append([(start, offset)])
+    if len(segments) > 2:
+        runs = [run for run in runs if len(run) > 1]
+    return [(run[0][0], run[-1][0], int(round(np.median([o for _, o in run]))))
+            for run in runs]
+
+
+def find_discontinuities(detrended, log, runs):
+    """
+    Offset changes between runs of segments (see `reliable_runs`).
+
+    Returns:
+        List of (trace sample from which the new offset applies, offset
+        before, offset after)
+    """
+    discontinuities = []
+    for (_, last_start, before), (first_start, _, after) in zip(runs, runs[1:]):
+        if abs(after - before) <= SHIFT_TOLERANCE_SECONDS:
+            continue
+        stop = min(first_start + SEGMENT_SECONDS // REFERENCE_PERIOD, len(detrended))
+        sample = change_point(detrended, log, before, after, last_start, stop)
+        if sample is not None:
+            discontinuities.append((min(sample, len(detrended) - 1), before, after))
+    return discontinuities
+
+
+def _json_number(value, digits=None):
+    """`value` as a float for JSON output, or None if it isn't finite"""
+    value = float(value)
+    if not np.isfinite(value):
+        return None
+    return round(value, digits) if digits is not None else value
+
+
+def match_trace(traces, logs=None):
+    """
+    Match per-second ENF traces against the reference logs.
+
+    Args:
+        traces: Dictionary of nominal frequency to fine ENF trace (see
+            `enf.extract_fine_enf_trace`); each log is searched with the
+            trace at its nominal frequency
+        logs: Reference logs to search; all of DATABASE by default
+
+    Returns:
+        Dictionary with the searched `logs`, the best whole-trace
+        `candidates` (reference, start time, correlation), whether the
+        recording was `matched` and, if so, the `reference` and `start`
+        time of the best match, the alignment of each segment and the
+        `discontinuities` in it (time in the recording and `shift`, the
+        seconds of the reference skipped there; negative if the recording
+        repeats or inserts time). `trace` has the per-second mismatch
+        between the trace and the log under the best match. Correlations
+        and mismatches the log or trace doesn't cover are None, so the
+        result is valid JSON.
+    """
+    if logs is None:
+        logs = DATABASE.logs()
+    searched = []
+    for log in logs:
+        trace = traces.get(log.nominal)
+        if trace is None or len(trace["frequency"]) * REFERENCE_PERIOD < MATCH_MIN_SECONDS:
+            continue
+        query = np.asarray(trace["frequency"]) - log.nominal
+        candidates, anchors = find_anchors(query, log)
+        searched.append((log, trace, query, candidates, anchors))
+
+    def start_time(log, trace, offset):
+        # Trace sample 0 is the window centred at trace["times"][0]
+        return format_timestamp(log.start + offset * REFERENCE_PERIOD - trace["times"][0])
+
+    candidates = sorted(((ncc, log, offset, trace)
+                         for log, trace, _, found, _ in searched
+                         for offset, ncc in found[:MATCH_CANDIDATES]),
+                        key=lambda candidate: -candidate[0])[:MATCH_CANDIDATES]
+    result = {
+        "logs": [log.name for log in logs],
+        "candidates": [
+            {"reference": log.name, "start": start_time(log, trace, offset),
+             "correlation": _json_number(ncc, 4)}
+            for ncc, log, offset, trace in candidates
+        ],
+        "matched": False,
+        "segments": [],
+        "discontinuities": [],
+        "trace": {"times": [], "mismatch": []},
+    }
+    matches = [entry for entry in searched if entry[4]]
+    if not matches:
+        return result
+
+    log, trace, query, _, anchors = max(matches, key=lambda entry: entry[4][0][1])
+    times = np.asarray(trace["times"])
+    detrended = detrend_trace(query)
+    segments = track_segments(detrended, log, [offset for offset, _ in anchors])
+    runs = reliable_runs(segments)
+    discontinuities = find_discontinuities(detrended, log, runs)
+    # The recording starts where its first run of segments puts it
+    offset = runs[0][2] if runs else anchors[0][0]
+
+    result.update(
+        matched=True,
+        reference=log.name,
+        nominal=log.nominal,
+        start=start_time(log, trace, offset),
+        correlation=_json_number(anchors[0][1], 4),
+        segments=[
+            {"time": float(times[start]), "start": start_time(log, trace, segment_offset),
+             "correlation": _json_number(ncc, 4)}
+            for start, segment_offset, ncc in segments
+        ],
+        discontinuities=[
+            # The new offset applies from between two trace samples
+            {"time": round(float(times[sample]) - REFERENCE_PERIOD / 2, 2),
+             "shift": int(after - before) * REFERENCE_PERIOD}
+            for sample, before, after in discontinuities
+        ],
+    )
+
+    # Mismatch against the alignment that holds at each point
+    mismatch = np.full(len(query), np.nan)
+    bounds = [0] + [sample for sample, _, _ in discontinuities] + [len(query)]
+    offsets = [discontinuities[0][1] if discontinuities else offset] + \
+        [after for _, _, after in discontinuities]
+    for first, stop, piece_offset in zip(bounds, bounds[1:], offsets):
+        lo = piece_offset + first
+        values, mask = log.deviations(max(lo, 0), max(lo + stop - first, 0))
+        if len(values) == stop - first:
+            mismatch[first:stop] = np.where(mask, np.abs(detrended[first:stop]
+                                                          - detrend(values, mask)), np.nan)
+    result["trace"] = {"times": times.tolist(),
+                       "mismatch": [_json_number(value) for value in mismatch]}
+    return result
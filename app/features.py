@@ -0,0 +1,171 @@
+import time
+import threading
+
+import numpy as np
+import librosa
+
+from .enf import extract_enf_trace, extract_fine_enf_trace
+from .multirate import cascade_source, resample
+
+# STFT parameters shared by every consumer of the store (librosa defaults,
+# which is what the spectrogram plot and the MFCC pipeline always used)
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 13
+
+
+def resampled_stft_parameters(sr, native_sr, win_length=N_FFT, hop_length=HOP_LENGTH):
+    """
+    STFT parameters at `sr` whose frames last as long, in seconds, as
+    frames of `win_length` samples at `native_sr`.
+
+    Returns:
+        n_fft: FFT size, the window length rounded up to a power of two
+        hop_length: Hop in samples
+        win_length: Window length in samples
+    """
+    win_length = max(1, round(win_length * sr / native_sr))
+    hop_length = max(1, round(hop_length * sr / native_sr))
+    return 1 << (win_length - 1).bit_length(), hop_length, win_length
+
+
+class FeatureStore:
+    """
+    Per-analysis cache of the spectral features of a single recording.
+
+    Every feature is computed lazily on first access and memoized, so the
+    detectors and plots that share a store only pay for one spectral
+    decomposition of the signal. The store is thread-safe: concurrent
+    requests for the same feature wait for a single computation.
+
+    The time spent computing each kind of feature is kept in `timings`,
+    excluding the features it was derived from. Stores of the same signal
+    at a lower rate (see `at_rate`) add to the timings of the native one.
+
+    Args:
+        y: Audio time series
+        sr: Sample rate of `y`
+        n_fft: STFT frame length in samples
+        hop_length: STFT hop in samples
+        win_length: STFT window length in samples, zero-padded to `n_fft`
+            (defaults to `n_fft`)
+        parent: Store of the same signal at a higher rate, whose timings
+            this store's timings go to
+    """
+
+    def __init__(self, y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, win_length=None, parent=None):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.win_length = win_length or n_fft
+        self._cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        if parent is None:
+            self._nested = threading.local()
+            self._timings_lock = threading.Lock()
+            self.timings = {}
+        else:
+            self._nested = parent._nested
+            self._timings_lock = parent._timings_lock
+            self.timings = parent.timings
+
+    def _get(self, key, compute):
+        """Return the cached value for `key`, computing it on first use"""
+        if key in self._cache:
+            return self._cache[key]
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._cache:
+                self._cache[key] = self._timed(key, compute)
+        return self._cache[key]
+
+    def _timed(self, key, compute):
+        """Run `compute`, adding its own time (less nested features) to `timings`"""
+        stack = self._nested.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return compute()
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            name = key if isinstance(key, str) else key[0]
+            with self._timings_lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed - nested
+
+    def at_rate(self, sr):
+        """
+        Store of the signal resampled to `sr` (never above the native rate).
+
+        Lower rates are decimated through the cascade of
+        `multirate.CASCADE_RATES`, each from the next higher one, so a
+        detector working on a narrow band pays for transforms of only as
+        many samples as it needs. The STFT frames of the resampled store
+        last as long as those of this one (see `resampled_stft_parameters`),
+        so frame-based features keep their time and frequency resolution
+        below the new Nyquist frequency.
+        """
+        if sr >= self.sr:
+            return self
+
+        def compute():
+            source = self.at_rate(cascade_source(self.sr, sr))
+            n_fft, hop_length, win_length = resampled_stft_parameters(
+                sr, self.sr, self.win_length, self.hop_length)
+            return FeatureStore(resample(source.y, source.sr, sr), sr, n_fft=n_fft,
+                                hop_length=hop_length, win_length=win_length, parent=self)
+        return self._get(('resample', sr), compute)
+
+    @property
+    def stft_magnitude(self):
+        """Magnitude of the short-time Fourier transform"""
+        return self._get('stft_magnitude', lambda: np.abs(
+            librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length,
+                         win_length=self.win_length)))
+
+    @property
+    def power_spectrogram(self):
+        """Squared STFT magnitude"""
+        return self._get('power_spectrogram', lambda: self.stft_magnitude ** 2)
+
+    @property
+    def spectrogram_db(self):
+        """STFT magnitude in dB relative to the peak, as used for display"""
+        return self._get('spectrogram_db', lambda: librosa.amplitude_to_db(
+            self.stft_magnitude, ref=np.max))
+
+    @property
+    def mel_spectrogram(self):
+        """Mel-scaled power spectrogram"""
+        return self._get('mel_spectrogram', lambda: librosa.feature.melspectrogram(
+            S=self.power_spectrogram, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    @property
+    def mfcc(self):
+        """Mel-frequency cepstral coefficients"""
+        return self._get('mfcc', lambda: librosa.feature.mfcc(
+            S=librosa.power_to_db(self.mel_spectrogram), sr=self.sr, n_mfcc=N_MFCC))
+
+    def band_energy(self, fmin, fmax):
+        """Per-frame energy of the STFT bins between `fmin` and `fmax` Hz"""
+        def compute():
+            freqs = librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft)
+            mask = (freqs >= fmin) & (freqs <= fmax)
+            return np.sum(self.power_spectrogram[mask], axis=0)
+        return self._get(('band_energy', fmin, fmax), compute)
+
+    def enf_trace(self, window_length, hop_length, fmin, fmax):
+        """Per-window ENF frequency and band power (see `extract_enf_trace`)"""
+        return self._get(('enf_trace', window_length, hop_length, fmin, fmax),
+                         lambda: extract_enf_trace(self.y, self.sr, window_length,
+                                                   hop_length, fmin, fmax))
+
+    def fine_enf_trace(self, nominal):
+        """Per-second ENF frequency around `nominal` Hz (see `extract_fine_enf_trace`)"""
+        return self._get(('fine_enf_trace', nominal),
+                         lambda: extract_fine_enf_trace(self.y, self.sr, nominal))
@@ -0,0 +1,76 @@
+import functools
+
+import numpy as np
+from scipy import signal
+
+
+@functools.lru_cache(maxsize=32)
+def butter_highpass(sr, cutoff, order):
+    """
+    Butterworth high-pass filter as second-order sections.
+
+    Designs are cached per (sample rate, cutoff, order), so repeated
+    analyses don't redesign the same filter. Second-order sections stay
+    numerically stable where the (b, a) form loses precision, e.g. at high
+    sample rates or in float32.
+
+    Returns:
+        Read-only SOS array of shape (n_sections, 6)
+    """
+    sos = signal.butter(order, cutoff / (sr / 2), 'highpass', output='sos')
+    sos.setflags(write=False)
+    return sos
+
+
+def _working_dtype(x):
+    """float32 signals are filtered in float32; anything else in float64"""
+    return np.float32 if np.asarray(x).dtype == np.float32 else np.float64
+
+
+def zero_phase_filter(sos, x):
+    """
+    Filter forwards and backwards with `sosfiltfilt`, keeping float32 input
+    in float32.
+
+    Edges are padded like `signal.filtfilt` with the equivalent (b, a)
+    filter, so the output matches the former implementation up to rounding.
+    """
+    dtype = _working_dtype(x)
+    return signal.sosfiltfilt(sos.astype(dtype), np.asarray(x, dtype=dtype))
+
+
+def highpass(y, sr, cutoff, order):
+    """Zero-phase Butterworth high-pass of a whole signal"""
+    return zero_phase_filter(butter_highpass(sr, cutoff, order), y)
+
+
+class CausalFilter:
+    """
+    Streaming (causal) SOS filter that carries its state across blocks.
+
+    Filtering a signal block by block gives exactly the same output as one
+    `sosfilt` call over the concatenated signal. The state is initialized to
+    the steady-state response to the first sample, so a DC offset at the
+    start of a stream doesn't ring. Unlike `zero_phase_filter` the output
+    has the filter's phase response; use it where only one pass over the
+    data is possible and a phase shift is acceptable.
+
+    Args:
+        sos: Second-order sections, e.g. from `butter_highpass`
+        dtype: Sample type the filter runs in
+    """
+
+    def __init__(self, sos, dtype=np.float32):
+        self.dtype = dtype
+        self.sos = np.asarray(sos).astype(dtype)
+        self.zi = None
+
+    def push(self, block):
+        """Filter the next block of samples"""
+        block = np.asarray(block, dtype=self.dtype)
+        if len(block) == 0:
+            return block
+        if self.zi is None:
+            self.zi = (signal.sosfilt_zi(self.sos) * block[0]).astype(self.dtype)
+        filtered, self.zi = signal.sosfilt(self.sos, block, zi=self.zi)
+        return filtered
@@ -0,0 +1,222 @@
+import re
+import json
+import time
+import uuid
+import sqlite3
+
+from .cache import ResultCache, json_default
+from .detectors import selection_key
+
+# Analyses are listed newest first by their rowid, so a page is one range
+# scan however long the history grows; the verdict and file lookups are
+# served from covering indexes without touching the table. Results are
+# stored once per cache key, however often the same file is analyzed.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    duration REAL NOT NULL,
+    sample_rate INTEGER NOT NULL,
+    forgery_detected INTEGER NOT NULL,
+    confidence INTEGER NOT NULL,
+    detectors TEXT NOT NULL,
+    scores TEXT NOT NULL,
+    timings TEXT NOT NULL,
+    result_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_verdict ON analyses (
+    forgery_detected, id, token, created_at, sha256, filename, duration, sample_rate, confidence);
+CREATE INDEX IF NOT EXISTS analyses_sha256 ON analyses (
+    sha256, id, token, created_at, filename, duration, sample_rate, forgery_detected, confidence);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL
+);
+"""
+
+# Columns of a history listing; all of them are in both covering indexes
+LISTING_COLUMNS = ('id', 'token', 'created_at', 'sha256', 'filename', 'duration',
+                   'sample_rate', 'forgery_detected', 'confidence')
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Verdict filter values of a history request
+VERDICTS = {'forgery': True, 'authentic': False}
+
+SHA256_RE = re.compile(r'[0-9a-fA-F]{64}')
+
+
+def _connect(db_path):
+    """Open the history database, creating the schema if needed"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class AnalysisHistory:
+    """
+    Every completed analysis, persisted in SQLite.
+
+    Each analysis gets a random token for its permalink; the result itself
+    is stored under its result cache key, so re-opening an analysis never
+    recomputes it, even after the cache entry was evicted.
+
+    Args:
+        db_path: Path of the SQLite database file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        _connect(db_path).close()
+
+    def record(self, digest, filename, result, detectors=None):
+        """
+        Store a completed analysis.
+
+        Args:
+            digest: SHA-256 of the audio
+            filename: Name the file was uploaded as
+            result: Result of `analyze_audio_file` (without an error)
+            detectors: Analysis profile or detector names it ran with
+
+        Returns:
+            The token of the new history entry
+        """
+        result_key = ResultCache.key(digest, detectors)
+        token = uuid.uuid4().hex
+        conn = _connect(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute("INSERT OR IGNORE INTO results (key, result) VALUES (?, ?)",
+                         (result_key, json.dumps(result, default=json_default)))
+            conn.execute(
+                "INSERT INTO analyses (token, created_at, sha256, filename, duration, sample_rate, "
+                "forgery_detected, confidence, detectors, scores, timings, result_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (token, time.time(), digest, filename, result["duration"], result["sample_rate"],
+                 int(result["forgery_detected"]), result["confidence"], selection_key(detectors),
+                 json.dumps(result.get("scores", {}), default=json_default),
+                 json.dumps(result.get("timings", {}), default=json_default), result_key))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return token
+
+    def get(self, token):
+        """Return the analysis with its stored result as a dictionary, or None"""
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT analyses.*, results.result FROM analyses "
+                "JOIN results ON results.key = analyses.result_key WHERE token = ?",
+                (token,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+
+        analysis = dict(row)
+        analysis["forgery_detected"] = bool(analysis["forgery_detected"])
+        for key in ("scores", "timings", "result"):
+            analysis[key] = json.loads(analysis[key])
+        return analysis
+
+    def page(self, before=None, after=None, limit=PAGE_SIZE, forgery_detected=None, sha256=None):
+        """
+        One page of the history, newest first, by keyset pagination.
+
+        Pages are anchored on analysis ids rather than offsets, so each one
+        costs the same however deep into the history it is.
+
+        Args:
+            before: Return the analyses older than this id
+            after: Return the analyses newer than this id
+            limit: Page size, at most MAX_PAGE_SIZE
+            forgery_detected: Only analyses with this verdict
+            sha256: Only analyses of the file with this digest
+
+        Returns:
+            Dictionary with the `analyses` of the page and the `before` and
+            `after` ids of the next older and newer pages (None at either end)
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions, params = [], []
+        if sha256 is not None:
+            conditions.append("sha256 = ?")
+            params.append(sha256)
+        if forgery_detected is not None:
+            conditions.append("forgery_detected = ?")
+            params.append(int(forgery_detected))
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(int(after))
+        elif before is not None:
+            conditions.append("id < ?")
+            params.append(int(before))
+
+        # Newer pages are read upwards from the anchor, then reversed
+        order = 'ASC' if after is not None else 'DESC'
+        query = (f"SELECT {', '.join(LISTING_COLUMNS)} FROM analyses "
+                 f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+                 f"ORDER BY id {order} LIMIT ?")
+        conn = _connect(self.db_path)
+        try:
+            rows = [dict(row) for row in conn.execute(query, (*params, limit + 1))]
+        finally:
+            conn.close()
+
+        more = len(rows) > limit
+        if after is not None and not more:
+            # Fewer than a page of newer analyses left: show the newest page
+            return self.page(limit=limit, forgery_detected=forgery_detected, sha256=sha256)
+        rows = rows[:limit]
+        if after is not None:
+            rows.reverse()
+        for row in rows:
+            row["forgery_detected"] = bool(row["forgery_detected"])
+
+        # The extra row tells whether there are analyses beyond the far end
+        # of the page; the anchor is beyond its near end
+        older = more if after is None else True
+        newer = more if after is not None else before is not None
+        return {
+            "analyses": rows,
+            "before": rows[-1]["id"] if rows and older else None,
+            "after": rows[0]["id"] if rows and newer else None,
+        }
+
+
+def request_page(args):
+    """
+    History page arguments of a web request: `before` or `after` (analysis
+    ids), `limit`, `verdict` ('forgery' or 'authentic') and `sha256`.
+
+    Returns:
+        Keyword arguments for `AnalysisHistory.page`
+
+    Raises:
+        ValueError: For malformed arguments
+    """
+    page = {}
+    for name in ('before', 'after', 'limit'):
+        if args.get(name):
+            try:
+                page[name] = int(args[name])
+            except ValueError:
+                raise ValueError(f"'{name}' must be an integer") from None
+    verdict = args.get('verdict')
+    if verdict:
+        if verdict not in VERDICTS:
+            raise ValueError(f"'verdict' must be one of {', '.join(VERDICTS)}")
+        page["forgery_detected"] = VERDICTS[verdict]
+    if args.get('sha256'):
+        if not SHA256_RE.fullmatch(args['sha256']):
+            raise ValueError("'sha256' must be a hex SHA-256 digest")
+        page["sha256"] = args['sha256'].lower()
+    return page
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import json_default
+from . import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    plots TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted_at);
+"""
+
+PENDING_STATUSES = ('queued', 'running')
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+def _connect(db_path):
+    """Open the job database, creating the schema if needed"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _run_job(db_path, job_id, file_path, cache=None, cache_key=None, detectors=None,
+             history=None):
+    """Analyze one queued file inside a pool process and store the outcome"""
+    from .audio_analysis import analyze_audio_file
+
+    conn = _connect(db_path)
+    try:
+        started_at = time.time()
+        conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                     (started_at, job_id))
+        submitted_at = conn.execute("SELECT submitted_at FROM jobs WHERE id = ?",
+                                    (job_id,)).fetchone()[0]
+        metrics.observe('audio_forensics_queue_wait_seconds', started_at - submitted_at)
+        try:
+            result, plots = analyze_audio_file(file_path, include_plots=False,
+                                               detectors=detectors)
+        except Exception as e:
+            result, plots = {"error": f"Error analyzing audio file: {str(e)}"}, {}
+
+        if "error" in result:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                (time.time(), result["error"], job_id))
+        else:
+            if cache is not None and cache_key is not None:
+                cache.put(cache_key, result, plots)
+            if history is not None:
+                # Uploads are stored under their content digest
+                digest = os.path.splitext(os.path.basename(file_path))[0]
+                filename = conn.execute("SELECT filename FROM jobs WHERE id = ?",
+                                        (job_id,)).fetchone()[0]
+                history.record(digest, filename, result, detectors)
+            conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, result = ?, plots = ? WHERE id = ?",
+                (time.time(), json.dumps(result, default=json_default),
+                 json.dumps(plots), job_id))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """
+    Local analysis queue backed by SQLite and a process pool.
+
+    Job state lives in SQLite, so every gunicorn worker sees the same jobs
+    and the same backpressure limit; the analysis itself runs in a process
+    pool owned by the worker that accepted the upload.
+
+    Args:
+        db_path: Path of the SQLite database file
+        max_workers: Number of analysis processes per web worker
+        max_queued: Maximum number of queued or running jobs
+        cache: Optional ResultCache that finished analyses are stored in
+        history: Optional AnalysisHistory that finished analyses are
+            recorded in
+        job_timeout: Seconds after which an unfinished job no longer
+            counts towards `max_queued` (e.g. its worker was killed)
+    """
+
+    def __init__(self, db_path, max_workers=2, max_queued=16, cache=None, history=None,
+                 job_timeout=3600):
+        self.db_path = db_path
+        self.cache = cache
+        self.history = history
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.job_timeout = job_timeout
+        self._executor = None
+        self._executor_pid = None
+        _connect(db_path).close()
+
+    def _get_executor(self):
+        """Create the process pool lazily, once per (forked) web worker"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, file_path, filename, cache_key=None, detectors=None):
+        """
+        Queue a file for analysis.
+
+        When `cache_key` is given, the finished analysis is also stored in
+        the result cache under that key. `detectors` selects the detectors
+        to run, as for `analyze_audio_file`.
+
+        Returns:
+            The new job id
+
+        Raises:
+            QueueFullError: If `max_queued` jobs are already pending
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = _connect(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?) AND submitted_at > ?",
+                (*PENDING_STATUSES, now - self.job_timeout)).fetchone()[0]
+            if pending >= self.max_queued:
+                conn.execute('ROLLBACK')
+                raise QueueFullError(f"{pending} analysis jobs already pending")
+            conn.execute(
+                "INSERT INTO jobs (id, filename, file_path, status, submitted_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, filename, file_path, now))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+        self._get_executor().submit(_run_job, self.db_path, job_id, file_path,
+                                    self.cache, cache_key, detectors, self.history)
+        return job_id
+
+    def run(self, fn, *args):
+        """
+        Run `fn(*args)` in the analysis pool without recording a job, for
+        background work such as building tile pyramids.
+
+        Returns:
+            A concurrent.futures.Future
+        """
+        return self._get_executor().submit(fn, *args)
+
+    def pending_files(self):
+        """Paths of the files that queued or running jobs still need"""
+        conn = _connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT file_path FROM jobs WHERE status IN (?, ?)",
+                                PENDING_STATUSES).fetchall()
+        finally:
+            conn.close()
+        return {row["file_path"] for row in rows}
+
+    def get(self, job_id):
+        """Return the job as a dictionary, or None if it does not exist"""
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["plots"] = json.loads(job["plots"]) if job["plots"] else None
+
+        # Per-job timing
+        job["queue_wait"] = (job["started_at"] or time.time()) - job["submitted_at"]
+        job["run_time"] = ((job["finished_at"] or time.time()) - job["started_at"]
+                           if job["started_at"] else None)
+        return job
@@ -0,0 +1,164 @@
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+from scipy.signal import find_peaks
+
+# Time resolution of the fused suspicion curve
+RESOLUTION_SECONDS = 0.1
+
+# Window of the rolling median/MAD baseline each cue is compared against
+BASELINE_SECONDS = 20
+
+# Fused robust z-score a peak must reach, and z-score at which a single
+# cue counts as supporting evidence for it
+PEAK_THRESHOLD = 6.0
+CUE_THRESHOLD = 3.0
+
+MIN_SEPARATION_SECONDS = 1.0
+MAX_SPLICES = 10
+
+# Frames at the very start and end see the STFT padding, and an edit there
+# is indistinguishable from the recording boundary
+EDGE_SECONDS = 0.5
+
+# Cues with fewer samples than this have no meaningful baseline
+MIN_CUE_SAMPLES = 8
+
+# Normal-consistent scale factor for the median absolute deviation
+MAD_SCALE = 1.4826
+
+
+def rolling_median(values, window):
+    """
+    Approximate rolling median in O(n).
+
+    Medians are taken over consecutive blocks of `window` samples (with a
+    linear-time partition, not a sort) and linearly interpolated between
+    block centres, so the baseline follows slow drift but ignores short
+    spikes.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    window = int(min(max(1, window), n))
+    n_blocks = int(np.ceil(n / window))
+    padded = np.full(n_blocks * window, np.nan)
+    padded[:n] = values
+    medians = np.nanmedian(padded.reshape(n_blocks, window), axis=1)
+    centres = np.minimum(np.arange(n_blocks) * window + (window - 1) / 2, n - 1)
+    return np.interp(np.arange(n), centres, medians)
+
+
+def robust_zscore(values, window):
+    """Deviation from a rolling median in units of the rolling MAD"""
+    values = np.asarray(values, dtype=float)
+    values = np.where(np.isfinite(values), values, np.nanmedian(values))
+    baseline = rolling_median(values, window)
+    deviation = values - baseline
+    scale = MAD_SCALE * rolling_median(np.abs(deviation), window)
+    # Flat stretches have zero MAD; don't let them turn noise into spikes
+    floor = max(0.1 * np.median(scale), np.finfo(float).eps)
+    return deviation / np.maximum(scale, floor)
+
+
+def _step(times, values, offset):
+    """
+    Log-ratio between windows `offset` apart, placed at their boundary.
+
+    With half-overlapping windows `offset=2` compares adjacent
+    non-overlapping windows, so a level change shows as one step rather
+    than a ramp.
+    """
+    values = np.log(np.maximum(np.asarray(values, dtype=float), np.finfo(float).tiny))
+    times = np.asarray(times, dtype=float)
+    if len(values) <= offset:
+        return times[:0], values[:0]
+    return (times[offset:] + times[:-offset]) / 2, np.abs(values[offset:] - values[:-offset])
+
+
+def spectral_cue(trace):
+    """Splice cue of the spectral discontinuity trace: the MFCC change itself"""
+    return {"spectral": (np.asarray(trace["times"], dtype=float),
+                         np.asarray(trace["values"], dtype=float))}
+
+
+def noise_level_cue(trace):
+    """
+    Splice cue of the noise level trace: steps in the level.
+
+    Each step spans three of the half-overlapping segments, so in a
+    recording only a few segments long a single splice makes up half the
+    cue and swamps its baseline. When the trace is too short for
+    MIN_CUE_SAMPLES steps, its finer `short` version is used instead, if
+    the trace has one.
+    """
+    times, values = trace["times"], trace["values"]
+    if len(values) - 2 < MIN_CUE_SAMPLES and "short" in trace:
+        times, values = trace["short"]["times"], trace["short"]["values"]
+    return {"noise_level": _step(times, values, 2)}
+
+
+def enf_cue(trace):
+    """Splice cue of the ENF trace: excursions from the nominal frequency"""
+    if not len(trace["times"]):
+        return {}
+    # A splice breaks the hum phase, which shows as a frequency excursion
+    frequency = np.asarray(trace["frequency"], dtype=float)
+    return {"enf": (np.asarray(trace["times"], dtype=float),
+                    np.abs(frequency - np.nanmedian(frequency)))}
+
+
+def localize_splices(cues, duration, resolution=RESOLUTION_SECONDS):
+    """
+    Fuse change cues into one suspicion curve and pick splice candidates.
+
+    Each cue is scored against its own rolling median/MAD baseline, so a
+    recording that is noisier or more varied in one part doesn't flood
+    that part with detections. The scores are put on a common time grid
+    (each cue held over its own sampling interval), summed and
+    peak-picked. Every step is linear in the length of the traces.
+
+    Args:
+        cues: Dictionary of cue name to (times, values), where larger
+            values mean a more abrupt change at that time
+        duration: Recording length in seconds
+        resolution: Grid spacing in seconds
+
+    Returns:
+        List of candidate splices, strongest first, each a dictionary with
+        `time` (seconds), `score` (fused robust z-score) and `cues` (names
+        of the cues that individually support it)
+    """
+    n_bins = int(np.ceil(duration / resolution)) + 1
+    fused = np.zeros(n_bins)
+    per_cue = {}
+
+    for name, (times, values) in cues.items():
+        if len(values) < MIN_CUE_SAMPLES:
+            continue
+        spacing = np.median(np.diff(times))
+        zscores = np.clip(robust_zscore(values, BASELINE_SECONDS / spacing), 0, None)
+
+        grid = np.zeros(n_bins)
+        index = np.clip((times / resolution).astype(int), 0, n_bins - 1)
+        np.maximum.at(grid, index, zscores)
+        grid = maximum_filter1d(grid, size=max(1, int(round(spacing / resolution))))
+
+        per_cue[name] = grid
+        fused += grid
+
+    edge = int(round(EDGE_SECONDS / resolution))
+    fused[:edge] = 0
+    fused[max(edge, n_bins - 1 - edge):] = 0
+
+    peaks, properties = find_peaks(
+        fused, height=PEAK_THRESHOLD,
+        distance=max(1, int(round(MIN_SEPARATION_SECONDS / resolution))))
+    order = np.argsort(properties["peak_heights"])[::-1][:MAX_SPLICES]
+
+    return [
+        {
+            "time": round(float((peaks[i] + 0.5) * resolution), 2),
+            "score": round(float(properties["peak_heights"][i]), 2),
+            "cues": [name for name, grid in per_cue.items() if grid[peaks[i]] >= CUE_THRESHOLD],
+        }
+        for i in order
+    ]
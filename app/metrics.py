@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import bisect
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+INPUT_DURATION_BUCKETS = (1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200, 14400)
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+STARTUP_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+# Minimum seconds between two writes of a process's values file; updates
+# in between are written together by a timer
+FLUSH_INTERVAL = 1.0
+
+# Values of the processes that have exited, merged into one file
+AGGREGATE_FILE = 'dead.json'
+AGGREGATE_LOCK = 'dead.lock'
+
+# Name: (type, help text, histogram buckets)
+METRICS = {
+    'audio_forensics_analyses_total': (
+        'counter', 'Analyses run, by mode and outcome', None),
+    'audio_forensics_stage_seconds': (
+        'histogram', 'Wall time of each analysis stage', STAGE_BUCKETS),
+    'audio_forensics_input_duration_seconds': (
+        'histogram', 'Duration of the analyzed recordings', INPUT_DURATION_BUCKETS),
+    'audio_forensics_input_sample_rate_total': (
+        'counter', 'Analyzed recordings by sample rate', None),
+    'audio_forensics_queue_wait_seconds': (
+        'histogram', 'Time background jobs waited before starting', QUEUE_WAIT_BUCKETS),
+    'audio_forensics_cache_lookups_total': (
+        'counter', 'Result cache lookups by outcome', None),
+    'audio_forensics_plot_render_seconds': (
+        'histogram', 'Time to render a plot image on first request', STAGE_BUCKETS),
+    'audio_forensics_startup_seconds': (
+        'histogram', 'Time from process start until it accepts requests, and its warm-up',
+        STARTUP_BUCKETS),
+}
+
+
+class Registry:
+    """
+    Counters and histograms of one process, exported in the Prometheus text
+    format.
+
+    Gunicorn workers and job pool processes each keep their own values.
+    When a folder is configured every process also writes its values to its
+    own file there (at most every FLUSH_INTERVAL seconds), and `render` adds
+    up the files of all processes, so whichever worker answers a scrape
+    reports the totals. As with prometheus_client's multiprocess mode, the
+    files of processes that have exited are merged into one aggregate file
+    (see `mark_process_dead`), so restarted workers don't leave files
+    behind and a reused pid never overwrites an earlier process's values.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # A forked child starts counting from zero under its own pid
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {}
+        self._histograms = {}
+        # Unique to this process, even if its pid is reused later
+        self._file = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        self._flush_lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._timer = None
+
+    def configure(self, folder):
+        """Share values with the other processes through `folder`"""
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+
+    def inc(self, name, value=1, **labels):
+        """Add `value` to a counter"""
+        if getattr(self._local, 'muted', False):
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._flush()
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram"""
+        if getattr(self._local, 'muted', False):
+            return
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self._lock:
+            counts, total = self._histograms.get(key, ([0] * (len(buckets) + 1), 0.0))
+            counts[bisect.bisect_left(buckets, value)] += 1
+            self._histograms[key] = (counts, total + value)
+        self._flush()
+
+    def snapshot(self):
+        """Values of this process as JSON-serializable lists"""
+        with self._lock:
+            return _snapshot(self._counters, self._histograms)
+
+    @contextmanager
+    def batch(self):
+        """Write the shared file once after several updates rather than after each"""
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        try:
+            yield self
+        finally:
+            self._local.depth = depth
+            self._flush(force=True)
+
+    @contextmanager
+    def muted(self):
+        """Ignore the updates made by this thread, e.g. by synthetic warm-up analyses"""
+        muted = getattr(self._local, 'muted', False)
+        self._local.muted = True
+        try:
+            yield self
+        finally:
+            self._local.muted = muted
+
+    def _flush(self, force=False):
+        if self.folder is None or getattr(self._local, 'depth', 0):
+            return
+        with self._flush_lock:
+            if not force and time.monotonic() - self._flushed_at < FLUSH_INTERVAL:
+                if self._timer is None:
+                    self._timer = threading.Timer(FLUSH_INTERVAL, self._flush, kwargs={'force': True})
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._flushed_at = time.monotonic()
+            _write_json(os.path.join(self.folder, self._file), self.snapshot())
+
+    def mark_process_dead(self, pid):
+        """
+        Merge the values of an exited process into the aggregate file and
+        remove its own file. Called from gunicorn's `child_exit` hook.
+        """
+        self._merge_dead(lambda file_pid: file_pid == pid)
+
+    def _merge_dead(self, is_dead):
+        """Merge the files of the processes `is_dead(pid)` into the aggregate file"""
+        if self.folder is None:
+            return
+
+        def dead_files():
+            return [entry.path for entry in os.scandir(self.folder)
+                    if entry.name.endswith('.json') and entry.name not in (AGGREGATE_FILE, self._file)
+                    and _file_pid(entry.name) is not None and is_dead(_file_pid(entry.name))]
+
+        if not dead_files():
+            return
+        with open(os.path.join(self.folder, AGGREGATE_LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have merged them while we waited
+            paths = dead_files()
+            snapshots = _load_snapshots(paths + [os.path.join(self.folder, AGGREGATE_FILE)])
+            counters, histograms = _merge(snapshots)
+            _write_json(os.path.join(self.folder, AGGREGATE_FILE), _snapshot(counters, histograms))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _snapshots(self):
+        """Snapshots of this process and of every other process sharing the folder"""
+        snapshots = [self.snapshot()]
+        if self.folder is None:
+            return snapshots
+        # Job pool processes exit without gunicorn noticing
+        self._merge_dead(lambda pid: not _alive(pid))
+        snapshots += _load_snapshots([entry.path for entry in os.scandir(self.folder)
+                                      if entry.name.endswith('.json') and entry.name != self._file])
+        return snapshots
+
+    def render(self):
+        """All metrics, summed over processes, in the Prometheus text format"""
+        counters, histograms = _merge(self._snapshots())
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(snapshots):
+    """Sum snapshots into {(name, labels): value} and {(name, labels): (counts, total)}"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total in snapshot["histograms"]:
+            key = (name, tuple(sorted(labels.items())))
+            merged_counts, merged_total = histograms.get(key, ([0] * len(counts), 0.0))
+            histograms[key] = ([a + b for a, b in zip(merged_counts, counts)],
+                               merged_total + total)
+    return counters, histograms
+
+
+def _snapshot(counters, histograms):
+    """Inverse of `_merge`, in the format of `Registry.snapshot`"""
+    return {
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, dict(labels), list(counts), total]
+                       for (name, labels), (counts, total) in histograms.items()],
+    }
+
+
+def _load_snapshots(paths):
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _file_pid(name):
+    """Pid of the process that wrote a values file `<pid>-<token>.json`"""
+    try:
+        return int(name[:-len('.json')].split('-')[0])
+    except ValueError:
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels(labels):
+    """Format (key, value) pairs as `{key="value",...}`"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+configure = REGISTRY.configure
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+render = REGISTRY.render
+mark_process_dead = REGISTRY.mark_process_dead
+
+
+def record_analysis(result, mode):
+    """
+    Record the outcome, input and stage timings of one analysis.
+
+    Args:
+        result: Result dictionary of `analyze_audio_file`
+        mode: 'in_memory' or 'streaming'
+    """
+    with REGISTRY.batch():
+        if "error" in result:
+            inc('audio_forensics_analyses_total', mode=mode, status='failed')
+            return
+        inc('audio_forensics_analyses_total', mode=mode, status='done')
+        observe('audio_forensics_input_duration_seconds', result["duration"])
+        inc('audio_forensics_input_sample_rate_total', sample_rate=result["sample_rate"])
+        for stage, seconds in result.get("timings", {}).items():
+            observe('audio_forensics_stage_seconds', seconds, mode=mode, stage=stage)
@@ -0,0 +1,209 @@
+import math
+import functools
+
+import numpy as np
+from scipy import signal
+
+# Rates the analysis decimates to, highest first: the speech band used by
+# the MFCC path and the band around the mains frequency used by the ENF
+# analysis. Each is derived from the next higher one, not from the native
+# rate, so the long anti-aliasing filters only run at the first stage.
+CASCADE_RATES = (16000, 1000)
+
+# Half-length of the anti-aliasing filter in units of the larger of the two
+# rate factors, and its Kaiser window (the scipy.signal.resample_poly design)
+FILTER_HALF_LENGTH = 10
+FILTER_WINDOW = ('kaiser', 5.0)
+
+
+@functools.lru_cache(maxsize=32)
+def polyphase_filter(sr_in, sr_out):
+    """
+    Anti-aliasing filter for rational resampling from `sr_in` to `sr_out`.
+
+    The design and alignment match `scipy.signal.resample_poly`: output
+    sample k is centred on input time k / sr_out.
+
+    Returns:
+        up, down: Reduced rate factors (sr_out / sr_in == up / down)
+        h: Read-only filter taps, front-padded so that `skip` is whole
+        skip: Leading `upfirdn` outputs to drop to undo the filter delay
+    """
+    g = math.gcd(sr_in, sr_out)
+    up, down = sr_out // g, sr_in // g
+    max_rate = max(up, down)
+    half_len = FILTER_HALF_LENGTH * max_rate
+    h = signal.firwin(2 * half_len + 1, 1 / max_rate, window=FILTER_WINDOW) * up
+    n_pre_pad = down - half_len % down
+    h = np.concatenate([np.zeros(n_pre_pad), h])
+    h.setflags(write=False)
+    return up, down, h, (half_len + n_pre_pad) // down
+
+
+def _working_dtype(x):
+    """float32 signals are resampled in float32; anything else in float64"""
+    return np.float32 if np.asarray(x).dtype == np.float32 else np.float64
+
+
+def resampled_length(n_samples, sr_in, sr_out):
+    """Number of samples `resample` returns for `n_samples` input samples"""
+    up, down, _, _ = polyphase_filter(sr_in, sr_out)
+    return -(-n_samples * up // down)
+
+
+def _fit(y, length):
+    """Truncate or zero-pad the last axis of `y` to `length`"""
+    if y.shape[-1] >= length:
+        return y[..., :length]
+    pad = [(0, 0)] * (y.ndim - 1) + [(0, length - y.shape[-1])]
+    return np.pad(y, pad)
+
+
+def resample(y, sr_in, sr_out):
+    """
+    Polyphase resampling of a whole signal, as `scipy.signal.resample_poly`
+    with zero padding, keeping float32 input in float32.
+
+    Signals of shape (..., samples) are resampled along the last axis.
+    """
+    if sr_in == sr_out:
+        return y
+    up, down, h, skip = polyphase_filter(sr_in, sr_out)
+    dtype = _working_dtype(y)
+    out = signal.upfirdn(h.astype(dtype), np.asarray(y, dtype=dtype), up, down, axis=-1)
+    return _fit(out[..., skip:], resampled_length(y.shape[-1], sr_in, sr_out))
+
+
+def cascade_source(sr, rate, rates=CASCADE_RATES):
+    """
+    Rate the cascade decimates to `rate` from: the next higher cascade rate
+    below the native rate `sr`, or `sr` itself.
+    """
+    return min((r for r in rates if rate < r < sr), default=sr)
+
+
+def decimate(y, sr, rate):
+    """
+    Resample a whole signal down to `rate` through the cascade.
+
+    Signals are never upsampled: for `rate` at or above `sr` the signal is
+    returned unchanged.
+
+    Returns:
+        y: The resampled signal
+        sr: Its sample rate
+    """
+    if rate >= sr:
+        return y, sr
+    source = cascade_source(sr, rate)
+    y, _ = decimate(y, sr, source)
+    return resample(y, source, rate), rate
+
+
+class StreamingResampler:
+    """
+    Block-wise version of `resample` that carries its state across blocks.
+
+    Resampling a stream block by block gives the same samples as resampling
+    the concatenated stream at once. Only the input the next outputs depend
+    on (one filter length) is kept between blocks.
+
+    Args:
+        sr_in, sr_out: Input and output sample rates
+        n_samples: Total number of input samples in the stream
+        dtype: Sample type the filter runs in
+    """
+
+    def __init__(self, sr_in, sr_out, n_samples, dtype=np.float32):
+        self.up, self.down, h, self.skip = polyphase_filter(sr_in, sr_out)
+        self.h = h.astype(dtype)
+        self.dtype = dtype
+        self.n_out = resampled_length(n_samples, sr_in, sr_out)
+        self.buffer = np.zeros(0, dtype=dtype)
+        self.start = 0  # input index of buffer[0], always a multiple of `down`
+        self.received = 0
+        self.emitted = 0
+
+    def push(self, block):
+        """Add a block and return the output samples that are now final"""
+        self.buffer = np.concatenate([self.buffer, np.asarray(block, dtype=self.dtype)])
+        self.received += len(block)
+        # Output k needs the input up to sample ((k + skip) * down) // up
+        ready = (self.received * self.up - 1) // self.down - self.skip + 1
+        return self._emit(min(ready, self.n_out))
+
+    def finish(self):
+        """Return the remaining output samples at the end of the stream"""
+        return self._emit(self.n_out)
+
+    def _emit(self, stop):
+        if stop <= self.emitted:
+            return np.zeros(0, dtype=self.dtype)
+        # upfirdn output 0 of the buffer is full-stream output `first`
+        first = self.start // self.down * self.up
+        out = signal.upfirdn(self.h, self.buffer, self.up, self.down)
+        values = _fit(out[self.emitted + self.skip - first:], stop - self.emitted)
+        self.emitted = stop
+
+        # Drop the input that no later output reaches
+        needed = max(0, ((self.emitted + self.skip) * self.down - len(self.h) + 1) // self.up)
+        needed -= needed % self.down
+        if needed > self.start:
+            self.buffer = self.buffer[needed - self.start:]
+            self.start = needed
+        return values
+
+
+class StreamingCascade:
+    """
+    Block-wise decimation of one stream to several rates through the cascade.
+
+    Every rate is derived exactly as `decimate` (and `FeatureStore.at_rate`)
+    derives it from the whole signal, and shares the higher stages with the
+    other rates.
+
+    Args:
+        sr: Native sample rate of the stream
+        rates: Rates to produce; rates at or above `sr` give the native stream
+        n_samples: Total number of samples in the stream
+    """
+
+    def __init__(self, sr, rates, n_samples):
+        self.sr = sr
+        wanted = set()
+        for rate in rates:
+            while rate < sr:
+                wanted.add(rate)
+                rate = cascade_source(sr, rate)
+        # Stages by output rate, each fed by an earlier (higher) stage
+        self.stages = {}
+        # Total number of samples the stream has at each rate
+        self.lengths = {sr: n_samples}
+        for rate in sorted(wanted, reverse=True):
+            source = cascade_source(sr, rate)
+            self.stages[rate] = (source, StreamingResampler(source, rate, self.lengths[source]))
+            self.lengths[rate] = resampled_length(self.lengths[source], source, rate)
+
+    def rate(self, rate):
+        """Rate the stream is actually produced at for a requested `rate`"""
+        return min(rate, self.sr)
+
+    def push(self, block):
+        """
+        Add a block of native samples.
+
+        Returns:
+            Dictionary of the new samples at every rate, keyed by rate
+            (including the native one)
+        """
+        out = {self.sr: block}
+        for rate, (source, resampler) in self.stages.items():
+            out[rate] = resampler.push(out[source])
+        return out
+
+    def finish(self):
+        """Return the remaining samples at every rate, as `push`"""
+        out = {self.sr: np.zeros(0, dtype=np.float32)}
+        for rate, (source, resampler) in self.stages.items():
+            out[rate] = np.concatenate([resampler.push(out[source]), resampler.finish()])
+        return out
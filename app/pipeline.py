@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class TaskGraph:
+    """
+    Small dependency graph of analysis stages run on a thread pool.
+
+    Each task is a callable that receives the results of its dependencies
+    as keyword arguments (named after the dependency). Tasks start as soon
+    as all their dependencies have finished, so independent detectors and
+    plot renders overlap; the heavy NumPy/SciPy work inside them releases
+    the GIL.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, func, deps=()):
+        """Register a task; dependencies must already be registered"""
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Unknown dependency '{dep}' for task '{name}'")
+        self.tasks[name] = (func, tuple(deps))
+
+    def run(self, max_workers=1):
+        """
+        Run every task, respecting dependencies.
+
+        Returns:
+            results: Dictionary of task name to return value
+            timings: Dictionary of task name to wall time in seconds
+        """
+        results = {}
+        timings = {}
+        pending = dict(self.tasks)
+
+        def timed(name, func, kwargs):
+            start = time.perf_counter()
+            value = func(**kwargs)
+            timings[name] = time.perf_counter() - start
+            return value
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            running = {}
+            while pending or running:
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        running[executor.submit(timed, name, func, kwargs)] = name
+                        del pending[name]
+
+                if not running:
+                    raise ValueError(f"Unsatisfiable dependencies: {sorted(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        return results, timings
+
+
+class StageTimer:
+    """
+    Accumulates the wall time of stages that run in many short steps, such
+    as the per-block work of the streaming analysis.
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def __call__(self, name):
+        """Time the body of a `with timer(name):` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def iterate(self, name, iterable):
+        """Iterate over `iterable`, timing how long each item takes to produce"""
+        iterator = iter(iterable)
+        while True:
+            with self(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
@@ -0,0 +1,236 @@
+import os
+import time
+import fcntl
+import base64
+import shutil
+import tempfile
+from contextlib import contextmanager, ExitStack
+
+from .wavio import load_audio
+from . import metrics
+
+PLOT_NAMES = ('waveform', 'spectrogram', 'noise_waveform', 'discontinuity', 'noise_consistency')
+
+# Plots that the streaming analysis cannot produce
+IN_MEMORY_ONLY = ('spectrogram',)
+
+# Detectors whose plots are shown; the block-by-block plot pass runs only these
+PLOTTED_DETECTORS = ('discontinuity', 'noise_consistency')
+
+# Held while a plot folder is being rendered into
+LOCK_FILE = '.lock'
+
+# Bump when the plot or tile images change; it is part of the plot URLs,
+# which browsers cache for good
+RENDER_VERSION = 1
+
+
+def plot_key(digest):
+    """
+    Name of the plot folder of the audio with the given SHA-256 digest.
+
+    Plots depend only on the audio and the renderer, not on the detector
+    parameters, so importing reference logs or tuning a detector doesn't
+    orphan rendered images.
+    """
+    return f"{digest}-r{RENDER_VERSION}"
+
+
+def available_plots(file_path):
+    """Names of the plots that can be rendered for an audio file"""
+    from .audio_analysis import STREAMING_THRESHOLD_BYTES
+
+    if os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES:
+        return tuple(name for name in PLOT_NAMES if name not in IN_MEMORY_ONLY)
+    return PLOT_NAMES
+
+
+def _write_atomic(path, data):
+    """Write a file so concurrent readers never see a partial image"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _locked(plot_dir):
+    """
+    Hold an exclusive lock on a plot folder.
+
+    The lock is an flock on a file in the folder, so concurrent image
+    requests for the same recording, from any thread or gunicorn worker,
+    wait for the first render instead of starting their own.
+    """
+    lock_path = os.path.join(plot_dir, LOCK_FILE)
+    while True:
+        os.makedirs(plot_dir, exist_ok=True)
+        f = open(lock_path, 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            # Still the folder's lock, not one evicted while we waited
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(lock_path)):
+                break
+        except FileNotFoundError:
+            pass
+        f.close()
+    try:
+        yield
+    finally:
+        f.close()
+
+
+def touch(plot_dir):
+    """Mark a plot folder as recently used, for `evict`"""
+    try:
+        os.utime(plot_dir)
+    except OSError:
+        pass
+
+
+def _folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def evict(folder, max_bytes, keep=()):
+    """
+    Delete the least recently used plot folders (by folder mtime, see
+    `touch`) until the plots in `folder` fit `max_bytes`.
+
+    Folders in `keep` (e.g. the one just rendered) and folders with a lock
+    held (being rendered into, or tiles being built) are skipped. Folders
+    of an earlier render version are never touched again, so they are the
+    first to go.
+
+    Returns:
+        Number of folders deleted
+    """
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.is_dir():
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, _folder_size(entry.path), entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        with ExitStack() as locks:
+            if not _try_lock_all(path, locks):
+                # Being rendered into, or its tiles being built
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+        total -= size
+    return removed
+
+
+def _try_lock_all(plot_dir, locks):
+    """Take every lock of a plot folder (`*.lock`) without waiting, onto an ExitStack"""
+    names = {LOCK_FILE}
+    try:
+        names.update(name for name in os.listdir(plot_dir) if name.endswith('.lock'))
+        for name in sorted(names):
+            f = locks.enter_context(open(os.path.join(plot_dir, name), 'a'))
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _render(file_path, name):
+    """Compute just what one plot needs and render it to PNG bytes"""
+    from .audio_analysis import (
+        NOISE_SEGMENT_SECONDS, extract_background_noise, detect_spectral_discontinuities,
+        discontinuity_threshold, noise_threshold, render_discontinuity_plot,
+        render_noise_consistency_plot
+    )
+    from .energy import multiscale_rms
+    from .features import FeatureStore, N_FFT, HOP_LENGTH
+    from . import rendering
+
+    y, sr = load_audio(file_path, mono=True)
+
+    if name == 'waveform':
+        return rendering.render_waveform(y, sr)
+    if name == 'spectrogram':
+        return rendering.render_spectrogram(FeatureStore(y, sr).spectrogram_db, sr, N_FFT, HOP_LENGTH)
+    if name == 'discontinuity':
+        values = detect_spectral_discontinuities(y, sr, include_plot=False)["trace"]["values"]
+        return render_discontinuity_plot(values, *discontinuity_threshold(values))
+
+    noise = extract_background_noise(y, sr)
+    if name == 'noise_waveform':
+        return rendering.render_waveform(noise, sr, title="Background Noise")
+    timestamps, noise_levels = multiscale_rms(noise, sr, [NOISE_SEGMENT_SECONDS])[NOISE_SEGMENT_SECONDS]
+    return render_noise_consistency_plot(timestamps, noise_levels, *noise_threshold(noise_levels))
+
+
+def _render_stream(plot_dir, file_path):
+    """
+    Render every plot of a file too large to load, in one block-by-block
+    pass that runs only the plotted detectors.
+    """
+    from .streaming import analyze_audio_stream
+
+    _, plots = analyze_audio_stream(file_path, include_plots=True, detectors=PLOTTED_DETECTORS)
+    for plot_name, plot_data in plots.items():
+        _write_atomic(os.path.join(plot_dir, plot_name + '.png'), base64.b64decode(plot_data))
+
+
+def ensure_plot(plot_dir, file_path, name, max_bytes=None):
+    """
+    Return the path of a rendered plot, rendering it on first request.
+
+    Plots are stored as `<plot_dir>/<name>.png`, where `plot_dir` is named
+    by `plot_key`, unique to the audio content and render version, so an
+    image never changes once written. Renders of one folder are serialized
+    (see `_locked`) and are not counted as analyses in the metrics.
+
+    Args:
+        max_bytes: Size the folder holding `plot_dir` is trimmed to after a
+            render (see `evict`); unlimited when None
+
+    Returns:
+        Path of the PNG, or None if the plot is not available for the file
+    """
+    path = os.path.join(plot_dir, name + '.png')
+    if os.path.exists(path):
+        touch(plot_dir)
+        return path
+    if name not in available_plots(file_path):
+        return None
+
+    from .audio_analysis import STREAMING_THRESHOLD_BYTES
+
+    with _locked(plot_dir):
+        # Rendered while this request waited for the lock
+        if os.path.exists(path):
+            return path
+        start = time.perf_counter()
+        with metrics.REGISTRY.muted():
+            if os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES:
+                # The streaming pass produces every plot at once; keep them all
+                _render_stream(plot_dir, file_path)
+            else:
+                _write_atomic(path, _render(file_path, name))
+        metrics.observe('audio_forensics_plot_render_seconds', time.perf_counter() - start,
+                        plot=name)
+    if max_bytes is not None:
+        evict(os.path.dirname(plot_dir), max_bytes, keep=(plot_dir,))
+
+    return path if os.path.exists(path) else None
@@ -0,0 +1,161 @@
+import io
+import threading
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Output size: 10x4 inches at 100 dpi, as the pyplot plots always were
+FIGSIZE = (10, 4)
+DPI = 100
+
+# Rough number of horizontal data pixels; signals are decimated to this
+PLOT_COLUMNS = 1000
+
+# Number of log-spaced frequency rows in the spectrogram image
+SPECTROGRAM_ROWS = 256
+SPECTROGRAM_FMIN = 20.0
+
+_local = threading.local()
+
+
+def _figure():
+    """
+    Return this thread's reusable figure, cleared and with a single axes.
+
+    Figures are created through the object-oriented Agg API rather than
+    pyplot, so there is no global state and each thread can render
+    independently.
+    """
+    fig = getattr(_local, 'figure', None)
+    if fig is None:
+        fig = Figure(figsize=FIGSIZE, dpi=DPI)
+        FigureCanvasAgg(fig)
+        _local.figure = fig
+    fig.clear()
+    fig.subplots_adjust(left=0.08, right=0.97, bottom=0.13, top=0.91)
+    return fig, fig.add_subplot(1, 1, 1)
+
+
+def _to_png(fig):
+    """Render a figure to PNG bytes"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def envelope(y, n_columns=PLOT_COLUMNS):
+    """
+    Min/max envelope of a signal decimated to `n_columns` buckets.
+
+    Returns:
+        lower, upper: Per-bucket minimum and maximum
+        bucket: Number of samples per bucket
+    """
+    bucket = max(1, int(np.ceil(len(y) / n_columns)))
+    n_full = len(y) // bucket
+    frames = np.asarray(y[:n_full * bucket]).reshape(n_full, bucket)
+    lower, upper = frames.min(axis=1), frames.max(axis=1)
+    if n_full * bucket < len(y):
+        tail = y[n_full * bucket:]
+        lower = np.append(lower, np.min(tail))
+        upper = np.append(upper, np.max(tail))
+    return lower, upper, bucket
+
+
+def render_envelope(times, lower, upper, title="Audio Waveform"):
+    """Plot a min/max waveform envelope and return PNG bytes"""
+    fig, ax = _figure()
+    ax.fill_between(times, lower, upper, linewidth=0.5)
+    ax.set_xlim(times[0] if len(times) else 0, times[-1] if len(times) else 1)
+    ax.set_title(title)
+    ax.set_xlabel('Time (s)')
+    return _to_png(fig)
+
+
+def render_waveform(y, sr, title="Audio Waveform"):
+    """Plot a waveform, decimated to the pixel width, and return PNG bytes"""
+    lower, upper, bucket = envelope(y)
+    times = (np.arange(len(lower)) + 0.5) * bucket / sr
+    return render_envelope(times, lower, upper, title=title)
+
+
+def downsample_spectrogram(spectrogram_db, sr, n_fft, n_columns=PLOT_COLUMNS,
+                           n_rows=SPECTROGRAM_ROWS, fmin=SPECTROGRAM_FMIN):
+    """
+    Reduce a dB spectrogram to a display-sized image on a log frequency axis.
+
+    Frequency bins are grouped into `n_rows` log-spaced rows and frames into
+    at most `n_columns` columns, keeping the maximum of each group so short
+    events stay visible.
+
+    Returns:
+        image: Array of shape (rows, columns)
+        row_freqs: Lower frequency of each row
+    """
+    n_bins, n_frames = spectrogram_db.shape
+    bin_hz = sr / n_fft
+
+    # Log-spaced row edges, as bin indices; rows narrower than a bin collapse
+    edges = np.geomspace(fmin, sr / 2, n_rows + 1) / bin_hz
+    starts = np.unique(np.clip(np.floor(edges[:-1]).astype(int), 1, n_bins - 1))
+    image = np.maximum.reduceat(spectrogram_db, starts, axis=0)
+
+    step = max(1, int(np.ceil(n_frames / n_columns)))
+    image = np.maximum.reduceat(image, np.arange(0, n_frames, step), axis=1)
+
+    return image, starts * bin_hz
+
+
+def render_spectrogram(spectrogram_db, sr, n_fft, hop_length):
+    """Plot a downsampled log-frequency spectrogram and return PNG bytes"""
+    image, row_freqs = downsample_spectrogram(spectrogram_db, sr, n_fft)
+    duration = spectrogram_db.shape[1] * hop_length / sr
+
+    fig, ax = _figure()
+    mesh = ax.imshow(image, origin='lower', aspect='auto', cmap='magma',
+                     extent=(0, duration, 0, len(row_freqs)), interpolation='nearest')
+    fig.colorbar(mesh, ax=ax, format='%+2.0f dB')
+
+    # Octave ticks, skipping those that would overlap at the low end where
+    # rows collapse onto single FFT bins
+    ticks, positions = [], []
+    for f in (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768):
+        if row_freqs[0] <= f <= sr / 2:
+            position = np.interp(f, row_freqs, np.arange(len(row_freqs)))
+            if not positions or position - positions[-1] >= len(row_freqs) / 20:
+                ticks.append(f)
+                positions.append(position)
+    ax.set_yticks(positions)
+    ax.set_yticklabels([str(f) for f in ticks])
+    ax.set_ylabel('Hz')
+    ax.set_xlabel('Time (s)')
+    ax.set_title('Spectrogram')
+    return _to_png(fig)
+
+
+def render_trace(x, values, threshold, markers, title, xlabel, ylabel):
+    """
+    Plot a detector trace with its threshold and flagged positions.
+
+    Long traces are reduced to a min/max envelope at the pixel width;
+    flagged positions are drawn as a single line collection.
+    """
+    x = np.asarray(x, dtype=float)
+    values = np.asarray(values, dtype=float)
+
+    fig, ax = _figure()
+    if len(values) > 2 * PLOT_COLUMNS:
+        lower, upper, bucket = envelope(values)
+        ax.fill_between(x[::bucket][:len(lower)], lower, upper, linewidth=0.5)
+    else:
+        ax.plot(x, values)
+    ax.axhline(y=threshold, color='r', linestyle='--', label='Threshold')
+    if len(markers):
+        ax.vlines(np.asarray(markers, dtype=float), 0, 1, transform=ax.get_xaxis_transform(),
+                  colors='g', alpha=0.5)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    return _to_png(fig)
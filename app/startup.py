@@ -0,0 +1,94 @@
+import os
+import time
+import tempfile
+
+import numpy as np
+
+from . import metrics
+
+# Run a synthetic analysis in each process before it accepts requests
+WARM_UP = os.environ.get('WARM_UP', '1') == '1'
+
+# Sample rates of the synthetic recordings; FFT plans, filter designs and
+# ENF frame sizes are cached per rate
+WARM_UP_SAMPLE_RATES = (44100, 48000)
+WARM_UP_SECONDS = 5
+
+# When this process started; reset by `mark_start` in forked workers
+_started_at = time.perf_counter()
+# Seconds the warm-up took in this process, None if it didn't run here
+_warm_up_seconds = None
+# Whether this process, or the process it was forked from, is warm
+_warm = False
+
+
+def mark_start():
+    """Start timing the startup of this process, e.g. right after a worker forks"""
+    global _started_at, _warm_up_seconds
+    _started_at = time.perf_counter()
+    _warm_up_seconds = None
+
+
+def synthetic_recording(sr, seconds=WARM_UP_SECONDS):
+    """A tone over mains hum and background noise, as 16-bit PCM"""
+    t = np.arange(int(sr * seconds)) / sr
+    rng = np.random.default_rng(0)
+    y = (0.3 * np.sin(2 * np.pi * 440 * t) + 0.01 * np.sin(2 * np.pi * 50 * t)
+         + 0.02 * rng.standard_normal(len(t)))
+    return (y * 32767).astype(np.int16)
+
+
+def warm_up():
+    """
+    Run every detector once on synthetic recordings.
+
+    Imports the analysis stack and fills the caches the first real analysis
+    would otherwise pay for: librosa's numba JIT compilation, FFT plans,
+    filter designs, mel filter banks and matplotlib fonts. Processes forked
+    from a warm process (the workers of a preloaded gunicorn app, the job
+    pool processes of a worker) inherit all of it. The synthetic analyses
+    are not counted in the metrics.
+
+    Returns:
+        Seconds the warm-up took, 0 if this process was already warm
+    """
+    global _warm, _warm_up_seconds
+    if _warm:
+        return 0.0
+    from scipy.io import wavfile
+    from .audio_analysis import analyze_audio_file
+    from .streaming import analyze_audio_stream
+    from . import tiles  # noqa: F401
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir, metrics.REGISTRY.muted():
+        for sr in WARM_UP_SAMPLE_RATES:
+            path = os.path.join(tmp_dir, f'warm_up_{sr}.wav')
+            wavfile.write(path, sr, synthetic_recording(sr))
+            analyze_audio_file(path, include_plots=True, detectors='full')
+            analyze_audio_stream(path, include_plots=False, detectors='full')
+    _warm = True
+    _warm_up_seconds = time.perf_counter() - start
+    return _warm_up_seconds
+
+
+def ready(role):
+    """
+    Record the startup time of a process that is about to accept requests.
+
+    Args:
+        role: 'master' for a gunicorn master preloading the app, 'worker'
+            for a process serving requests
+
+    Returns:
+        startup: Seconds since the process started (see `mark_start`)
+        warm_up: Part of it spent in `warm_up`, 0 if the process was forked
+            warm or warm-up is disabled
+    """
+    startup = time.perf_counter() - _started_at
+    with metrics.REGISTRY.batch():
+        metrics.observe('audio_forensics_startup_seconds', startup, role=role, phase='total')
+        if _warm_up_seconds is not None:
+            metrics.observe('audio_forensics_startup_seconds', _warm_up_seconds,
+                            role=role, phase='warm_up')
+    return startup, _warm_up_seconds or 0.0
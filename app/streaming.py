@@ -0,0 +1,438 @@
+import numpy as np
+import librosa
+from scipy import signal
+from scipy.fft import dct
+
+from .enf import (frame_signal, enf_from_frames, heterodyne, fine_enf_from_frames,
+                  fine_frame_count, BASEBAND_RATE, FINE_WINDOW_SECONDS)
+from . import enf_reference
+from .features import N_FFT, HOP_LENGTH, N_MFCC, resampled_stft_parameters
+from .localization import localize_splices
+from .filters import butter_highpass, zero_phase_filter
+from .multirate import StreamingCascade, StreamingResampler
+from .wavio import open_audio
+from .pipeline import StageTimer
+from . import metrics
+from . import detectors as detector_registry
+from .audio_analysis import (
+    HIGHPASS_CUTOFF, HIGHPASS_ORDER, ENF_WINDOW_SECONDS, ENF_BAND,
+    NOISE_SEGMENT_SECONDS, SHORT_NOISE_SEGMENT_SECONDS, MULTIRATE_ANALYSIS, MFCC_SAMPLE_RATE, ENF_SAMPLE_RATE,
+    new_result, add_detector_result, enf_result, native_enf_scale, enf_reference_result,
+    discontinuity_result, copy_move_result, noise_consistency_result, needs_short_noise_segments,
+    create_envelope_plot
+)
+
+# Number of samples read per block
+BLOCK_SECONDS = 30
+
+# Context kept on each side of a block when filtering it; far longer than
+# the high-pass filter's impulse response
+FILTER_MARGIN_SECONDS = 0.1
+
+# Number of min/max buckets kept for the waveform plots
+ENVELOPE_BUCKETS = 2000
+
+# Detectors the block-by-block analysis implements
+STREAMING_DETECTORS = ('enf', 'enf_reference', 'discontinuity', 'copy_move', 'noise_consistency')
+
+# Dynamic range of the log-mel spectrogram, as in librosa.power_to_db
+TOP_DB = 80.0
+
+
+class FrameAccumulator:
+    """
+    Carry samples across blocks and emit the overlapping frames they complete.
+
+    Args:
+        frame_length: Frame size in samples
+        hop_length: Hop between frames in samples
+        n_frames: Total number of frames to emit over the whole stream
+    """
+
+    def __init__(self, frame_length, hop_length, n_frames):
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.remaining = max(n_frames, 0)
+        self.buffer = np.zeros(0, dtype=np.float32)
+
+    def push(self, block):
+        """Append a block and return the newly completed frames as a view"""
+        buffer = np.concatenate([self.buffer, block])
+        available = 0
+        if len(buffer) >= self.frame_length:
+            available = 1 + (len(buffer) - self.frame_length) // self.hop_length
+        n_frames = min(available, self.remaining)
+        frames = frame_signal(buffer, self.frame_length, self.hop_length, n_frames)
+        self.remaining -= n_frames
+        self.buffer = buffer[n_frames * self.hop_length:].copy() if self.remaining else buffer[:0]
+        return frames
+
+
+class StreamingMFCC:
+    """
+    Incremental MFCC frame-to-frame change, matching the centred STFT used
+    by FeatureStore.mfcc.
+
+    The log-mel floor (TOP_DB below the peak) uses the running peak, which
+    equals the global peak whenever the file fits in a single block.
+
+    Args:
+        sr: Sample rate of the stream
+        n_samples: Total number of samples in the stream
+        n_fft, hop_length, win_length: STFT parameters, as for FeatureStore
+        keep_mfcc: Also keep the MFCCs themselves (N_MFCC float32 values
+            per frame), for copy-move detection
+    """
+
+    def __init__(self, sr, n_samples, n_fft=N_FFT, hop_length=HOP_LENGTH, win_length=None,
+                 keep_mfcc=False):
+        self.pad = n_fft // 2
+        self.frames = FrameAccumulator(n_fft, hop_length, 1 + n_samples // hop_length)
+        window = signal.get_window('hann', win_length or n_fft, fftbins=True)
+        self.window = librosa.util.pad_center(window, size=n_fft).astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+        self.peak_db = -np.inf
+        self.last_mfcc = None
+        self.delta_norms = []
+        self.kept = [] if keep_mfcc else None
+        self._started = False
+
+    def push(self, block):
+        """Process one block of mono samples"""
+        if not self._started:
+            block = np.concatenate([np.zeros(self.pad, dtype=np.float32), block])
+            self._started = True
+        self._process(self.frames.push(block))
+
+    def finish(self):
+        """Flush the trailing padding and return the MFCC delta norms"""
+        self._process(self.frames.push(np.zeros(self.pad, dtype=np.float32)))
+        return np.concatenate(self.delta_norms) if self.delta_norms else np.zeros(0)
+
+    def mfcc(self):
+        """The kept MFCCs, of shape (N_MFCC, frames), once `finish` was called"""
+        return np.concatenate(self.kept, axis=1) if self.kept else np.zeros((N_MFCC, 0), dtype=np.float32)
+
+    def _process(self, frames):
+        if len(frames) == 0:
+            return
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        log_mel = 10.0 * np.log10(np.maximum(1e-10, self.mel_basis @ power.T))
+        self.peak_db = max(self.peak_db, log_mel.max())
+        log_mel = np.maximum(log_mel, self.peak_db - TOP_DB)
+        mfccs = dct(log_mel, axis=0, type=2, norm='ortho')[:N_MFCC]
+        if self.kept is not None:
+            self.kept.append(mfccs.astype(np.float32))
+
+        if self.last_mfcc is not None:
+            mfccs = np.concatenate([self.last_mfcc, mfccs], axis=1)
+        self.delta_norms.append(np.linalg.norm(np.diff(mfccs, axis=1), axis=0))
+        self.last_mfcc = mfccs[:, -1:]
+
+
+class StreamingFineENF:
+    """
+    Block-wise version of `enf.extract_fine_enf_trace`, giving the same trace.
+
+    Args:
+        sr: Sample rate of the stream
+        nominal: Nominal grid frequency the trace is taken around
+        n_samples: Total number of samples in the stream
+    """
+
+    def __init__(self, sr, nominal, n_samples):
+        self.sr = sr
+        self.nominal = nominal
+        self.offset = 0
+        # Real and imaginary parts are resampled separately, as in memory
+        self.parts = [StreamingResampler(sr, BASEBAND_RATE, n_samples, dtype=np.float64)
+                      for _ in range(2)]
+        window_length = int(FINE_WINDOW_SECONDS * BASEBAND_RATE)
+        self.frames = FrameAccumulator(window_length, BASEBAND_RATE, fine_frame_count(
+            self.parts[0].n_out, window_length, BASEBAND_RATE))
+        self.offsets, self.saliences = [], []
+
+    def push(self, block):
+        """Process one block of mono samples"""
+        baseband = heterodyne(block, self.sr, self.nominal, self.offset)
+        self.offset += len(block)
+        self._process(self.parts[0].push(baseband.real), self.parts[1].push(baseband.imag))
+
+    def finish(self):
+        """Flush the resamplers and return the trace"""
+        self._process(self.parts[0].finish(), self.parts[1].finish())
+        offset = np.concatenate(self.offsets) if self.offsets else np.zeros(0)
+        return {
+            "times": np.arange(len(offset)) + FINE_WINDOW_SECONDS / 2,
+            "frequency": self.nominal + offset,
+            "salience": np.concatenate(self.saliences) if self.saliences else np.zeros(0),
+        }
+
+    def _process(self, real, imag):
+        offset, salience = fine_enf_from_frames(self.frames.push(real + 1j * imag), BASEBAND_RATE)
+        self.offsets.append(offset)
+        self.saliences.append(salience)
+
+
+class StreamingHighpass:
+    """
+    Block-wise version of the zero-phase background noise filter.
+
+    Each block is filtered forwards and backwards together with `margin`
+    samples of context on both sides, so its output matches filtering the
+    whole file once the filter transient has decayed; the file edges see
+    exactly the same padding as the in-memory path. Output therefore lags the input by
+    `margin` samples until `finish` is called.
+    """
+
+    def __init__(self, sr, margin):
+        self.sos = butter_highpass(sr, HIGHPASS_CUTOFF, HIGHPASS_ORDER)
+        self.margin = margin
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.history = 0  # leading samples of `buffer` that were already emitted
+
+    def push(self, block):
+        """Add a block and return the filtered samples that are now final"""
+        self.buffer = np.concatenate([self.buffer, block])
+        emit = len(self.buffer) - self.history - self.margin
+        if emit <= 0:
+            return np.zeros(0, dtype=np.float32)
+        noise = zero_phase_filter(self.sos, self.buffer)[self.history:self.history + emit]
+        end = self.history + emit
+        start = max(0, end - self.margin)
+        self.buffer = self.buffer[start:]
+        self.history = end - start
+        return noise
+
+    def finish(self):
+        """Return the remaining filtered samples at the end of the stream"""
+        if len(self.buffer) == self.history:
+            return np.zeros(0, dtype=np.float32)
+        return zero_phase_filter(self.sos, self.buffer)[self.history:]
+
+
+def envelope(frames):
+    """Min/max of each frame"""
+    return np.min(frames, axis=1), np.max(frames, axis=1)
+
+
+def rms(frames):
+    """RMS energy of each frame"""
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def analyze_audio_stream(file_path, include_plots=True, block_seconds=BLOCK_SECONDS,
+                         detectors=None):
+    """
+    Perform the forgery analysis block by block with bounded memory.
+
+    Produces the same result structure as `analyze_audio_file`. Only the
+    per-window detector traces (a few values per second of audio) and,
+    for copy-move detection, the MFCCs (about 16 MB per hour) are kept in
+    memory; the spectrogram plot is not available in this mode.
+    Only the built-in mono detectors can run block by block; other
+    selected detectors are skipped.
+
+    Args:
+        file_path: Path to the WAV file
+        include_plots: Render the trace and waveform envelope plots
+        block_seconds: Length of each block read from disk
+        detectors: Analysis profile name or detector names to run
+            (defaults to detectors.DEFAULT_PROFILE)
+
+    Returns:
+        result: Dictionary containing analysis results
+        plots: Dictionary containing base64-encoded plots
+    """
+    selected = [detector for detector in detector_registry.select_detectors(detectors)
+                if detector.name in STREAMING_DETECTORS]
+    run_enf, run_enf_reference, run_discontinuity, run_copy_move, run_noise_consistency = (
+        any(detector.name == name for detector in selected) for name in STREAMING_DETECTORS)
+
+    timer = StageTimer()
+    try:
+        with timer('load'):
+            audio = open_audio(file_path)
+    except Exception as e:
+        result = {"error": f"Error loading audio file: {str(e)}"}
+        metrics.record_analysis(result, 'streaming')
+        return result, {}
+
+    with audio:
+        sr = audio.samplerate
+        n_samples = audio.frames
+
+        # Decimated copies for the narrow-band detectors, as FeatureStore.at_rate
+        cascade_rates = []
+        if MULTIRATE_ANALYSIS and (run_enf or run_enf_reference):
+            cascade_rates.append(ENF_SAMPLE_RATE)
+        if MULTIRATE_ANALYSIS and (run_discontinuity or run_copy_move):
+            cascade_rates.append(MFCC_SAMPLE_RATE)
+        bands = StreamingCascade(sr, cascade_rates, n_samples)
+        enf_sr = bands.rate(ENF_SAMPLE_RATE) if MULTIRATE_ANALYSIS else sr
+        mfcc_sr = bands.rate(MFCC_SAMPLE_RATE) if MULTIRATE_ANALYSIS else sr
+
+        enf_window = int(enf_sr * ENF_WINDOW_SECONDS)
+        enf_hop = int(enf_window / 2)
+        enf_frames = FrameAccumulator(enf_window, enf_hop, len(range(
+            0, bands.lengths.get(enf_sr, 0) - enf_window, enf_hop)))
+        enf_frequency, enf_power = [], []
+
+        # One fine ENF trace per grid frequency the reference logs were recorded on
+        reference_logs = enf_reference.DATABASE.logs() if run_enf_reference else []
+        fine_enf = [StreamingFineENF(enf_sr, nominal, bands.lengths.get(enf_sr, 0))
+                    for nominal in sorted({log.nominal for log in reference_logs})]
+
+        segment_length = int(sr * NOISE_SEGMENT_SECONDS)
+        segment_hop = int(segment_length / 2)
+        n_segments = len(range(0, n_samples - segment_length, segment_hop))
+        noise_frames = FrameAccumulator(segment_length, segment_hop, n_segments)
+        noise_levels = []
+
+        # Finer noise levels for recordings too short to localize splices
+        # with the above, as analyze_noise_consistency
+        short_frames = None
+        if run_noise_consistency and needs_short_noise_segments(n_segments):
+            short_length = int(sr * SHORT_NOISE_SEGMENT_SECONDS)
+            short_hop = int(short_length / 2)
+            short_frames = FrameAccumulator(short_length, short_hop, len(range(
+                0, n_samples - short_length, short_hop)))
+        short_levels = []
+
+        highpass = StreamingHighpass(sr, margin=int(sr * FILTER_MARGIN_SECONDS))
+        if mfcc_sr < sr:
+            mfcc_fft, mfcc_hop, mfcc_window = resampled_stft_parameters(mfcc_sr, sr)
+        else:
+            mfcc_fft, mfcc_hop, mfcc_window = N_FFT, HOP_LENGTH, N_FFT
+        mfcc = StreamingMFCC(mfcc_sr, bands.lengths.get(mfcc_sr, 0), mfcc_fft, mfcc_hop, mfcc_window,
+                             keep_mfcc=run_copy_move)
+
+        bucket = max(1, n_samples // ENVELOPE_BUCKETS)
+        n_buckets = n_samples // bucket
+        waveform_frames = FrameAccumulator(bucket, bucket, n_buckets)
+        noise_envelope_frames = FrameAccumulator(bucket, bucket, n_buckets)
+        waveform_envelope, noise_envelope = [], []
+
+        def push_bands(blocks):
+            if run_enf:
+                with timer('enf'):
+                    frequency, power = enf_from_frames(enf_frames.push(blocks[enf_sr]), enf_sr,
+                                                       *ENF_BAND)
+                    enf_frequency.append(frequency)
+                    enf_power.append(power)
+            if fine_enf:
+                with timer('enf_reference'):
+                    for trace in fine_enf:
+                        trace.push(blocks[enf_sr])
+            if run_discontinuity or run_copy_move:
+                with timer('mfcc'):
+                    mfcc.push(blocks[mfcc_sr])
+
+        for y in timer.iterate('load', audio.blocks(int(sr * block_seconds))):
+            with timer('resample'):
+                blocks = bands.push(y)
+            push_bands(blocks)
+
+            if run_noise_consistency or include_plots:
+                with timer('noise'):
+                    noise = highpass.push(y)
+            if run_noise_consistency:
+                with timer('noise_consistency'):
+                    noise_levels.append(rms(noise_frames.push(noise)))
+                    if short_frames is not None:
+                        short_levels.append(rms(short_frames.push(noise)))
+
+            if include_plots:
+                with timer('waveform_plot'):
+                    waveform_envelope.append(envelope(waveform_frames.push(y)))
+                with timer('noise_waveform_plot'):
+                    noise_envelope.append(envelope(noise_envelope_frames.push(noise)))
+
+        with timer('resample'):
+            blocks = bands.finish()
+        push_bands(blocks)
+
+        if run_noise_consistency or include_plots:
+            with timer('noise'):
+                noise = highpass.finish()
+        if run_noise_consistency:
+            with timer('noise_consistency'):
+                noise_levels.append(rms(noise_frames.push(noise)))
+                if short_frames is not None:
+                    short_levels.append(rms(short_frames.push(noise)))
+        if include_plots:
+            with timer('noise_waveform_plot'):
+                noise_envelope.append(envelope(noise_envelope_frames.push(noise)))
+
+    result = new_result(n_samples / sr, sr)
+    plots = {}
+    stages = {}
+
+    if run_enf:
+        trace = {
+            "times": (np.arange(sum(len(p) for p in enf_power)) * enf_hop + enf_window / 2) / enf_sr,
+            "frequency": np.concatenate(enf_frequency),
+            "power": np.concatenate(enf_power),
+        }
+        with timer('enf'):
+            stages["enf"] = enf_result(native_enf_scale(trace, sr, enf_sr))
+
+    if run_enf_reference:
+        with timer('enf_reference'):
+            stages["enf_reference"] = enf_reference_result(
+                {trace.nominal: trace.finish() for trace in fine_enf}, reference_logs)
+
+    if run_discontinuity or run_copy_move:
+        with timer('mfcc'):
+            mfcc_delta_norm = mfcc.finish()
+    if run_discontinuity:
+        with timer('discontinuity'):
+            stages["discontinuity"] = discontinuity_result(mfcc_delta_norm, mfcc_sr,
+                                                           include_plot=include_plots,
+                                                           hop_length=mfcc_hop)
+
+    if run_copy_move:
+        with timer('copy_move'):
+            stages["copy_move"] = copy_move_result(mfcc.mfcc(), mfcc_sr, hop_length=mfcc_hop)
+
+    if run_noise_consistency:
+        with timer('noise_consistency'):
+            noise_levels = np.concatenate(noise_levels)
+            timestamps = np.arange(len(noise_levels)) * segment_hop / sr
+            short_segments = None
+            if short_frames is not None:
+                short_levels = np.concatenate(short_levels)
+                short_segments = (np.arange(len(short_levels)) * short_hop / sr, short_levels)
+            stages["noise_consistency"] = noise_consistency_result(
+                timestamps, noise_levels, include_plot=include_plots, short_segments=short_segments)
+
+    for detector in selected:
+        add_detector_result(result, stages[detector.name], detector)
+    result["detectors"] = [detector.name for detector in selected]
+
+    with timer('localization'):
+        result["splices"] = localize_splices(
+            {name: cue for detector in selected if detector.cue is not None
+             for name, cue in detector.cue(stages[detector.name]["trace"]).items()},
+            result["duration"])
+
+    if include_plots:
+        times = (np.arange(n_buckets) + 0.5) * bucket / sr
+        for key, title, chunks in (("waveform", "Audio Waveform", waveform_envelope),
+                                   ("noise_waveform", "Background Noise", noise_envelope)):
+            with timer(key + '_plot'):
+                lower = np.concatenate([c[0] for c in chunks])
+                upper = np.concatenate([c[1] for c in chunks])
+                plots[key] = create_envelope_plot(times, lower, upper, title=title)
+        for detector in selected:
+            if stages[detector.name].get("plot") is not None:
+                plots[detector.name] = stages[detector.name]["plot"]
+
+    # Wall time of each stage, summed over the blocks
+    result["timings"] = timer.timings
+
+    # Format the confidence as a percentage
+    result["confidence"] = int(result["confidence"] * 100)
+
+    metrics.record_analysis(result, 'streaming')
+    return result, plots
@@ -0,0 +1,366 @@
+import os
+import io
+import json
+import time
+import fcntl
+import shutil
+import tempfile
+
+import numpy as np
+import librosa
+import matplotlib
+from PIL import Image
+
+from .features import N_FFT, HOP_LENGTH
+from .rendering import SPECTROGRAM_ROWS, SPECTROGRAM_FMIN
+from .wavio import open_audio
+from .plots import touch, evict
+
+# Columns per tile; at level L each column covers 2**L STFT hops
+TILE_WIDTH = 256
+WAVEFORM_HEIGHT = 64
+
+# Spectrogram levels in dB relative to full scale, mapped onto 0-255
+DB_RANGE = (-120.0, 0.0)
+# STFT magnitude of a full-scale sine under a Hann window
+FULL_SCALE = N_FFT / 4
+
+# STFT columns computed per block read from the file
+BLOCK_COLUMNS = 16 * TILE_WIDTH
+
+SPECTROGRAM_COLORMAP = 'magma'
+WAVEFORM_COLORS = ((255, 255, 255), (31, 119, 180))  # background, envelope
+
+MANIFEST = 'manifest.json'
+
+# Files in the plot folder tracking a background build: held by the
+# building process, present while a build waits in the job pool, and
+# written instead of the manifest when the build fails
+BUILD_LOCK = 'tiles.lock'
+BUILD_QUEUED = 'tiles.queued'
+BUILD_ERROR = 'tiles.error'
+
+# A build still queued after this long is assumed lost and submitted again
+QUEUED_TIMEOUT = 10 * 60
+
+
+def level_count(n_columns):
+    """Number of levels needed for the coarsest one to fit in a single tile"""
+    levels = 1
+    while -(-n_columns // 2 ** (levels - 1)) > TILE_WIDTH:
+        levels += 1
+    return levels
+
+
+def _palette(colors):
+    """Flatten RGB colors into a PIL palette"""
+    return [channel for color in colors for channel in color]
+
+
+def _spectrogram_palette():
+    lut = matplotlib.colormaps[SPECTROGRAM_COLORMAP](np.linspace(0, 1, 256))[:, :3]
+    return _palette(np.round(lut * 255).astype(int).tolist())
+
+
+def _png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_spectrogram_tile(columns, palette):
+    """Spectrogram tile (rows, width) as a palette PNG, high frequencies at the top"""
+    image = Image.fromarray(np.ascontiguousarray(columns[::-1]), mode='L')
+    image = image.convert('P')
+    image.putpalette(palette)
+    return _png(image)
+
+
+def render_waveform_tile(columns):
+    """Waveform tile from per-column (min, max) levels as a two-colour PNG"""
+    lower, upper = columns.astype(int)
+    # Row 0 is the top of the image, i.e. level 255
+    rows = np.arange(WAVEFORM_HEIGHT)[:, None]
+    top = (255 - upper) * WAVEFORM_HEIGHT // 256
+    bottom = (255 - lower) * WAVEFORM_HEIGHT // 256
+    image = Image.fromarray(((rows >= top) & (rows <= bottom)).astype(np.uint8), mode='L')
+    image = image.convert('P')
+    image.putpalette(_palette(WAVEFORM_COLORS))
+    return _png(image)
+
+
+class TilePyramid:
+    """
+    Writes the tiles of every level of one image pyramid as columns arrive.
+
+    Columns are written to level 0 at full resolution and pooled in pairs
+    into each coarser level, so the whole pyramid is built in one pass with
+    only a tile's worth of columns held per level.
+
+    Args:
+        folder: Directory the `<level>/<x>.png` tiles are written to
+        n_levels: Number of levels
+        pool: Function reducing an array of shape (rows, n, 2) to (rows, n)
+        render: Function turning a (rows, width) uint8 array into PNG bytes
+    """
+
+    def __init__(self, folder, n_levels, pool, render):
+        self.folder = folder
+        self.pool = pool
+        self.render = render
+        self.pending = [None] * n_levels
+        self.carry = [None] * n_levels
+        self.written = [0] * n_levels
+        for level in range(n_levels):
+            os.makedirs(os.path.join(folder, str(level)), exist_ok=True)
+
+    @staticmethod
+    def _join(head, tail):
+        return tail if head is None else np.concatenate([head, tail], axis=1)
+
+    def _write(self, level, columns):
+        path = os.path.join(self.folder, str(level), f'{self.written[level]}.png')
+        with open(path, 'wb') as f:
+            f.write(self.render(columns))
+        self.written[level] += 1
+
+    def push(self, columns, level=0):
+        """Add columns (rows, n) to `level` and, pooled, to the levels above it"""
+        if columns.shape[1] == 0:
+            return
+        pending = self._join(self.pending[level], columns)
+        while pending.shape[1] >= TILE_WIDTH:
+            self._write(level, pending[:, :TILE_WIDTH])
+            pending = pending[:, TILE_WIDTH:]
+        self.pending[level] = pending
+
+        if level + 1 < len(self.pending):
+            pairs = self._join(self.carry[level], columns)
+            n_pairs = pairs.shape[1] // 2
+            self.carry[level] = pairs[:, 2 * n_pairs:]
+            self.push(self.pool(pairs[:, :2 * n_pairs].reshape(len(pairs), n_pairs, 2)), level + 1)
+
+    def finish(self):
+        """Write the last, partial tile of every level"""
+        for level in range(len(self.pending)):
+            carry = self.carry[level]
+            if carry is not None and carry.shape[1] and level + 1 < len(self.pending):
+                # An unpaired last column pools with nothing
+                self.carry[level] = None
+                self.push(carry, level + 1)
+            if self.pending[level] is not None and self.pending[level].shape[1]:
+                self._write(level, self.pending[level])
+                self.pending[level] = None
+
+
+def _pool_spectrogram(pairs):
+    return pairs.max(axis=2)
+
+
+def _pool_waveform(pairs):
+    return np.stack([pairs[0].min(axis=1), pairs[1].max(axis=1)])
+
+
+def _quantize_db(magnitude):
+    db = 20 * np.log10(np.maximum(magnitude, 1e-10) / FULL_SCALE)
+    scaled = (db - DB_RANGE[0]) * (255 / (DB_RANGE[1] - DB_RANGE[0]))
+    return np.clip(np.round(scaled), 0, 255).astype(np.uint8)
+
+
+def _quantize_samples(y):
+    return np.clip(np.round((y + 1) * 127.5), 0, 255).astype(np.uint8)
+
+
+def build_tiles(file_path, folder):
+    """
+    Compute the spectrogram and waveform pyramids of a recording.
+
+    The file is read block by block, so memory use doesn't depend on its
+    length. Level 0 has one column per STFT frame (HOP_LENGTH samples);
+    the spectrogram rows are the log-spaced rows of the static spectrogram
+    plot, each column keeping the maximum of the bins it covers, in dB
+    relative to full scale. Each coarser level keeps the maximum (and for
+    the waveform, also the minimum) of pairs of columns, so short events
+    stay visible when zoomed out.
+
+    Args:
+        file_path: Path to the audio file
+        folder: Directory to write `manifest.json` and the
+            `spectrogram/<level>/<x>.png` and `waveform/<level>/<x>.png`
+            tiles to
+
+    Returns:
+        The manifest dictionary
+    """
+    with open_audio(file_path) as audio:
+        sr = audio.samplerate
+        n_samples = audio.frames
+        # As librosa.stft(center=True), but zero-padded
+        n_columns = 1 + n_samples // HOP_LENGTH
+        n_levels = level_count(n_columns)
+
+        bin_hz = sr / N_FFT
+        edges = np.geomspace(SPECTROGRAM_FMIN, sr / 2, SPECTROGRAM_ROWS + 1) / bin_hz
+        row_starts = np.unique(np.clip(np.floor(edges[:-1]).astype(int), 1, N_FFT // 2))
+
+        palette = _spectrogram_palette()
+        spectrogram = TilePyramid(os.path.join(folder, 'spectrogram'), n_levels, _pool_spectrogram,
+                                  lambda columns: render_spectrogram_tile(columns, palette))
+        waveform = TilePyramid(os.path.join(folder, 'waveform'), n_levels, _pool_waveform,
+                               render_waveform_tile)
+
+        # Samples not yet covered by a whole STFT frame / waveform column;
+        # the signal is zero-padded by half a frame on each side, as
+        # librosa.stft(center=True) pads it
+        frame_buffer = np.zeros(N_FFT // 2, dtype=np.float32)
+        column_buffer = np.zeros(0, dtype=np.float32)
+
+        def push_frames(y):
+            nonlocal frame_buffer
+            frame_buffer = np.concatenate([frame_buffer, y])
+            if len(frame_buffer) < N_FFT:
+                return
+            n_frames = (len(frame_buffer) - N_FFT) // HOP_LENGTH + 1
+            magnitude = np.abs(librosa.stft(frame_buffer[:(n_frames - 1) * HOP_LENGTH + N_FFT],
+                                            n_fft=N_FFT, hop_length=HOP_LENGTH, center=False))
+            spectrogram.push(_quantize_db(np.maximum.reduceat(magnitude, row_starts, axis=0)))
+            frame_buffer = frame_buffer[n_frames * HOP_LENGTH:]
+
+        for y in audio.blocks(BLOCK_COLUMNS * HOP_LENGTH):
+            push_frames(y)
+
+            # Waveform column k covers samples k * HOP_LENGTH onwards
+            column_buffer = np.concatenate([column_buffer, y])
+            n_full = len(column_buffer) // HOP_LENGTH
+            buckets = column_buffer[:n_full * HOP_LENGTH].reshape(n_full, HOP_LENGTH)
+            waveform.push(_quantize_samples(np.stack([buckets.min(axis=1), buckets.max(axis=1)])))
+            column_buffer = column_buffer[n_full * HOP_LENGTH:]
+
+    push_frames(np.zeros(N_FFT // 2, dtype=np.float32))
+    # The last column holds the leftover samples (silence if there are none)
+    last = column_buffer if len(column_buffer) else np.zeros(1, dtype=np.float32)
+    waveform.push(_quantize_samples(np.array([[last.min()], [last.max()]])))
+
+    spectrogram.finish()
+    waveform.finish()
+
+    manifest = {
+        "duration": n_samples / sr,
+        "sample_rate": sr,
+        "hop_length": HOP_LENGTH,
+        "columns": n_columns,
+        "levels": n_levels,
+        "tile_width": TILE_WIDTH,
+        "spectrogram_height": len(row_starts),
+        "waveform_height": WAVEFORM_HEIGHT,
+        "row_freqs": (row_starts * bin_hz).tolist(),
+        "db_range": list(DB_RANGE),
+    }
+    with open(os.path.join(folder, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+class TileBuildError(Exception):
+    """Raised for a recording whose tile pyramid could not be built"""
+
+
+def _build_running(plot_dir):
+    """Whether a process holds the build lock of a plot folder"""
+    try:
+        with open(os.path.join(plot_dir, BUILD_LOCK), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    return False
+
+
+def _build_queued(plot_dir):
+    """Whether a build was submitted recently and hasn't started yet"""
+    try:
+        return time.time() - os.path.getmtime(os.path.join(plot_dir, BUILD_QUEUED)) < QUEUED_TIMEOUT
+    except OSError:
+        return False
+
+
+def build_pyramid(plot_dir, file_path, max_bytes=None):
+    """
+    Build a recording's tile pyramid into `<plot_dir>/tiles`, unless
+    another process is already building it. Runs in the job pool.
+
+    The pyramid is built in a temporary folder and moved into place, so
+    requests never see a partial pyramid. If the build fails, the error is
+    written to BUILD_ERROR instead.
+
+    Args:
+        max_bytes: Size the plot folders are trimmed to after the build,
+            as for `plots.ensure_plot`
+    """
+    folder = os.path.join(plot_dir, 'tiles')
+    os.makedirs(plot_dir, exist_ok=True)
+    with open(os.path.join(plot_dir, BUILD_LOCK), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        try:
+            os.remove(os.path.join(plot_dir, BUILD_QUEUED))
+        except OSError:
+            pass
+        if os.path.exists(os.path.join(folder, MANIFEST)):
+            return
+
+        tmp_folder = tempfile.mkdtemp(dir=plot_dir, suffix='.part')
+        try:
+            build_tiles(file_path, tmp_folder)
+            os.rename(tmp_folder, folder)
+        except FileNotFoundError:
+            # The upload was deleted; requests for its tiles now 404
+            pass
+        except Exception as e:
+            with open(os.path.join(plot_dir, BUILD_ERROR), 'w') as f:
+                f.write(str(e))
+        finally:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+    touch(plot_dir)
+    if max_bytes is not None:
+        evict(os.path.dirname(plot_dir), max_bytes, keep=(plot_dir,))
+
+
+def ensure_tiles(plot_dir, file_path, submit, max_bytes=None):
+    """
+    Return the folder holding a recording's tile pyramid, or start building
+    it in the background on first request.
+
+    Building takes about 5 s per 10 minutes of 44.1 kHz audio, longer than
+    a request may take for long recordings, so it runs in the job pool (see
+    `build_pyramid`) and requests poll until the manifest exists.
+
+    Args:
+        submit: Function running a function and its arguments in the
+            background, e.g. `JobQueue.run`
+        max_bytes: Passed on to `build_pyramid`
+
+    Returns:
+        Path of the folder, which contains `manifest.json`, or None while
+        the pyramid is being built
+
+    Raises:
+        TileBuildError: If building the pyramid failed
+    """
+    folder = os.path.join(plot_dir, 'tiles')
+    if os.path.exists(os.path.join(folder, MANIFEST)):
+        touch(plot_dir)
+        return folder
+    try:
+        with open(os.path.join(plot_dir, BUILD_ERROR)) as f:
+            raise TileBuildError(f.read())
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(plot_dir, exist_ok=True)
+    if not _build_running(plot_dir) and not _build_queued(plot_dir):
+        with open(os.path.join(plot_dir, BUILD_QUEUED), 'w'):
+            pass
+        submit(build_pyramid, plot_dir, file_path, max_bytes)
+    return None
@@ -0,0 +1,210 @@
+import os
+import time
+import hashlib
+import tempfile
+
+from flask import Request, current_app
+
+from .cache import CHUNK_SIZE
+from .wavio import InvalidAudioError, WavHeaderCheck
+
+# Temporary files older than this were left behind by an interrupted upload
+STALE_PART_SECONDS = 60 * 60
+
+# Uploads stored or used (see `mark_used`) more recently than this are
+# never deleted by the quota: a synchronous analysis, plot render or tile
+# build may still be reading them
+QUOTA_GRACE_SECONDS = 15 * 60
+
+
+class UploadFile:
+    """
+    Destination of one multipart file upload, written straight into the
+    upload folder.
+
+    The content is hashed and its WAV header validated while Werkzeug
+    parses the request, so storing the upload afterwards is a rename rather
+    than another copy. Once the header is known to be invalid the rest of
+    the file is discarded instead of written to disk. Files that are never
+    saved are deleted when the request closes them.
+
+    Args:
+        folder: Upload folder the temporary file is created in
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        fd, self.path = tempfile.mkstemp(dir=folder, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.header = WavHeaderCheck()
+        self.error = None
+        self.saved = False
+
+    def __getattr__(self, name):
+        # read, seek, tell, ... go to the underlying file
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def write(self, data):
+        if self.error is not None:
+            return len(data)
+        try:
+            self.header.feed(data)
+        except InvalidAudioError as e:
+            self.error = e
+            self.file.seek(0)
+            self.file.truncate()
+            return len(data)
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def save(self, suffix='.wav'):
+        """
+        Store the upload under its content hash.
+
+        Returns:
+            digest: Hex SHA-256 of the content
+            filepath: Path of the stored file
+
+        Raises:
+            InvalidAudioError: If the upload is not a supported WAV file
+        """
+        if self.error is not None:
+            raise self.error
+        self.header.finish()
+        self.file.flush()
+        digest = self.sha256.hexdigest()
+        filepath = os.path.join(self.folder, digest + suffix)
+        os.replace(self.path, filepath)
+        self.saved = True
+        return digest, filepath
+
+    def close(self):
+        self.file.close()
+        if not self.saved and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadRequest(Request):
+    """Request that streams file uploads directly into the upload folder"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return UploadFile(current_app.config['UPLOAD_FOLDER'])
+
+
+def save_and_hash(stream, folder, suffix='.wav'):
+    """
+    Copy an upload stream to disk while hashing it.
+
+    The file is stored under its SHA-256 digest, so re-submitting the same
+    evidence reuses the existing copy instead of adding another one. The
+    WAV header is checked as soon as the first bytes arrive, before the
+    rest of the stream is read.
+
+    Returns:
+        digest: Hex SHA-256 of the content
+        filepath: Path of the stored file
+
+    Raises:
+        InvalidAudioError: If the upload is not a supported WAV file
+    """
+    if isinstance(stream, UploadFile):
+        # Already on disk and hashed while the request was parsed
+        return stream.save(suffix)
+
+    sha256 = hashlib.sha256()
+    header = WavHeaderCheck()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                header.feed(chunk)
+                sha256.update(chunk)
+                out.write(chunk)
+        header.finish()
+        digest = sha256.hexdigest()
+        filepath = os.path.join(folder, digest + suffix)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest, filepath
+
+
+def enforce_quota(folder, max_bytes, keep=(), grace_seconds=QUOTA_GRACE_SECONDS):
+    """
+    Trim the stored uploads (`.wav` files) in `folder` to `max_bytes`.
+
+    The least recently used files (by mtime, see `mark_used`) are deleted
+    first; files in `keep` (e.g. those waiting for analysis) and files used
+    within the last `grace_seconds` are never deleted. Temporary files
+    abandoned by interrupted uploads are removed as well.
+
+    Returns:
+        Number of files deleted
+    """
+    now = time.time()
+    keep = {os.path.abspath(path) for path in keep}
+    files = []
+    removed = 0
+    for entry in os.scandir(folder):
+        if not entry.is_file():
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        if entry.name.endswith('.part'):
+            if now - stat.st_mtime > STALE_PART_SECONDS:
+                removed += _remove(entry.path)
+            continue
+        if entry.name.endswith('.wav'):
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep or now - mtime < grace_seconds:
+            continue
+        removed += _remove(path)
+        total -= size
+    return removed
+
+
+def mark_used(path):
+    """Mark a stored upload as recently used, so the quota keeps it for a while"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def save_upload(stream):
+    """
+    Save an upload to the upload folder and keep the folder within its quota.
+
+    Returns:
+        digest, filepath: As for `save_and_hash`
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    digest, filepath = save_and_hash(stream, folder)
+    keep = current_app.extensions['job_queue'].pending_files() | {filepath}
+    enforce_quota(folder, current_app.config['UPLOAD_QUOTA_MB'] * 1024 * 1024, keep)
+    return digest, filepath
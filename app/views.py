@@ -1,21 +1,50 @@
 import os
-import uuid
+import re
+import time
 from flask import (
     Blueprint, flash, redirect, render_template, 
-    request, url_for, current_app, send_from_directory
+    request, url_for, current_app, send_from_directory, jsonify, abort, Response
 )
 from werkzeug.utils import secure_filename
 from .forms import UploadForm
-from .audio_analysis import analyze_audio_file
+from .cache import analyze_cached
+from .uploads import save_upload, mark_used
+from .wavio import InvalidAudioError
+from .jobs import QueueFullError
+from .detectors import request_selection
+from .history import request_page
+from .plots import PLOT_NAMES, available_plots, ensure_plot, plot_key
+from . import metrics
 
 bp = Blueprint('views', __name__)
 
 ALLOWED_EXTENSIONS = {'wav'}
 
+# Plot images never change once rendered, so browsers may keep them for a year
+PLOT_MAX_AGE = 365 * 24 * 60 * 60
+
+PLOT_KEY_RE = re.compile(r'[0-9a-f]{64}-r[0-9]+')
+
+TILE_KINDS = ('spectrogram', 'waveform')
+
+# Seconds clients wait before polling again for a tile pyramid being built
+TILE_RETRY_SECONDS = 2
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def plot_urls(filepath, **url_options):
+    """URLs of the lazily rendered plots for a content-addressed upload"""
+    digest = os.path.splitext(os.path.basename(filepath))[0]
+    key = plot_key(digest)
+    urls = {
+        name: url_for('views.plot', key=key, name=name, **url_options)
+        for name in available_plots(filepath)
+    }
+    urls["tiles"] = url_for('views.tile_manifest', key=key, **url_options)
+    return urls
+
 @bp.route('/', methods=('GET', 'POST'))
 def index():
     form = UploadForm()
@@ -29,25 +58,217 @@ def index():
             flash('No selected file')
             return redirect(request.url)
             
+        try:
+            detectors = request_selection(request.args)
+        except ValueError as e:
+            flash(f'{e}.')
+            return render_template('index.html', form=form), 400
+            
         if file and allowed_file(file.filename):
-            # Generate a unique filename to prevent overwriting
+            # Store the upload under its content hash
             original_filename = secure_filename(file.filename)
-            filename = f"{uuid.uuid4()}_{original_filename}"
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            try:
+                digest, filepath = save_upload(file.stream)
+            except InvalidAudioError as e:
+                flash(f'Invalid WAV file: {e}.')
+                return render_template('index.html', form=form), 400
+            cache = current_app.extensions['result_cache']
             
-            # Analyze the audio file
-            result, plots = analyze_audio_file(filepath)
+            # Queue the analysis and return immediately in async mode,
+            # unless the same file has already been analyzed
+            if current_app.config['ASYNC_ANALYSIS'] or request.args.get('async') == '1':
+                cached = cache.get(cache.key(digest, detectors))
+                if cached is not None:
+                    result, _ = cached
+                    token = current_app.extensions['history'].record(
+                        digest, original_filename, result, detectors)
+                    return render_template('results.html',
+                                          result=result,
+                                          plots=plot_urls(filepath),
+                                          filename=original_filename,
+                                          permalink=url_for('views.history_entry', token=token, _external=True))
+                try:
+                    job_id = current_app.extensions['job_queue'].submit(
+                        filepath, original_filename, cache_key=cache.key(digest, detectors),
+                        detectors=detectors)
+                except QueueFullError:
+                    flash('The analysis queue is full. Please try again in a few minutes.')
+                    return render_template('index.html', form=form), 503
+                return redirect(url_for('views.job', job_id=job_id))
             
+            # Analyze the audio file (or reuse a previous analysis of it);
+            # plots are rendered when the browser first asks for them
+            result, _ = analyze_cached(cache, filepath, digest, include_plots=False,
+                                       detectors=detectors)
+            if "error" in result:
+                flash(result["error"])
+                return render_template('index.html', form=form)
+            
+            # Keep the analysis so it can be re-opened without re-uploading
+            token = current_app.extensions['history'].record(
+                digest, original_filename, result, detectors)
             return render_template('results.html', 
                                   result=result, 
-                                  plots=plots, 
-                                  filename=original_filename)
+                                  plots=plot_urls(filepath), 
+                                  filename=original_filename,
+                                  permalink=url_for('views.history_entry', token=token, _external=True))
         else:
             flash('File type not allowed. Please upload a WAV file.')
             
     return render_template('index.html', form=form)
 
+@bp.route('/jobs/<job_id>')
+def job(job_id):
+    job = current_app.extensions['job_queue'].get(job_id)
+    if job is None:
+        abort(404)
+        
+    if job['status'] == 'done':
+        return render_template('results.html',
+                              result=job['result'],
+                              plots=plot_urls(job['file_path']),
+                              filename=job['filename'])
+    if job['status'] == 'failed':
+        flash(job['error'])
+        return redirect(url_for('views.index'))
+        
+    return render_template('job.html', job=job)
+
+@bp.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = current_app.extensions['job_queue'].get(job_id)
+    if job is None:
+        abort(404)
+        
+    return jsonify({
+        key: job[key] for key in (
+            'id', 'filename', 'status', 'error', 'submitted_at',
+            'started_at', 'finished_at', 'queue_wait', 'run_time'
+        )
+    })
+
+@bp.route('/history')
+def history():
+    try:
+        page = request_page(request.args)
+    except ValueError as e:
+        flash(f'{e}.')
+        return redirect(url_for('views.history'))
+        
+    # Filters carry over to the older/newer page links
+    filters = {key: request.args[key] for key in ('verdict', 'sha256', 'limit')
+               if request.args.get(key)}
+    return render_template('history.html',
+                          page=current_app.extensions['history'].page(**page),
+                          filters=filters)
+
+@bp.route('/history/<token>')
+def history_entry(token):
+    analysis = current_app.extensions['history'].get(token)
+    if analysis is None:
+        abort(404)
+        
+    # The stored result is shown as is; plots need the upload, which may
+    # have been deleted to stay within the upload quota
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], analysis['sha256'] + '.wav')
+    return render_template('results.html',
+                          result=analysis['result'],
+                          plots=plot_urls(filepath) if os.path.exists(filepath) else {},
+                          filename=analysis['filename'],
+                          permalink=url_for('views.history_entry', token=token, _external=True),
+                          analyzed_at=analysis['created_at'])
+
+@bp.app_template_filter('timestamp')
+def format_timestamp(value):
+    """Local date and time of a Unix timestamp"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(value))
+
+@bp.route('/cache/stats')
+def cache_stats():
+    return jsonify(current_app.extensions['result_cache'].stats())
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def _plot_source(key):
+    """Plot folder and uploaded file for a plot key, or 404"""
+    if not PLOT_KEY_RE.fullmatch(key):
+        abort(404)
+    digest = key.split('-')[0]
+    if key != plot_key(digest):
+        # Rendered by a different render version
+        abort(404)
+        
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], digest + '.wav')
+    if not os.path.exists(filepath):
+        # Deleted by the upload quota
+        abort(404)
+    # Keep the upload while its images are being rendered
+    mark_used(filepath)
+    return os.path.join(current_app.config['PLOT_FOLDER'], key), filepath
+
+def _plot_max_bytes():
+    return current_app.config['PLOT_MAX_MB'] * 1024 * 1024
+
+def _send_immutable(directory, path):
+    """Serve a file that never changes once written, with long-lived cache headers"""
+    response = send_from_directory(directory, path, max_age=PLOT_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/plots/<key>/<name>.png')
+def plot(key, name):
+    if name not in PLOT_NAMES:
+        abort(404)
+    plot_dir, filepath = _plot_source(key)
+    try:
+        path = ensure_plot(plot_dir, filepath, name, max_bytes=_plot_max_bytes())
+    except FileNotFoundError:
+        # The upload was deleted in the meantime
+        abort(404)
+    if path is None:
+        abort(404)
+        
+    return _send_immutable(plot_dir, name + '.png')
+
+def _tile_folder(key):
+    """Tile folder for a plot key, None while it is being built, or 404"""
+    from .tiles import TileBuildError, ensure_tiles
+    plot_dir, filepath = _plot_source(key)
+    try:
+        return ensure_tiles(plot_dir, filepath, current_app.extensions['job_queue'].run,
+                            max_bytes=_plot_max_bytes())
+    except TileBuildError:
+        abort(404)
+
+def _tiles_building():
+    """Response asking the client to poll until the tile pyramid is built"""
+    response = jsonify({"status": "building"})
+    response.status_code = 202
+    response.headers['Retry-After'] = str(TILE_RETRY_SECONDS)
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/plots/<key>/tiles.json')
+def tile_manifest(key):
+    from .tiles import MANIFEST
+    folder = _tile_folder(key)
+    if folder is None:
+        return _tiles_building()
+    return _send_immutable(folder, MANIFEST)
+
+@bp.route('/plots/<key>/tiles/<kind>/<int:level>/<int:x>.png')
+def tile(key, kind, level, x):
+    if kind not in TILE_KINDS:
+        abort(404)
+    folder = _tile_folder(key)
+    if folder is None:
+        return _tiles_building()
+    # send_from_directory 404s for tiles beyond the pyramid
+    return _send_immutable(folder, f'{kind}/{level}/{x}.png')
+
 @bp.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
@@ -0,0 +1,388 @@
+import os
+import mmap
+import struct
+
+import numpy as np
+
+# The fmt chunk must appear within this many bytes of the start of the file
+MAX_HEADER_BYTES = 64 * 1024
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample formats the analysis can decode, and their sample widths
+SUPPORTED_FORMATS = {
+    WAVE_FORMAT_PCM: (8, 16, 24, 32),
+    WAVE_FORMAT_IEEE_FLOAT: (32, 64),
+}
+
+MAX_CHANNELS = 64
+MAX_SAMPLE_RATE = 768000
+
+
+class InvalidAudioError(ValueError):
+    """Raised when an upload is not a WAV file the analysis can read"""
+
+
+def parse_wav_header(data):
+    """
+    Parse and validate the RIFF/WAVE header at the start of a file.
+
+    Only the first bytes are needed: chunks before `fmt ` are skipped
+    without being read, and the sample data is never touched.
+
+    Args:
+        data: The first bytes of the file
+
+    Returns:
+        Dictionary with `format`, `channels`, `sample_rate` and
+        `bits_per_sample`, or None if `data` ends before the `fmt ` chunk
+
+    Raises:
+        InvalidAudioError: If the file is not a supported WAV file
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] not in (b'RIFF', b'RF64') or data[8:12] != b'WAVE':
+        raise InvalidAudioError("Not a WAV file")
+
+    offset = 12
+    while True:
+        if offset > MAX_HEADER_BYTES:
+            raise InvalidAudioError("WAV file has no format chunk")
+        if len(data) < offset + 8:
+            return None
+        chunk_id, chunk_size = struct.unpack_from('<4sI', data, offset)
+        if chunk_id == b'data':
+            raise InvalidAudioError("WAV file has no format chunk")
+        if chunk_id == b'fmt ':
+            break
+        # Chunks are padded to an even size
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    if chunk_size < 16:
+        raise InvalidAudioError("Truncated WAV format chunk")
+    body = data[offset + 8:offset + 8 + min(chunk_size, 40)]
+    if len(body) < min(chunk_size, 40):
+        return None
+
+    audio_format, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', body)
+    if audio_format == WAVE_FORMAT_EXTENSIBLE:
+        if len(body) < 26:
+            raise InvalidAudioError("Truncated WAV format chunk")
+        # The sub-format GUID starts with the actual format code
+        audio_format, = struct.unpack_from('<H', body, 24)
+
+    if audio_format not in SUPPORTED_FORMATS:
+        raise InvalidAudioError(f"Unsupported WAV encoding (format 0x{audio_format:04x}); "
+                                "please upload PCM or floating point audio")
+    if bits not in SUPPORTED_FORMATS[audio_format]:
+        raise InvalidAudioError(f"Unsupported sample width: {bits} bits")
+    if not 1 <= channels <= MAX_CHANNELS:
+        raise InvalidAudioError(f"Unsupported channel count: {channels}")
+    if not 1 <= sample_rate <= MAX_SAMPLE_RATE:
+        raise InvalidAudioError(f"Unsupported sample rate: {sample_rate} Hz")
+    if block_align != channels * bits // 8:
+        raise InvalidAudioError("Inconsistent WAV format chunk")
+
+    return {
+        "format": audio_format,
+        "channels": channels,
+        "sample_rate": sample_rate,
+        "bits_per_sample": bits,
+    }
+
+
+class WavHeaderCheck:
+    """
+    Validate a WAV header incrementally while a file is being received.
+
+    Feed the file's bytes in order; the header is parsed as soon as enough
+    of it has arrived, so an invalid upload can be rejected after its
+    first chunk instead of after the whole file has been stored.
+    """
+
+    def __init__(self):
+        self.header = b''
+        self.info = None
+
+    def feed(self, chunk):
+        """
+        Add the next bytes of the file.
+
+        Raises:
+            InvalidAudioError: As soon as the header is known to be invalid
+        """
+        if self.info is None:
+            self.header += chunk[:MAX_HEADER_BYTES + 64 - len(self.header)]
+            self.info = parse_wav_header(self.header)
+            if self.info is None and len(self.header) > MAX_HEADER_BYTES:
+                raise InvalidAudioError("WAV file has no format chunk")
+
+    def finish(self):
+        """
+        Check that the whole header was received.
+
+        Returns:
+            The parsed header (see `parse_wav_header`)
+        """
+        if self.info is None:
+            raise InvalidAudioError("Not a WAV file" if len(self.header) < 12
+                                    else "Truncated WAV header")
+        return self.info
+
+
+# Sample dtypes that can be memory-mapped directly (24-bit PCM has no numpy
+# dtype and is mapped as bytes)
+SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype('u1'),
+    (WAVE_FORMAT_PCM, 16): np.dtype('<i2'),
+    (WAVE_FORMAT_PCM, 32): np.dtype('<i4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype('<f8'),
+}
+
+# Frames converted to float at a time when reading a whole file
+READ_BLOCK_FRAMES = 1 << 20
+
+
+def locate_data_chunk(f, size):
+    """
+    Find the sample data of an open WAV file.
+
+    Args:
+        f: Binary file positioned anywhere
+        size: Size of the file in bytes
+
+    Returns:
+        Tuple of (offset, length) of the `data` chunk body, clipped to the
+        end of the file
+
+    Raises:
+        InvalidAudioError: If the file has no `data` chunk
+    """
+    f.seek(0)
+    riff = f.read(12)
+    rf64_data_size = None
+    offset = 12
+    while offset + 8 <= size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+        if chunk_id == b'ds64' and riff[:4] == b'RF64':
+            # 64-bit sizes of the RIFF and data chunks
+            _, rf64_data_size = struct.unpack('<QQ', f.read(16))
+        elif chunk_id == b'data':
+            if chunk_size == 0xFFFFFFFF and rf64_data_size is not None:
+                chunk_size = rf64_data_size
+            # Recorders that were cut off leave a size larger than the file
+            return offset + 8, min(chunk_size, size - offset - 8)
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise InvalidAudioError("WAV file has no data chunk")
+
+
+class WavReader:
+    """
+    Memory-mapped reader for uncompressed WAV files.
+
+    The sample data is mapped rather than read, so opening a file costs
+    nothing however large it is; pages are only faulted in as samples are
+    converted. Samples are scaled to float32 exactly as libsndfile does, so
+    the result is identical to `librosa.load(..., sr=None)`.
+
+    Args:
+        file_path: Path to a PCM or IEEE float WAV file
+
+    Raises:
+        InvalidAudioError: If the file is not a supported WAV file
+    """
+
+    def __init__(self, file_path):
+        size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            info = parse_wav_header(f.read(MAX_HEADER_BYTES + 64))
+            if info is None:
+                raise InvalidAudioError("Truncated WAV header")
+            data_offset, data_size = locate_data_chunk(f, size)
+
+        self.samplerate = info["sample_rate"]
+        self.channels = info["channels"]
+        self.format = info["format"]
+        self.bits_per_sample = info["bits_per_sample"]
+        width = self.bits_per_sample // 8
+        self.frames = data_size // (width * self.channels)
+
+        dtype = SAMPLE_DTYPES.get((self.format, self.bits_per_sample))
+        shape = (self.frames, self.channels) if dtype is not None else (self.frames, self.channels, width)
+        self._frame_bytes = width * self.channels
+        if self.frames == 0:
+            self._data = np.zeros(shape, dtype=dtype or np.uint8)
+            self._map = None
+        else:
+            self._data = np.memmap(file_path, dtype=dtype or np.uint8, mode='r',
+                                   offset=data_offset, shape=shape)
+            self._map = self._data._mmap
+            # np.memmap maps from the allocation boundary below the data
+            self._map_offset = data_offset % mmap.ALLOCATIONGRANULARITY
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the mapping (views handed out keep it alive until dropped)"""
+        self._data = self._map = None
+
+    def _release(self, start, stop):
+        """
+        Drop the pages of frames `start:stop` from this process once they
+        have been converted. They stay in the page cache, but no longer count
+        towards the process's RSS, so reading a file block by block takes
+        the memory of one block rather than of the whole file.
+        """
+        if self._map is None or not hasattr(self._map, 'madvise'):
+            return
+        begin = self._map_offset + start * self._frame_bytes
+        end = self._map_offset + stop * self._frame_bytes
+        begin -= begin % mmap.PAGESIZE
+        end = min(end - end % mmap.PAGESIZE, len(self._map))
+        if end > begin:
+            self._map.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+    def channel(self, index):
+        """
+        Zero-copy view of one channel's raw samples.
+
+        The view is strided over the interleaved data and keeps the file's
+        sample type (raw bytes, shape (frames, 3), for 24-bit PCM).
+        """
+        return self._data[:, index]
+
+    def _to_float(self, raw):
+        """Convert raw samples to float32 with libsndfile's scaling"""
+        if self.format == WAVE_FORMAT_IEEE_FLOAT:
+            return raw.astype(np.float32)
+        if self.bits_per_sample == 8:
+            # 8-bit WAV is unsigned, centred on 128
+            return (raw.astype(np.float32) - 128) * np.float32(1 / 128)
+        if self.bits_per_sample == 24:
+            # Place the three bytes in the top of an int32, as libsndfile does
+            padded = np.zeros(raw.shape[:-1] + (4,), dtype=np.uint8)
+            padded[..., 1:] = raw
+            raw = padded.view('<i4')[..., 0]
+            bits = 32
+        else:
+            bits = self.bits_per_sample
+        return raw.astype(np.float32) * np.float32(2.0 ** (1 - bits))
+
+    def read(self, start=0, stop=None, mono=True):
+        """
+        Convert a range of frames to float32.
+
+        Args:
+            start, stop: Frame range (defaults to the whole file)
+            mono: Average the channels into one signal
+
+        Returns:
+            Array of shape (samples,) for mono output or single-channel
+            files, otherwise (channels, samples)
+        """
+        stop = self.frames if stop is None else min(stop, self.frames)
+        start = min(start, stop)
+        if self.channels == 1 or not mono:
+            out = np.empty((self.channels, stop - start), dtype=np.float32)
+        else:
+            out = np.empty(stop - start, dtype=np.float32)
+
+        # Convert a block at a time so the temporaries stay small
+        for block_start in range(start, stop, READ_BLOCK_FRAMES):
+            block_stop = min(block_start + READ_BLOCK_FRAMES, stop)
+            target = slice(block_start - start, block_stop - start)
+            raw = self._data[block_start:block_stop]
+            if out.ndim == 2:
+                for c in range(self.channels):
+                    out[c, target] = self._to_float(raw[:, c])
+            else:
+                # Same summation order and division as np.mean(axis=0)
+                mix = self._to_float(raw[:, 0])
+                for c in range(1, self.channels):
+                    mix += self._to_float(raw[:, c])
+                out[target] = mix / np.float32(self.channels)
+            self._release(block_start, block_stop)
+
+        return out[0] if out.ndim == 2 and self.channels == 1 else out
+
+    def blocks(self, block_frames, mono=True):
+        """Yield consecutive float32 blocks of `block_frames` frames"""
+        for start in range(0, self.frames, block_frames):
+            yield self.read(start, start + block_frames, mono=mono)
+
+
+class SoundFileReader:
+    """`WavReader` interface over libsndfile, for files that can't be mapped"""
+
+    def __init__(self, file_path):
+        import soundfile as sf
+        self._file = sf.SoundFile(file_path)
+        self.samplerate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def blocks(self, block_frames, mono=True):
+        """Yield consecutive float32 blocks of `block_frames` frames"""
+        for block in self._file.blocks(blocksize=block_frames, dtype='float32', always_2d=True):
+            if self.channels == 1:
+                yield block[:, 0]
+            elif mono:
+                yield block.mean(axis=1)
+            else:
+                yield block.T
+
+
+def open_audio(file_path):
+    """
+    Open an audio file for block-wise reading.
+
+    Returns:
+        A `WavReader` for uncompressed WAV files, otherwise a
+        `SoundFileReader`
+    """
+    try:
+        return WavReader(file_path)
+    except (InvalidAudioError, ValueError, struct.error):
+        return SoundFileReader(file_path)
+
+
+def load_audio(file_path, mono=True):
+    """
+    Load an audio file at its native sample rate.
+
+    Uncompressed WAV files are read through `WavReader`; anything else
+    falls back to librosa.
+
+    Args:
+        file_path: Path to the audio file
+        mono: Downmix multi-channel audio
+
+    Returns:
+        Tuple of (float32 samples, sample rate), shaped like the output of
+        `librosa.load(file_path, sr=None, mono=mono)`
+    """
+    try:
+        reader = WavReader(file_path)
+    except (InvalidAudioError, ValueError, struct.error):
+        import librosa
+        return librosa.load(file_path, sr=None, mono=mono)
+    with reader:
+        return reader.read(mono=mono), reader.samplerate
@@ -0,0 +1,163 @@
+"""
+Time and check copy-move detection on long recordings.
+
+Writes speech-like recordings (voiced and unvoiced syllables with pauses,
+over room noise) of each duration, with stretches of 1.5, 3 and 8 seconds
+copied to random places at sample offsets that don't line up with the MFCC
+frames, one of them at a lower level. Each is analyzed with the
+`copy_move` detector only:
+
+- every copy must be reported, with its source and destination within
+  TOLERANCE seconds of the truth (the detector can't tell which is the
+  original, so it reports the earlier one as the source),
+- nothing else may be reported,
+- the search itself (the stage time less the shared spectral features)
+  must take less than MAX_SEARCH_SECONDS_PER_HOUR, pro rata.
+
+For comparison the exact frame-by-frame self-similarity search is timed on
+the shortest recording and extrapolated quadratically to the others.
+
+Exits non-zero if any check fails.
+
+Usage:
+    python benchmarks/bench_copy_move.py [durations ...]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_DURATIONS = (60, 600, 3600)  # seconds
+SAMPLE_RATE = 16000
+COPIES = ((1.5, 1.0), (3, 1.0), (8, 0.5))  # (seconds, gain) of each copy
+
+TOLERANCE = 0.25  # seconds
+MAX_SEARCH_SECONDS_PER_HOUR = 30
+
+# FeatureStore timings of the spectral features the detector reads
+FEATURE_TIMINGS = ('resample', 'stft_magnitude', 'power_spectrogram', 'mel_spectrogram', 'mfcc')
+
+
+def speech_like(seconds, sr, seed):
+    """Syllables of a harmonic or noise source through random formants, with pauses"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    y = np.zeros(n, dtype=np.float32)
+    position = 0
+    while position < n:
+        length = int(rng.uniform(0.08, 0.3) * sr)
+        if rng.random() < 0.15:
+            position += length
+            continue
+        t = np.arange(length) / sr
+        if rng.random() < 0.7:
+            f0 = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(1, 4) * t))
+            phase = 2 * np.pi * np.cumsum(f0) / sr
+            source = sum(np.sin(k * phase) / k for k in range(1, 30))
+        else:
+            source = rng.standard_normal(length)
+        for formant in rng.uniform([300, 900, 2000], [900, 2500, 3500]):
+            w = 2 * np.pi * formant / sr
+            source = lfilter([0.03], [1, -2 * 0.97 * np.cos(w), 0.97 ** 2], source)
+        syllable = np.sin(np.pi * np.arange(length) / length) ** 2 * source
+        end = min(n, position + length)
+        y[position:end] += 0.5 * rng.uniform(0.3, 1) * (syllable / (np.max(np.abs(syllable)) + 1e-9))[:end - position]
+        position = end
+    return y + 0.003 * rng.standard_normal(n).astype(np.float32)
+
+
+def insert_copies(y, sr, rng):
+    """Copy stretches of `y` elsewhere in it, in place; returns the (earlier, later, length) times"""
+    copies = []
+    taken = []
+    for length, gain in COPIES:
+        while True:
+            source, destination = rng.uniform(1, len(y) / sr - length - 1, 2)
+            spans = [(source, source + length), (destination, destination + length)]
+            if abs(source - destination) > length and not any(
+                    a < end + 1 and start < b + 1 for a, b in spans for start, end in taken):
+                break
+        taken += spans
+        first, target, n = int(source * sr), int(destination * sr), int(length * sr)
+        y[target:target + n] = gain * y[first:first + n]
+        copies.append((min(first, target) / sr, max(first, target) / sr, length))
+    return copies
+
+
+def exact_search_seconds(mfcc):
+    """Time of the exact O(frames^2) search: every descriptor against every other"""
+    from app.copy_move import frame_descriptors
+
+    descriptors = frame_descriptors(mfcc)
+    start = time.perf_counter()
+    squared = np.sum(descriptors ** 2, axis=1)
+    for first in range(0, len(descriptors), 2048):
+        block = descriptors[first:first + 2048]
+        distances = squared[first:first + 2048, None] + squared[None, :] - 2 * block @ descriptors.T
+        np.argmin(distances, axis=1)
+    return time.perf_counter() - start
+
+
+def main():
+    durations = [int(d) for d in sys.argv[1:]] or DEFAULT_DURATIONS
+    from app.audio_analysis import analyze_audio_file
+    from app.features import FeatureStore, HOP_LENGTH
+
+    work_dir = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+    failures = []
+    exact = None
+    print(f"{'duration (s)':>12} {'frames':>8} {'features (s)':>12} {'search (s)':>10} "
+          f"{'exact (s)':>10} {'found':>6} {'extra':>6}  checks")
+    for duration in durations:
+        path = os.path.join(work_dir, f"speech_{duration}s.wav")
+        y = speech_like(duration, SAMPLE_RATE, seed=duration)
+        truth = insert_copies(y, SAMPLE_RATE, rng)
+        sf.write(path, y, SAMPLE_RATE, subtype='PCM_16')
+        del y
+
+        result, _ = analyze_audio_file(path, include_plots=False, streaming=False,
+                                       detectors=['copy_move'])
+        reported = result["copy_move"]
+        found = [copy for copy in reported if any(
+            abs(copy["source"][0] - source) <= TOLERANCE
+            and abs(copy["destination"][0] - destination) <= TOLERANCE
+            and abs(copy["source"][1] - copy["source"][0] - length) <= 2 * TOLERANCE
+            for source, destination, length in truth)]
+
+        timings = result["timings"]
+        features_time = sum(timings.get(name, 0) for name in FEATURE_TIMINGS)
+        search = timings["copy_move"] - features_time
+        frames = duration * SAMPLE_RATE // HOP_LENGTH
+        if exact is None:
+            data, sr = sf.read(path, dtype='float32')
+            features = FeatureStore(data, sr)
+            exact = (exact_search_seconds(features.mfcc), duration)
+        estimate = exact[0] * (duration / exact[1]) ** 2
+
+        checks = {
+            "all found": len(found) == len(truth),
+            "no extra": len(reported) == len(found),
+            "search time": search <= MAX_SEARCH_SECONDS_PER_HOUR * max(duration, 60) / 3600,
+        }
+        failed = [check for check, ok in checks.items() if not ok]
+        failures += [f"{duration} s: {check}" for check in failed]
+        print(f"{duration:>12} {frames:>8} {features_time:>12.2f} {search:>10.2f} "
+              f"{estimate:>10.2f} {len(found):>6} {len(reported) - len(found):>6}  "
+              f"{'FAIL ' + ', '.join(failed) if failed else 'ok'}")
+        os.remove(path)
+
+    print(json.dumps({"failures": failures}) if failures else "all checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
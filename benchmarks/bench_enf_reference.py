@@ -0,0 +1,163 @@
+"""
+Check ENF reference matching against a synthetic grid frequency log.
+
+Generates months of a synthetic grid frequency log (slow drift, load
+fluctuations and measurement noise, one sample per second), imports it
+with import_enf_reference's raw binary path, and writes recordings whose
+mains hum follows the log from random start times: unedited, with a stretch
+of 10, 45 or 200 seconds cut out, and one made from a different grid. Each
+is analyzed with the `enf_reference` detector only:
+
+- unedited recordings must match within START_TOLERANCE seconds of their
+  true start time, without discontinuities,
+- cut recordings must show a discontinuity whose shift is the cut length
+  (within START_TOLERANCE) within SPLICE_TOLERANCE seconds of the cut,
+- the recording from another grid must not match,
+- searching the log must take less than MAX_SEARCH_SECONDS.
+
+Exits non-zero if any check fails.
+
+Usage:
+    python benchmarks/bench_enf_reference.py [days] [trials]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_DAYS = 90
+DEFAULT_TRIALS = 4
+LOG_START = 1_700_000_000  # Unix time of the first log sample
+NOMINAL = 50
+SAMPLE_RATE = 16000
+RECORDING_SECONDS = 600
+CUTS = (None, 10, 45, 200)  # seconds removed from the recording
+
+START_TOLERANCE = 2  # seconds
+SPLICE_TOLERANCE = 30  # seconds from the true cut
+MAX_SEARCH_SECONDS = 1.0
+
+
+def grid_frequency(n_seconds, seed):
+    """Synthetic grid frequency, one sample per second"""
+    rng = np.random.default_rng(seed)
+    slow = lfilter([1], [1, -0.9995], 0.0012 * rng.standard_normal(n_seconds))
+    fast = lfilter([1], [1, -0.97], 0.002 * rng.standard_normal(n_seconds))
+    return NOMINAL + slow + fast + 0.0005 * rng.standard_normal(n_seconds)
+
+
+def write_recording(path, frequency, start, cut=None, seed=0):
+    """
+    Write a recording whose hum follows `frequency` from second `start`.
+
+    Args:
+        cut: (time in the recording, seconds removed there), or None
+
+    Returns:
+        Time in the recording of the cut, or None
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(RECORDING_SECONDS * SAMPLE_RATE) / SAMPLE_RATE
+    log_time = start + t
+    at = None
+    if cut is not None:
+        at = float(rng.uniform(0.25, 0.75) * RECORDING_SECONDS)
+        log_time = np.where(t >= at, log_time + cut, log_time)
+    hum = np.interp(log_time, np.arange(len(frequency)), frequency)
+    phase = 2 * np.pi * np.cumsum(hum) / SAMPLE_RATE
+    y = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t)) + 0.02 * np.sin(phase)
+    sf.write(path, y.astype(np.float32), SAMPLE_RATE, subtype='PCM_16')
+    return at
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DAYS
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_TRIALS
+    work_dir = tempfile.mkdtemp()
+    os.environ['ENF_REFERENCE_DIR'] = os.path.join(work_dir, 'enf_reference')
+
+    from app import enf_reference
+    from app.audio_analysis import analyze_audio_file
+    from app.features import FeatureStore
+
+    frequency = grid_frequency(days * 86400, seed=0)
+    raw_path = os.path.join(work_dir, 'grid.f32')
+    frequency.astype('<f4').tofile(raw_path)
+    start = time.perf_counter()
+    log = enf_reference.import_logs(enf_reference.DATABASE.folder, 'grid', [raw_path],
+                                    start=LOG_START)
+    print(f"Imported {days} days in {time.perf_counter() - start:.1f} s: {log!r}, "
+          f"{os.path.getsize(os.path.join(enf_reference.DATABASE.folder, 'grid.npy')) / 2**20:.0f} MB")
+
+    rng = np.random.default_rng(1)
+    entries = []
+    for trial in range(trials):
+        for cut in CUTS:
+            offset = int(rng.integers(0, len(frequency) - 2 * RECORDING_SECONDS))
+            path = os.path.join(work_dir, f"trial{trial}_cut{cut or 0}.wav")
+            at = write_recording(path, frequency, offset, cut, seed=len(entries))
+            entries.append((path, offset, cut, at))
+    # Hum from another grid, which the log must not match
+    other = os.path.join(work_dir, 'other_grid.wav')
+    write_recording(other, grid_frequency(2 * RECORDING_SECONDS, seed=99), 0, seed=len(entries))
+    entries.append((other, None, None, None))
+
+    print(f"{'file':<20} {'search (s)':>10} {'stage (s)':>9} {'start error (s)':>15} "
+          f"{'discontinuities':>28}  checks")
+    failures = []
+    search_times = []
+    for path, offset, cut, at in entries:
+        name = os.path.basename(path)
+        result, _ = analyze_audio_file(path, include_plots=False, streaming=False,
+                                       detectors=['enf_reference'])
+        match = result["enf_match"]
+
+        # The search alone, on the trace the detector extracted
+        y, sr = sf.read(path, dtype='float32')
+        trace = FeatureStore(y, sr).at_rate(1000).fine_enf_trace(NOMINAL)
+        start = time.perf_counter()
+        enf_reference.match_trace({NOMINAL: trace})
+        search_times.append(time.perf_counter() - start)
+
+        start_error = None
+        if match["matched"] and offset is not None:
+            start_error = abs(enf_reference.parse_timestamp(match["start"]) - (LOG_START + offset))
+        found = [d for d in match["discontinuities"]
+                 if cut is not None and abs(d["shift"] - cut) <= START_TOLERANCE
+                 and abs(d["time"] - at) <= SPLICE_TOLERANCE]
+
+        if offset is None:
+            checks = {"no match": not match["matched"]}
+        else:
+            checks = {
+                "start": start_error is not None and start_error <= START_TOLERANCE,
+                "discontinuity": bool(found) if cut else not match["discontinuities"],
+            }
+        checks["search time"] = search_times[-1] < MAX_SEARCH_SECONDS
+        failed = [check for check, ok in checks.items() if not ok]
+        failures += [f"{name}: {check}" for check in failed]
+
+        jumps = ', '.join(f"{d['shift']:+d} s at {d['time']:.0f} s" for d in match["discontinuities"])
+        if cut:
+            jumps += f" (cut {cut} s at {at:.0f} s)"
+        print(f"{name:<20} {search_times[-1]:>10.3f} {result['timings']['enf_reference']:>9.3f} "
+              f"{'-' if start_error is None else f'{start_error:.0f}':>15} {jumps or '-':>28}  "
+              f"{'FAIL ' + ', '.join(failed) if failed else 'ok'}")
+
+    print()
+    print(f"Search over {days} days: median {np.median(search_times):.3f} s, "
+          f"max {max(search_times):.3f} s")
+    print(json.dumps({"failures": failures}) if failures else "all checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
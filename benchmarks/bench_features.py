@@ -0,0 +1,90 @@
+"""
+Benchmark the shared feature store against independent per-consumer transforms.
+
+Runs the spectral stages of the analysis (spectrogram plot, ENF analysis and
+spectral discontinuity analysis) on synthetic recordings of increasing length,
+once with each stage computing its own transforms ("before") and once with a
+single shared FeatureStore ("after"). Each run happens in a fresh process so
+the reported peak RSS is not polluted by earlier runs.
+
+Usage:
+    python benchmarks/bench_features.py [duration_seconds ...]
+"""
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing
+
+import numpy as np
+from scipy.io import wavfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_DURATIONS = [60, 300, 600]
+SAMPLE_RATE = 44100
+
+
+def create_long_audio(filename, duration, sample_rate=SAMPLE_RATE):
+    """Write a tone + noise + 50 Hz hum WAV file of the given duration"""
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    audio = (0.5 * np.sin(2 * np.pi * 440 * t)
+             + 0.05 * np.sin(2 * np.pi * 50 * t)
+             + 0.1 * np.random.normal(0, 1, len(t)))
+    audio = audio / np.max(np.abs(audio))
+    wavfile.write(filename, sample_rate, (audio * 32767).astype(np.int16))
+
+
+def run_stages(file_path, shared, queue):
+    """Run the spectral stages in this process and report time and peak RSS"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import librosa
+    from app.audio_analysis import (
+        create_spectrogram_plot, detect_enf_inconsistencies,
+        detect_spectral_discontinuities
+    )
+    from app.features import FeatureStore
+
+    y, sr = librosa.load(file_path, sr=None, mono=True)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    features = FeatureStore(y, sr) if shared else None
+    create_spectrogram_plot(y, sr, features=features)
+    detect_enf_inconsistencies(y, sr, features=features)
+    detect_spectral_discontinuities(y, sr, features=features)
+    elapsed = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, baseline_rss, peak_rss))
+
+
+def measure(file_path, shared):
+    """Run one configuration in a fresh process"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=run_stages, args=(file_path, shared, queue))
+    process.start()
+    elapsed, baseline_rss, peak_rss = queue.get()
+    process.join()
+    # ru_maxrss is reported in kilobytes on Linux
+    return elapsed, baseline_rss / 1024, peak_rss / 1024
+
+
+def main():
+    durations = [float(arg) for arg in sys.argv[1:]] or DEFAULT_DURATIONS
+
+    print(f"{'duration':>10} {'mode':>8} {'wall (s)':>10} {'load RSS (MB)':>14} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for duration in durations:
+            file_path = os.path.join(tmp_dir, f"bench_{int(duration)}s.wav")
+            create_long_audio(file_path, duration)
+            for mode, shared in (('before', False), ('after', True)):
+                elapsed, baseline_rss, peak_rss = measure(file_path, shared)
+                print(f"{duration:>9.0f}s {mode:>8} {elapsed:>10.2f} {baseline_rss:>14.1f} {peak_rss:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
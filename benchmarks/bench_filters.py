@@ -0,0 +1,61 @@
+"""
+Benchmark the SOS background noise filter against the former (b, a)
+`filtfilt` implementation.
+
+For each sample rate, filters one minute of synthetic float32 audio both
+ways and reports the wall time and the peak traced memory. The outputs
+are checked against each other in tests/test_filters.py.
+
+Usage:
+    python benchmarks/bench_filters.py [duration_seconds]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.audio_analysis import HIGHPASS_CUTOFF, HIGHPASS_ORDER, extract_background_noise
+
+SAMPLE_RATES = [16000, 22050, 44100, 48000, 96000]
+
+
+def legacy_background_noise(y, sr):
+    """The (b, a) filtfilt implementation the SOS filter replaced"""
+    b, a = signal.butter(HIGHPASS_ORDER, HIGHPASS_CUTOFF/(sr/2), 'highpass')
+    return signal.filtfilt(b, a, y)
+
+
+def measure(func, *args):
+    """Run `func` and return its result, wall time and peak traced MB"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rng = np.random.default_rng(0)
+
+    print(f"{'sr':>6} {'before s':>9} {'after s':>8} {'before MB':>10} {'after MB':>9}")
+    for sr in SAMPLE_RATES:
+        t = np.arange(int(sr * duration)) / sr
+        y = (0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+        _, before_time, before_peak = measure(legacy_background_noise, y, sr)
+        _, after_time, after_peak = measure(extract_background_noise, y, sr)
+        print(f"{sr:>6} {before_time:>9.3f} {after_time:>8.3f} {before_peak:>10.1f} {after_peak:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
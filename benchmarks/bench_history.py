@@ -0,0 +1,150 @@
+"""
+Time analysis history lookups on a large history.
+
+Fills a history database with synthetic analyses (a few thousand distinct
+files analyzed over and over), then times the queries behind the history
+page and API: the newest page, a page deep into the history, both again
+filtered by verdict, every analysis of one file and opening a permalink.
+Each query's plan is printed and must seek by rowid or an index without
+sorting, and each must stay under MAX_QUERY_SECONDS.
+
+Exits non-zero if any check fails.
+
+Usage:
+    python benchmarks/bench_history.py [rows]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.history import AnalysisHistory, LISTING_COLUMNS, _connect
+
+DEFAULT_ROWS = 1_000_000
+DISTINCT_FILES = 5000
+BATCH_ROWS = 100_000
+MAX_QUERY_SECONDS = 0.05
+REPEATS = 5
+
+
+def fill(db_path, rows):
+    """Insert `rows` synthetic analyses, with one stored result per file"""
+    rng = np.random.default_rng(0)
+    digests = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(DISTINCT_FILES)]
+    result = json.dumps({"duration": 60.0, "sample_rate": 44100, "details": ["..."] * 4})
+    scores = json.dumps({name: {"suspicious": False, "confidence": 0.0}
+                         for name in ("enf", "discontinuity", "noise_consistency")})
+    timings = json.dumps({"load": 0.1, "enf": 0.2, "discontinuity": 0.5})
+
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN')
+        conn.executemany("INSERT INTO results (key, result) VALUES (?, ?)",
+                         ((digest, result) for digest in digests))
+        now = time.time()
+        for start in range(0, rows, BATCH_ROWS):
+            n = min(BATCH_ROWS, rows - start)
+            files = rng.integers(0, DISTINCT_FILES, n)
+            verdicts = rng.random(n) < 0.1
+            conn.executemany(
+                "INSERT INTO analyses (token, created_at, sha256, filename, duration, sample_rate, "
+                "forgery_detected, confidence, detectors, scores, timings, result_key) "
+                "VALUES (?, ?, ?, ?, 60.0, 44100, ?, ?, '', ?, ?, ?)",
+                ((uuid.uuid4().hex, now - rows + start + i, digests[f], f"recording_{f}.wav",
+                  int(v), 70 if v else 0, scores, timings, digests[f])
+                 for i, (f, v) in enumerate(zip(files, verdicts))))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return digests
+
+
+def plan(db_path, page):
+    """Query plan of the listing query `AnalysisHistory.page` runs for `page`"""
+    conditions, params = [], []
+    if "sha256" in page:
+        conditions.append("sha256 = ?")
+        params.append(page["sha256"])
+    if "forgery_detected" in page:
+        conditions.append("forgery_detected = ?")
+        params.append(int(page["forgery_detected"]))
+    if "before" in page:
+        conditions.append("id < ?")
+        params.append(page["before"])
+    query = (f"EXPLAIN QUERY PLAN SELECT {', '.join(LISTING_COLUMNS)} FROM analyses "
+             f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} ORDER BY id DESC LIMIT 51")
+    conn = _connect(db_path)
+    try:
+        return '; '.join(row["detail"] for row in conn.execute(query, params))
+    finally:
+        conn.close()
+
+
+def timed(function):
+    """Best of REPEATS runs, in seconds, and the last return value"""
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    db_path = os.path.join(tempfile.mkdtemp(), 'history.sqlite')
+    history = AnalysisHistory(db_path)
+
+    start = time.perf_counter()
+    digests = fill(db_path, rows)
+    print(f"Inserted {rows} analyses in {time.perf_counter() - start:.1f} s, "
+          f"{os.path.getsize(db_path) / 2**20:.0f} MB")
+
+    deep = rows // 10
+    pages = {
+        "newest page": {},
+        "deep page": {"before": deep},
+        "newest forgeries": {"forgery_detected": True},
+        "deep forgeries": {"forgery_detected": True, "before": deep},
+        "one file": {"sha256": digests[0]},
+    }
+    failures = []
+    print(f"{'query':<18} {'ms':>7} {'rows':>5}  plan")
+    for name, page in pages.items():
+        seconds, result = timed(lambda: history.page(**page))
+        query_plan = plan(db_path, page)
+        checks = {
+            "time": seconds <= MAX_QUERY_SECONDS,
+            "rows": len(result["analyses"]) > 0,
+            # The unfiltered newest page walks the table backwards in rowid
+            # order and stops after a page; everything else must seek
+            "plan": not page or "INDEX" in query_plan or "INTEGER PRIMARY KEY" in query_plan,
+            "no sort": "TEMP B-TREE" not in query_plan,
+        }
+        failed = [check for check, ok in checks.items() if not ok]
+        failures += [f"{name}: {check}" for check in failed]
+        print(f"{name:<18} {seconds * 1000:>7.2f} {len(result['analyses']):>5}  {query_plan}"
+              f"{'  FAIL ' + ', '.join(failed) if failed else ''}")
+
+    token = history.page(before=deep, limit=1)["analyses"][0]["token"]
+    seconds, analysis = timed(lambda: history.get(token))
+    ok = seconds <= MAX_QUERY_SECONDS and analysis is not None
+    if not ok:
+        failures.append("permalink")
+    print(f"{'permalink':<18} {seconds * 1000:>7.2f} {1 if analysis else 0:>5}"
+          f"{'' if ok else '  FAIL'}")
+
+    print(json.dumps({"failures": failures}) if failures else "all checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Benchmark the memory-mapped WAV loader against `librosa.load`.
+
+Writes a large stereo 16-bit WAV file (1 GB by default) and loads it to
+mono float32 with each loader in a fresh process, reporting wall time and
+peak RSS. Both loaders must produce bit-identical samples; exits non-zero
+if they don't.
+
+Usage:
+    python benchmarks/bench_load.py [size_mb] [subtype]
+
+`subtype` is a libsndfile subtype such as PCM_16 (default), PCM_24 or FLOAT.
+"""
+import os
+import sys
+import time
+import hashlib
+import resource
+import tempfile
+import multiprocessing
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+BYTES_PER_SAMPLE = {'PCM_16': 2, 'PCM_24': 3, 'PCM_32': 4, 'FLOAT': 4}
+
+# Frames generated per write, to keep the writer's own memory small
+WRITE_BLOCK_FRAMES = 1 << 20
+
+
+def write_large_file(path, size_mb, subtype):
+    """Write about `size_mb` MB of tone + noise, block by block"""
+    frames = size_mb * 1024 * 1024 // (CHANNELS * BYTES_PER_SAMPLE[subtype])
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, 'w', SAMPLE_RATE, CHANNELS, subtype=subtype) as f:
+        for start in range(0, frames, WRITE_BLOCK_FRAMES):
+            t = np.arange(start, min(start + WRITE_BLOCK_FRAMES, frames)) / SAMPLE_RATE
+            tone = 0.3 * np.sin(2 * np.pi * 440 * t)
+            noise = 0.05 * rng.standard_normal((len(t), CHANNELS))
+            f.write(tone[:, None] + noise)
+    return frames
+
+
+def run_loader(loader, file_path, queue):
+    """Load the file in this process and report time, peak RSS and a digest"""
+    if loader == 'librosa':
+        import librosa
+        load = lambda: librosa.load(file_path, sr=None, mono=True)
+    else:
+        from app.wavio import load_audio
+        load = lambda: load_audio(file_path, mono=True)
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    y, _ = load()
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    digest = hashlib.sha256(np.ascontiguousarray(y).data).hexdigest()
+    queue.put((elapsed, baseline_rss, peak_rss, y.nbytes, digest))
+
+
+def measure(loader, file_path):
+    """Run one loader in a fresh process"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=run_loader, args=(loader, file_path, queue))
+    process.start()
+    elapsed, baseline_rss, peak_rss, nbytes, digest = queue.get()
+    process.join()
+    # ru_maxrss is reported in kilobytes on Linux
+    return elapsed, (peak_rss - baseline_rss) / 1024, nbytes / (1024 * 1024), digest
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    subtype = sys.argv[2] if len(sys.argv) > 2 else 'PCM_16'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'large.wav')
+        frames = write_large_file(file_path, size_mb, subtype)
+        print(f"{os.path.getsize(file_path) / (1024 * 1024):.0f} MB {subtype}, "
+              f"{CHANNELS} channels, {frames / SAMPLE_RATE / 60:.1f} min")
+
+        print(f"{'loader':>8} {'wall (s)':>9} {'RSS growth (MB)':>16} {'output (MB)':>12}")
+        digests = {}
+        for loader in ('librosa', 'mmap'):
+            elapsed, rss, output_mb, digests[loader] = measure(loader, file_path)
+            print(f"{loader:>8} {elapsed:>9.2f} {rss:>16.0f} {output_mb:>12.0f}")
+
+    identical = digests['librosa'] == digests['mmap']
+    print('samples identical' if identical else 'samples DIFFER')
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
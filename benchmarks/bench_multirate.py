@@ -0,0 +1,88 @@
+"""
+Time multirate analysis against the native-rate analysis.
+
+Generates synthetic recordings with benchmarks/corpus.py (with and without
+mains hum and a splice halfway through) at several sample rates, analyzes
+each one with MULTIRATE_ANALYSIS=0 (every detector at the native rate) and
+MULTIRATE_ANALYSIS=1 (ENF at 1 kHz, MFCCs at 16 kHz), each mode in a fresh
+process, and reports the time of the ENF and spectral discontinuity
+stages. tests/test_multirate.py checks that both modes agree.
+
+Usage:
+    python benchmarks/bench_multirate.py [duration_seconds] [corpus_dir]
+"""
+import os
+import sys
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import write_recording
+
+SAMPLE_RATES = (16000, 44100, 48000, 96000)
+VARIANTS = ("clean", "spliced", "enf", "enf_spliced")
+DEFAULT_DURATION = 60
+
+# Stages of the ENF and spectral discontinuity paths, including the
+# decimation and the shared features they compute
+STAGES = ("enf", "discontinuity")
+
+
+def analyze_all(paths, multirate, queue):
+    """Analyze every file in this process, with one analysis thread"""
+    os.environ['MULTIRATE_ANALYSIS'] = '1' if multirate else '0'
+    from app.audio_analysis import analyze_audio_file
+
+    results = {}
+    for path in paths:
+        # Best of two runs, so one-off JIT compilation doesn't count
+        runs = [analyze_audio_file(path, include_plots=False, streaming=False, workers=1)[0]
+                for _ in range(2)]
+        results[path] = min(sum(result["timings"][stage] for stage in STAGES) for result in runs)
+    queue.put(results)
+
+
+def run_mode(paths, multirate):
+    """Run `analyze_all` in a fresh process"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=analyze_all, args=(paths, multirate, queue))
+    process.start()
+    results = queue.get()
+    process.join()
+    return results
+
+
+def main():
+    duration = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION
+    corpus_dir = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    paths = []
+    for i, (sr, variant) in enumerate((sr, v) for sr in SAMPLE_RATES for v in VARIANTS):
+        path = os.path.join(corpus_dir, f"{variant}_{duration}s_{sr}hz.wav")
+        write_recording(path, duration, sr, variant=variant, seed=i)
+        paths.append((path, sr))
+
+    native = run_mode([path for path, _ in paths], multirate=False)
+    multirate = run_mode([path for path, _ in paths], multirate=True)
+
+    print(f"{'file':<28} {'native (s)':>10} {'multirate (s)':>13} {'speedup':>8}")
+    speedups = {}
+    for path, sr in paths:
+        speedup = native[path] / multirate[path]
+        speedups.setdefault(sr, []).append(speedup)
+        print(f"{os.path.basename(path):<28} {native[path]:>10.3f} {multirate[path]:>13.3f} {speedup:>7.1f}x")
+
+    print()
+    for sr, values in speedups.items():
+        print(f"{sr} Hz: ENF + discontinuity {np.mean(values):.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark the Agg plot renderer against the previous pyplot-based plots.
+
+Renders the five result plots of one synthetic recording (5 minutes by
+default) with both implementations, using the same precomputed features so
+only rendering is timed.
+
+Usage:
+    python benchmarks/bench_render.py [duration_seconds]
+"""
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import librosa
+import librosa.display
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import rendering
+from app.audio_analysis import extract_background_noise
+from app.features import FeatureStore, N_FFT, HOP_LENGTH
+
+SAMPLE_RATE = 44100
+REPEATS = 3
+
+
+def _pyplot_png():
+    """Finish a pyplot figure the way the previous plot helpers did"""
+    plt.tight_layout()
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='png')
+    plt.close()
+    return buffer.getvalue()
+
+
+def pyplot_waveform(y, sr, title):
+    plt.figure(figsize=(10, 4))
+    librosa.display.waveshow(y, sr=sr)
+    plt.title(title)
+    return _pyplot_png()
+
+
+def pyplot_spectrogram(spectrogram_db, sr):
+    plt.figure(figsize=(10, 4))
+    librosa.display.specshow(spectrogram_db, sr=sr, x_axis='time', y_axis='log')
+    plt.colorbar(format='%+2.0f dB')
+    plt.title('Spectrogram')
+    return _pyplot_png()
+
+
+def pyplot_trace(x, values, threshold, markers, title, xlabel, ylabel):
+    plt.figure(figsize=(10, 4))
+    plt.plot(x, values)
+    plt.axhline(y=threshold, color='r', linestyle='--', label='Threshold')
+    for marker in markers:
+        plt.axvline(x=marker, color='g', alpha=0.5)
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.legend()
+    return _pyplot_png()
+
+
+def prepare(duration):
+    """Synthesize a recording and compute everything the plots need"""
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    y = (0.5 * np.sin(2 * np.pi * 440 * t)
+         + 0.1 * np.random.normal(0, 1, len(t))).astype(np.float32)
+    features = FeatureStore(y, SAMPLE_RATE)
+    noise = extract_background_noise(y, SAMPLE_RATE)
+
+    delta = np.linalg.norm(np.diff(features.mfcc, axis=1), axis=0)
+    delta_threshold = np.mean(delta) + 2 * np.std(delta)
+    splices = np.where(delta > delta_threshold)[0]
+
+    segment = SAMPLE_RATE
+    levels = np.array([np.sqrt(np.mean(noise[i:i + segment] ** 2))
+                       for i in range(0, len(noise) - segment, segment // 2)])
+    times = np.arange(len(levels)) * 0.5
+    level_threshold = np.mean(levels) + 2 * np.std(levels)
+    outliers = times[levels > level_threshold]
+
+    return {
+        "y": y, "noise": noise, "spectrogram_db": features.spectrogram_db,
+        "delta": (np.arange(len(delta)), delta, delta_threshold, splices),
+        "levels": (times, levels, level_threshold, outliers),
+    }
+
+
+def render_pyplot(data):
+    pyplot_waveform(data["y"], SAMPLE_RATE, "Audio Waveform")
+    pyplot_spectrogram(data["spectrogram_db"], SAMPLE_RATE)
+    pyplot_waveform(data["noise"], SAMPLE_RATE, "Background Noise")
+    pyplot_trace(*data["delta"], 'Spectral Discontinuity Analysis', 'Frame', 'MFCC Delta Norm')
+    pyplot_trace(*data["levels"], 'Background Noise Consistency Analysis', 'Time (s)', 'Noise Level (RMS)')
+
+
+def render_agg(data):
+    rendering.render_waveform(data["y"], SAMPLE_RATE, "Audio Waveform")
+    rendering.render_spectrogram(data["spectrogram_db"], SAMPLE_RATE, N_FFT, HOP_LENGTH)
+    rendering.render_waveform(data["noise"], SAMPLE_RATE, "Background Noise")
+    rendering.render_trace(*data["delta"], 'Spectral Discontinuity Analysis', 'Frame', 'MFCC Delta Norm')
+    rendering.render_trace(*data["levels"], 'Background Noise Consistency Analysis', 'Time (s)', 'Noise Level (RMS)')
+
+
+def best_of(render, data):
+    """Best wall time of REPEATS runs, after one warm-up run"""
+    render(data)
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        render(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 300
+    data = prepare(duration)
+
+    before = best_of(render_pyplot, data)
+    after = best_of(render_agg, data)
+    print(f"{duration:.0f} s recording, 5 plots per request")
+    print(f"  pyplot renderer: {before:.2f} s")
+    print(f"  Agg renderer:    {after:.2f} s")
+    print(f"  speedup:         {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
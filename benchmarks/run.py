@@ -0,0 +1,239 @@
+"""
+Benchmark the analysis pipeline stage by stage over a synthetic corpus.
+
+Generates (or reuses) a corpus with benchmarks/corpus.py, times every
+pipeline stage on each recording, measures its peak traced memory with
+tracemalloc, and writes a JSON report. Reports from two versions can be
+diffed to catch regressions.
+
+Usage:
+    python benchmarks/run.py [--preset quick] [--output report.json]
+    python benchmarks/run.py --compare BASE.json NEW.json [--tolerance 0.2]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import PRESETS, generate_corpus
+
+DEFAULT_CORPUS_DIR = os.path.join(ROOT, 'instance', 'benchmark_corpus')
+
+
+def _stages(path, in_memory):
+    """
+    Build the list of (name, callable) stages for one file.
+
+    Stages share state through a dictionary so each one measures only its
+    own work (e.g. `mfcc` reuses the STFT computed by `stft`). The `load`
+    stage uses the production loader, `wavio.load_audio`.
+    """
+    from app.wavio import load_audio
+    from app.audio_analysis import (
+        MFCC_SAMPLE_RATE, ENF_SAMPLE_RATE, analyze_audio_file, extract_background_noise,
+        detector_features, detect_enf_inconsistencies, detect_spectral_discontinuities,
+        detect_copy_move, analyze_noise_consistency
+    )
+    from app.features import FeatureStore
+
+    state = {}
+
+    def load():
+        state["y"], state["sr"] = load_audio(path, mono=True)
+        state["features"] = FeatureStore(state["y"], state["sr"])
+
+    stages = []
+    if in_memory:
+        stages = [
+            ("load", load),
+            ("noise", lambda: state.__setitem__(
+                "noise", extract_background_noise(state["y"], state["sr"]))),
+            ("stft", lambda: state["features"].stft_magnitude),
+            # Both decimation stages of multirate analysis
+            ("resample", lambda: detector_features(state["features"], ENF_SAMPLE_RATE)),
+            ("mfcc", lambda: detector_features(state["features"], MFCC_SAMPLE_RATE).mfcc),
+            ("enf", lambda: detect_enf_inconsistencies(
+                state["y"], state["sr"], features=state["features"])),
+            ("discontinuity", lambda: detect_spectral_discontinuities(
+                state["y"], state["sr"], features=state["features"], include_plot=False)),
+            ("copy_move", lambda: detect_copy_move(
+                state["y"], state["sr"], features=state["features"])),
+            ("noise_consistency", lambda: analyze_noise_consistency(
+                state["noise"], state["sr"], include_plot=False)),
+        ]
+    stages.append(("analyze", lambda: analyze_audio_file(path, include_plots=False)))
+    return stages
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def benchmark_file(entry, repeat):
+    """Time and memory-profile every stage for one corpus entry"""
+    from app.audio_analysis import STREAMING_THRESHOLD_BYTES
+
+    path = entry["path"]
+    in_memory = os.path.getsize(path) <= STREAMING_THRESHOLD_BYTES
+
+    timings = {}
+    for _ in range(repeat):
+        for name, stage in _stages(path, in_memory):
+            start = time.perf_counter()
+            value = stage()
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+            if name == "analyze" and not in_memory:
+                # The streaming pass interleaves its stages block by block and
+                # can't be split into callables; use its own stage timings
+                for stage_name, seconds in value[0].get("timings", {}).items():
+                    timings.setdefault(stage_name, []).append(seconds)
+
+    # Separate pass for memory, so tracemalloc overhead doesn't skew timings
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for name, stage in _stages(path, in_memory):
+            tracemalloc.reset_peak()
+            stage()
+            peaks[name] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+    stages = {
+        name: {
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "mean": float(np.mean(values)),
+            "peak_mb": peaks.get(name),
+        }
+        for name, values in timings.items()
+    }
+    analyze_p50 = stages["analyze"]["p50"]
+    return {
+        "file": os.path.basename(path),
+        **{key: entry[key] for key in ("duration", "sample_rate", "channels", "variant")},
+        "mode": "in_memory" if in_memory else "streaming",
+        "stages": stages,
+        # Seconds of audio analyzed per second of wall time
+        "throughput": entry["duration"] / analyze_p50 if analyze_p50 else None,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(preset, corpus_dir, repeat):
+    """Run the benchmark over a corpus preset and return the report"""
+    import scipy
+    import librosa
+    from app.audio_analysis import analyzer_fingerprint
+
+    manifest = generate_corpus(corpus_dir, preset)
+    results = []
+    for entry in manifest:
+        print(f"benchmarking {os.path.basename(entry['path'])}", file=sys.stderr)
+        results.append(benchmark_file(entry, repeat))
+
+    return {
+        "meta": {
+            "preset": preset,
+            "repeat": repeat,
+            "git_revision": _git_revision(),
+            "analyzer": analyzer_fingerprint(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "librosa": librosa.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        "results": results,
+    }
+
+
+def compare_reports(base, new, tolerance):
+    """
+    Print per-stage changes between two reports.
+
+    Returns:
+        List of (file, stage, metric, relative change) regressions beyond
+        `tolerance`
+    """
+    base_results = {r["file"]: r for r in base["results"]}
+    regressions = []
+    print(f"{'file':<40} {'stage':<18} {'p50 base':>9} {'p50 new':>9} {'change':>8} {'peak MB':>15}")
+    for result in new["results"]:
+        previous = base_results.get(result["file"])
+        if previous is None:
+            continue
+        for stage, stats in result["stages"].items():
+            old = previous["stages"].get(stage)
+            if old is None or not old["p50"]:
+                continue
+            change = stats["p50"] / old["p50"] - 1
+            memory = ''
+            if old["peak_mb"] is not None and stats["peak_mb"] is not None:
+                memory = f"{old['peak_mb']:.1f}->{stats['peak_mb']:.1f}"
+            flag = ''
+            if change > tolerance:
+                regressions.append((result["file"], stage, "p50", change))
+                flag = ' !'
+            if old["peak_mb"] and stats["peak_mb"] and stats["peak_mb"] / old["peak_mb"] - 1 > tolerance:
+                regressions.append((result["file"], stage, "peak_mb",
+                                    stats["peak_mb"] / old["peak_mb"] - 1))
+                flag = ' !'
+            print(f"{result['file']:<40} {stage:<18} {old['p50']:>9.3f} {stats['p50']:>9.3f} "
+                  f"{change:>+8.1%} {memory:>15}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--corpus-dir', default=DEFAULT_CORPUS_DIR)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write the JSON report to this file (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='Diff two reports instead of running the benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare_reports(base, new, args.tolerance)
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        return 1 if regressions else 0
+
+    report = run_benchmark(args.preset, args.corpus_dir, args.repeat)
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
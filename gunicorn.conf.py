@@ -1,4 +1,7 @@
 # Gunicorn configuration file
+import os
+
+from app import startup, metrics
 
 # Number of worker processes
 workers = 4
@@ -14,3 +17,36 @@ timeout = 60
 
 # Log level
 loglevel = 'info'
+
+# Load the app in the master so workers fork with the analysis stack already
+# imported and warmed up; PRELOAD_APP=0 loads it in every worker instead
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+
+def when_ready(server):
+    # Called in the master once the app is loaded, before workers are forked
+    if not preload_app:
+        return
+    if startup.WARM_UP:
+        startup.warm_up()
+    seconds, warm_up_seconds = startup.ready('master')
+    server.log.info("App preloaded in %.2f s (warm-up %.2f s)", seconds, warm_up_seconds)
+
+
+def post_fork(server, worker):
+    startup.mark_start()
+
+
+def post_worker_init(worker):
+    # Called in each worker after it loads the app, before it accepts requests
+    if startup.WARM_UP:
+        startup.warm_up()
+    seconds, warm_up_seconds = startup.ready('worker')
+    worker.log.info("Worker %s ready in %.2f s (warm-up %.2f s)",
+                    worker.pid, seconds, warm_up_seconds)
+
+
+def child_exit(server, worker):
+    # Called in the master after a worker exits, e.g. when it is recycled;
+    # its metric values move into the aggregate of exited processes
+    metrics.mark_process_dead(worker.pid)
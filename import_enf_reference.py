@@ -0,0 +1,59 @@
+"""
+Import grid frequency logs as an ENF reference log.
+
+Reads logs of the mains frequency, one sample per second (CSV/text files
+with a timestamp and a frequency per line, .npy arrays or raw binary
+samples), and stores them as one compact memory-mapped reference log that
+the analysis matches recordings against to find when they were made.
+Importing under an existing name replaces that log.
+
+Usage:
+    python import_enf_reference.py uk_grid logs/2024-*.csv
+    python import_enf_reference.py us_east samples.f32 --start 2024-03-01T00:00:00Z --nominal 60
+"""
+import os
+import sys
+import time
+import argparse
+
+from app import enf_reference
+
+DEFAULT_FOLDER = os.environ.get('ENF_REFERENCE_DIR',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             'instance', 'enf_reference'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('name', help='Name of the reference log, e.g. the grid it was recorded on')
+    parser.add_argument('paths', nargs='+', help='Log files, in time order')
+    parser.add_argument('--output', default=DEFAULT_FOLDER,
+                        help='Reference log folder (default: ENF_REFERENCE_DIR or '
+                             'instance/enf_reference)')
+    parser.add_argument('--nominal', type=int, choices=enf_reference.NOMINAL_FREQUENCIES,
+                        help='Grid frequency in Hz (guessed from the samples by default)')
+    parser.add_argument('--start', type=enf_reference.parse_timestamp,
+                        help='Time of the first sample (ISO 8601, UTC if no zone, or Unix '
+                             'seconds), for logs without timestamps')
+    parser.add_argument('--period', type=float, default=enf_reference.REFERENCE_PERIOD,
+                        help='Seconds between samples, for logs without timestamps')
+    parser.add_argument('--dtype', default='float32',
+                        help='Sample type of raw binary logs (default: float32)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        log = enf_reference.import_logs(args.output, args.name, args.paths, nominal=args.nominal,
+                                        start=args.start, period=args.period, dtype=args.dtype)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+
+    covered = int(log.deviations()[1].sum())
+    print(f"Imported {log!r}: {covered}/{len(log)} seconds covered "
+          f"({time.perf_counter() - start:.1f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import json
+
+import numpy as np
+from scipy.signal import lfilter
+
+from app import enf_reference
+
+NOMINAL = 50
+LOG_SECONDS = 6 * 3600
+TRACE_SECONDS = 600
+
+
+def grid_frequency(n_seconds, seed):
+    """Synthetic grid frequency, one sample per second"""
+    rng = np.random.default_rng(seed)
+    slow = lfilter([1], [1, -0.9995], 0.0012 * rng.standard_normal(n_seconds))
+    fast = lfilter([1], [1, -0.97], 0.002 * rng.standard_normal(n_seconds))
+    return NOMINAL + slow + fast + 0.0005 * rng.standard_normal(n_seconds)
+
+
+def test_match_across_log_gap_is_valid_json(tmp_path):
+    frequency = grid_frequency(LOG_SECONDS, seed=0)
+    offset = 3600
+    # A gap in the log, too long to be interpolated, inside the matched stretch
+    log_frequency = frequency.copy()
+    log_frequency[offset + 200:offset + 240] = np.nan
+    log = enf_reference.write_reference(str(tmp_path), 'grid', 1_700_000_000, log_frequency)
+
+    rng = np.random.default_rng(1)
+    trace_frequency = frequency[offset:offset + TRACE_SECONDS] + 0.0005 * rng.standard_normal(TRACE_SECONDS)
+    trace_frequency[400] = np.nan  # a window without an ENF estimate
+    trace = {
+        "times": np.arange(TRACE_SECONDS) + 0.5,
+        "frequency": trace_frequency,
+        "salience": np.ones(TRACE_SECONDS),
+    }
+
+    match = enf_reference.match_trace({NOMINAL: trace}, [log])
+
+    assert match["matched"]
+    assert abs(enf_reference.parse_timestamp(match["start"]) - (1_700_000_000 + offset)) <= 1
+    mismatch = match["trace"]["mismatch"]
+    assert all(value is None for value in mismatch[200:240])
+    assert mismatch[400] is None
+    json.dumps(match, allow_nan=False)
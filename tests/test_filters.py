@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from app.audio_analysis import HIGHPASS_CUTOFF, HIGHPASS_ORDER, extract_background_noise
+from app.filters import butter_highpass, CausalFilter
+
+SAMPLE_RATES = [16000, 22050, 44100, 48000, 96000]
+
+# float32 filtering may differ from the float64 reference by rounding only
+MAX_RELATIVE_ERROR = 1e-5
+
+
+def tone_and_noise(sr, duration=5):
+    t = np.arange(int(sr * duration)) / sr
+    rng = np.random.default_rng(0)
+    return (0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.mark.parametrize('sr', SAMPLE_RATES)
+def test_background_noise_matches_former_filtfilt(sr):
+    y = tone_and_noise(sr)
+    # The (b, a) filtfilt implementation the SOS filter replaced
+    b, a = signal.butter(HIGHPASS_ORDER, HIGHPASS_CUTOFF/(sr/2), 'highpass')
+    reference = signal.filtfilt(b, a, y)
+
+    noise = extract_background_noise(y, sr)
+    assert noise.dtype == np.float32
+    error = np.max(np.abs(noise - reference)) / np.sqrt(np.mean(reference ** 2))
+    assert error <= MAX_RELATIVE_ERROR
+
+
+@pytest.mark.parametrize('sr', SAMPLE_RATES)
+def test_causal_filter_blocks_match_single_pass(sr):
+    y = tone_and_noise(sr)
+    sos = butter_highpass(sr, HIGHPASS_CUTOFF, HIGHPASS_ORDER)
+    streamed = CausalFilter(sos)
+    blocks = np.concatenate([streamed.push(y[i:i + 10007]) for i in range(0, len(y), 10007)])
+    assert np.array_equal(blocks, CausalFilter(sos).push(y))
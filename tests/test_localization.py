@@ -0,0 +1,50 @@
+import tracemalloc
+
+import numpy as np
+from scipy.io import wavfile
+
+from app.audio_analysis import analyze_audio_file, analyze_noise_consistency
+
+SAMPLE_RATE = 44100
+DURATION = 5
+
+
+def write_clip(path, seed, splice=None):
+    """
+    Tone over background noise, as create_test_audio.py writes it; from
+    `splice` seconds on the noise is twice as loud
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(DURATION * SAMPLE_RATE) / SAMPLE_RATE
+    noise = 0.1 * rng.standard_normal(len(t))
+    if splice is not None:
+        noise[int(splice * SAMPLE_RATE):] *= 2
+    audio = 0.5 * np.sin(2 * np.pi * 440 * t) + noise
+    wavfile.write(path, SAMPLE_RATE, (audio / np.max(np.abs(audio)) * 32767).astype(np.int16))
+    return str(path)
+
+
+def test_splice_in_short_clip_is_localized(tmp_path):
+    result, _ = analyze_audio_file(write_clip(tmp_path / 'tampered.wav', seed=0, splice=2.5),
+                                   include_plots=False)
+    assert result["splices"]
+    assert abs(result["splices"][0]["time"] - 2.5) <= 0.25
+    assert "noise_level" in result["splices"][0]["cues"]
+
+
+def test_short_clean_clip_has_no_splices(tmp_path):
+    result, _ = analyze_audio_file(write_clip(tmp_path / 'clean.wav', seed=0), include_plots=False)
+    assert result["splices"] == []
+
+
+def test_long_recording_noise_levels_stay_in_blocks():
+    # A per-sample running sum of two minutes of audio would take 42 MB
+    noise = 0.1 * np.random.default_rng(0).standard_normal(120 * SAMPLE_RATE).astype(np.float32)
+    tracemalloc.start()
+    try:
+        result = analyze_noise_consistency(noise, SAMPLE_RATE, include_plot=False)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert "short" not in result["trace"]
+    assert peak < 4 * 1024 ** 2
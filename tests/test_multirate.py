@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app import audio_analysis
+
+DURATION = 30
+SPLICE = DURATION / 2
+
+# Largest allowed differences between native-rate and multirate analysis
+ENF_POWER_TOLERANCE = 0.05  # relative, median over the windows
+ENF_SCORE_TOLERANCE = 0.05  # absolute, or relative for scores above 1; the detector flags scores above 0.5
+SPLICE_TOLERANCE = 0.5  # seconds from the true splice time
+
+
+def write_recording(path, sr, spliced, seed=0):
+    """
+    Tone, background noise and a mains hum drifting around 50 Hz, as
+    benchmarks/corpus.py writes them; when `spliced`, the second half has
+    louder noise and a phase-shifted hum
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(DURATION * sr) / sr
+    after = t >= SPLICE if spliced else np.zeros(len(t), dtype=bool)
+    noise = np.where(after, 0.12, 0.05) * rng.standard_normal(len(t))
+    phase = 2 * np.pi * np.cumsum(50 + 0.05 * np.sin(2 * np.pi * t / 60)) / sr + np.where(after, np.pi / 2, 0)
+    audio = 0.3 * np.sin(2 * np.pi * 440 * t) + noise + 0.02 * np.sin(phase)
+    sf.write(path, np.clip(audio, -1, 1).astype(np.float32), sr, subtype='PCM_16')
+    return str(path)
+
+
+def analyze(path, multirate, monkeypatch):
+    monkeypatch.setattr(audio_analysis, 'MULTIRATE_ANALYSIS', multirate)
+    result, _ = audio_analysis.analyze_audio_file(path, include_plots=False, streaming=False, workers=1)
+    return result
+
+
+def enf_score(power):
+    """Variance of the ENF band power relative to its mean, as `enf_result` scores it"""
+    return float(np.nanvar(power) / np.nanmean(power))
+
+
+def localized(result):
+    return any(abs(splice["time"] - SPLICE) <= SPLICE_TOLERANCE for splice in result["splices"])
+
+
+@pytest.mark.parametrize('spliced', [False, True])
+@pytest.mark.parametrize('sr', [44100, 96000])
+def test_multirate_matches_native_rate(tmp_path, monkeypatch, sr, spliced):
+    path = write_recording(tmp_path / 'recording.wav', sr, spliced)
+    native = analyze(path, False, monkeypatch)
+    multirate = analyze(path, True, monkeypatch)
+
+    assert multirate["forgery_detected"] == native["forgery_detected"]
+
+    power_a = np.asarray(native["enf_trace"]["power"])
+    power_b = np.asarray(multirate["enf_trace"]["power"])
+    n = min(len(power_a), len(power_b))
+    assert np.nanmedian(np.abs(power_b[:n] - power_a[:n]) / power_a[:n]) <= ENF_POWER_TOLERANCE
+    assert enf_score(power_b) == pytest.approx(enf_score(power_a), rel=ENF_SCORE_TOLERANCE, abs=ENF_SCORE_TOLERANCE)
+
+    # Wherever the native-rate MFCCs and ENF find the splice, the decimated ones must too
+    if spliced and localized(native):
+        assert localized(multirate)
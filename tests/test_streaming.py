@@ -0,0 +1,37 @@
+import pytest
+
+from app.audio_analysis import analyze_audio_file
+from app.streaming import analyze_audio_stream
+
+from test_localization import write_clip
+from test_multirate import write_recording
+
+
+def assert_same_splices(streamed, loaded):
+    assert [(s["time"], s["cues"]) for s in streamed] == [(s["time"], s["cues"]) for s in loaded]
+    # The block-wise filters round differently from the whole-file ones
+    assert [s["score"] for s in streamed] == pytest.approx([s["score"] for s in loaded], rel=1e-3)
+
+
+def test_stream_localizes_splice_in_short_clip_like_file(tmp_path):
+    path = write_clip(tmp_path / 'tampered.wav', seed=0, splice=2.5)
+    streamed, _ = analyze_audio_stream(path, include_plots=False, block_seconds=1)
+    loaded, _ = analyze_audio_file(path, include_plots=False)
+    assert streamed["splices"]
+    assert_same_splices(streamed["splices"], loaded["splices"])
+
+
+@pytest.mark.parametrize('spliced', [False, True])
+def test_stream_matches_file_across_blocks(tmp_path, spliced):
+    # 30 s with mains hum, read in 4 s blocks that don't line up with any frame
+    path = write_recording(tmp_path / 'recording.wav', 44100, spliced)
+    streamed, _ = analyze_audio_stream(path, include_plots=False, block_seconds=4)
+    loaded, _ = analyze_audio_file(path, include_plots=False, streaming=False)
+
+    assert streamed["detectors"] == loaded["detectors"]
+    assert streamed["forgery_detected"] == loaded["forgery_detected"]
+    assert streamed["confidence"] == pytest.approx(loaded["confidence"], rel=1e-3)
+    for name, score in loaded["scores"].items():
+        assert streamed["scores"][name]["suspicious"] == score["suspicious"]
+        assert streamed["scores"][name]["confidence"] == pytest.approx(score["confidence"], rel=1e-3)
+    assert_same_splices(streamed["splices"], loaded["splices"])
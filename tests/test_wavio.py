@@ -0,0 +1,42 @@
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.wavio import InvalidAudioError, WavReader, load_audio
+
+SAMPLE_RATE = 22050
+
+
+def write_wav(path, channels, subtype, seed=0):
+    """Half a second of noise, an odd number of frames long"""
+    rng = np.random.default_rng(seed)
+    audio = np.clip(0.3 * rng.standard_normal((SAMPLE_RATE // 2 + 1, channels)), -1, 1)
+    sf.write(path, audio, SAMPLE_RATE, subtype=subtype)
+    return str(path)
+
+
+@pytest.mark.parametrize('mono', [True, False])
+@pytest.mark.parametrize('channels', [1, 2, 3])
+@pytest.mark.parametrize('subtype', ['PCM_16', 'PCM_24', 'PCM_32', 'FLOAT'])
+def test_mapped_wav_matches_librosa(tmp_path, subtype, channels, mono):
+    path = write_wav(tmp_path / 'audio.wav', channels, subtype)
+    # The file must take the memory-mapped path
+    WavReader(path).close()
+
+    y, sr = load_audio(path, mono=mono)
+    expected, expected_sr = librosa.load(path, sr=None, mono=mono)
+    assert sr == expected_sr
+    assert y.dtype == expected.dtype
+    assert np.array_equal(y, expected)
+
+
+def test_unsupported_encoding_falls_back_to_librosa(tmp_path):
+    path = write_wav(tmp_path / 'audio.wav', 1, 'ULAW')
+    with pytest.raises(InvalidAudioError):
+        WavReader(path)
+
+    y, sr = load_audio(path)
+    expected, expected_sr = librosa.load(path, sr=None)
+    assert sr == expected_sr
+    assert np.array_equal(y, expected)